@@ -0,0 +1,39 @@
+from django.db import connections
+
+
+# ====================================== Conexões com o banco =======================================
+# Estatísticas do pool do psycopg (DB_POOL=True) deste processo, para dimensionar DB_POOL_MAX_SIZE:
+# fila de espera frequente ou tempo de espera alto indicam pool pequeno demais.
+
+def estatisticas_banco(alias='default'):
+    """
+    Situação das conexões do banco `alias` neste processo.
+    Sem pool, informa apenas o CONN_MAX_AGE em uso.
+    """
+    conexao = connections[alias]
+    pool = getattr(conexao, 'pool', None) # só o backend do PostgreSQL tem pool
+    if pool is None:
+        return {
+            'pool': False,
+            'vendor': conexao.vendor,
+            'conn_max_age': conexao.settings_dict.get('CONN_MAX_AGE', 0),
+        }
+
+    dados = pool.get_stats()
+    requisicoes = dados.get('requests_num', 0)
+    return {
+        'pool': True,
+        'vendor': conexao.vendor,
+        'minimo': dados.get('pool_min', 0),
+        'maximo': dados.get('pool_max', 0),
+        'abertas': dados.get('pool_size', 0),
+        'livres': dados.get('pool_available', 0),
+        'em_uso': dados.get('pool_size', 0) - dados.get('pool_available', 0),
+        'aguardando': dados.get('requests_waiting', 0),
+        'requisicoes': requisicoes,
+        'requisicoes_em_fila': dados.get('requests_queued', 0),
+        'tempo_espera_ms': dados.get('requests_wait_ms', 0),
+        'tempo_espera_medio_ms': dados.get('requests_wait_ms', 0) / requisicoes if requisicoes else 0.0,
+        'erros': dados.get('requests_errors', 0), # timeouts e filas cheias
+        'conexoes_perdidas': dados.get('connections_lost', 0), # falharam no teste antes do uso
+    }
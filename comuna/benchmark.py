@@ -0,0 +1,161 @@
+import math
+import random
+import statistics
+import time
+from datetime import date
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.test import Client
+from django.urls import reverse
+from posts.models import Post, Comments, TimelineEntry
+from users.models import CustomUser, Follow, normalizar_busca
+from users.services import recalcular_contadores_follow
+from .consultas import registrar_consultas
+
+CENARIOS = ('feed', 'perfil', 'post_detail', 'seguir', 'deixar_de_seguir', 'comentar')
+TAMANHO_LOTE = 1000
+
+
+# ====================================== Benchmark das views principais =======================================
+# popular() cria dados sintéticos (usuários, grafo de follows, posts, timelines e comentários) com uma
+# semente fixa, e medir() chama as views pelo Client do Django, registrando latência e consultas de
+# cada requisição. O comando `benchmark` roda os dois em um banco de teste descartável e grava o JSON.
+
+def popular(usuarios=200, seguindo=20, posts=5, comentarios=3, semente=42):
+    """
+    Cria `usuarios` usuários, cada um seguindo `seguindo` outros (sorteados), com `posts` posts cada
+    e `comentarios` comentários por post. Tudo em inserts em lote. Retorna a quantidade criada de cada tipo.
+    """
+    rnd = random.Random(semente)
+    senha = make_password('benchmark') # o hash é caro: um só para todos
+
+    novos = []
+    for i in range(usuarios):
+        username = f'bench{i}'
+        novos.append(CustomUser(
+            username=username, email=f'{username}@example.com', password=senha, first_name='Bench', last_name=str(i),
+            data_nascimento=date(2000, 1, 1), e_verificado=True,
+            # o bulk_create não passa pelo save(), que preenche as colunas de busca
+            username_busca=normalizar_busca(username), nome_busca=normalizar_busca(f'Bench {i}'),
+        ))
+    ids = [usuario.id for usuario in CustomUser.objects.bulk_create(novos, batch_size=TAMANHO_LOTE)]
+
+    seguidores = {pk: [] for pk in ids}
+    follows = []
+    for pk in ids:
+        outros = [outro for outro in rnd.sample(ids, min(seguindo + 1, len(ids))) if outro != pk][:seguindo]
+        for seguido in outros:
+            follows.append(Follow(seguidor_id=pk, seguindo_id=seguido))
+            seguidores[seguido].append(pk)
+    Follow.objects.bulk_create(follows, batch_size=TAMANHO_LOTE)
+    recalcular_contadores_follow()
+
+    novos_posts = [
+        Post(author_id=pk, content=f'Post {n} de bench {i}', comments_count=comentarios)
+        for i, pk in enumerate(ids) for n in range(posts)
+    ]
+    novos_posts = Post.objects.bulk_create(novos_posts, batch_size=TAMANHO_LOTE)
+
+    # o mesmo que distribuir_post faria para cada post, em lote
+    entradas = [
+        TimelineEntry(owner_id=seguidor, post_id=post.id, created_at=post.created_at)
+        for post in novos_posts for seguidor in seguidores[post.author_id]
+    ]
+    TimelineEntry.objects.bulk_create(entradas, batch_size=TAMANHO_LOTE, ignore_conflicts=True)
+
+    novos_comentarios = Comments.objects.bulk_create([
+        Comments(post_id=post.id, author_id=rnd.choice(ids), content=f'Comentário {n}')
+        for post in novos_posts for n in range(comentarios)
+    ], batch_size=TAMANHO_LOTE)
+    # o caminho materializado depende do id (comentários de primeiro nível: só o próprio segmento)
+    for comentario in novos_comentarios:
+        comentario.path = str(comentario.id).zfill(Comments.TAMANHO_SEGMENTO)
+    Comments.objects.bulk_update(novos_comentarios, ['path'], batch_size=TAMANHO_LOTE)
+
+    return {
+        'usuarios': len(ids),
+        'follows': len(follows),
+        'posts': len(novos_posts),
+        'timeline': len(entradas),
+        'comentarios': len(novos_comentarios),
+    }
+
+
+def percentil(valores, p):
+    """
+    Percentil p (0-100) pelo método do posto mais próximo.
+    """
+    ordenados = sorted(valores)
+    return ordenados[max(0, math.ceil(p / 100 * len(ordenados)) - 1)]
+
+
+def _resumo(amostras):
+    latencias = [latencia for latencia, _, _ in amostras]
+    consultas = [quantidade for _, quantidade, _ in amostras]
+    return {
+        'requisicoes': len(amostras),
+        'erros': sum(1 for _, _, status in amostras if status >= 400),
+        'p50_ms': round(percentil(latencias, 50), 3),
+        'p95_ms': round(percentil(latencias, 95), 3),
+        'p99_ms': round(percentil(latencias, 99), 3),
+        'media_ms': round(statistics.fmean(latencias), 3),
+        'consultas_media': round(statistics.fmean(consultas), 2),
+        'consultas_max': max(consultas),
+    }
+
+
+def _requisitar(cliente, metodo, url, dados=None):
+    with registrar_consultas() as registro:
+        inicio = time.perf_counter()
+        response = getattr(cliente, metodo)(url, dados)
+        duracao = (time.perf_counter() - inicio) * 1000
+    return duracao, registro.total, response.status_code
+
+
+def medir(cenarios=CENARIOS, repeticoes=100, aquecimento=10, semente=42):
+    """
+    Executa cada cenário `aquecimento` + `repeticoes` vezes, com usuários e posts sorteados,
+    e devolve {cenário: resumo} com p50/p95/p99 (ms) e consultas por requisição.
+    O aquecimento não entra no resultado (cache frio, templates ainda não compilados).
+    """
+    rnd = random.Random(semente)
+    cache.clear()
+    usuarios = list(CustomUser.objects.filter(username__startswith='bench').values_list('id', 'username'))
+    posts = list(Post.objects.filter(author__username__startswith='bench').values_list('id', 'author__username'))
+    cliente = Client()
+
+    amostras = {cenario: [] for cenario in cenarios}
+    for rodada in range(aquecimento + repeticoes):
+        medidas = {}
+        usuario_id, _ = rnd.choice(usuarios)
+        cliente.force_login(CustomUser.objects.get(id=usuario_id))
+        post_id, autor = rnd.choice(posts)
+
+        if 'feed' in cenarios:
+            medidas['feed'] = _requisitar(cliente, 'get', reverse('home'))
+        if 'perfil' in cenarios:
+            medidas['perfil'] = _requisitar(cliente, 'get', reverse('perfil', args=[rnd.choice(usuarios)[1]]))
+        if 'post_detail' in cenarios:
+            medidas['post_detail'] = _requisitar(cliente, 'get', reverse('post_detail', args=[autor, post_id]))
+        if 'seguir' in cenarios or 'deixar_de_seguir' in cenarios:
+            # alguém que o usuário ainda não segue; segue e deixa de seguir para não mudar o grafo
+            seguidos = set(Follow.objects.filter(seguidor_id=usuario_id).values_list('seguindo_id', flat=True))
+            candidatos = [pk for pk, _ in usuarios if pk != usuario_id and pk not in seguidos]
+            if candidatos:
+                alvo = rnd.choice(candidatos)
+                seguir = _requisitar(cliente, 'post', reverse('seguir_usuario', args=[alvo]))
+                deixar = _requisitar(cliente, 'post', reverse('deixar_de_seguir_usuario', args=[alvo]))
+                if 'seguir' in cenarios:
+                    medidas['seguir'] = seguir
+                if 'deixar_de_seguir' in cenarios:
+                    medidas['deixar_de_seguir'] = deixar
+        if 'comentar' in cenarios:
+            medidas['comentar'] = _requisitar(
+                cliente, 'post', reverse('post_detail', args=[autor, post_id]), {'content': 'Comentário do benchmark'},
+            )
+
+        if rodada >= aquecimento:
+            for cenario, medida in medidas.items():
+                amostras[cenario].append(medida)
+
+    return {cenario: _resumo(lista) for cenario, lista in amostras.items() if lista}
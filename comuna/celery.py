@@ -0,0 +1,16 @@
+"""
+Aplicação Celery do projeto comuna.
+
+Lê as configurações com prefixo CELERY_ do settings.py e descobre as tasks
+definidas em tasks.py de cada app instalado.
+"""
+
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'comuna.settings')
+
+app = Celery('comuna')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
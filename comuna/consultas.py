@@ -0,0 +1,150 @@
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+# registros ativos no contexto (um bloco dentro de outro conta nos dois); vazio = nada sendo medido
+_registros_ativos = ContextVar('registros_consultas', default=())
+
+# "IN (%s, %s, %s)" com qualquer quantidade de parâmetros conta como a mesma consulta
+_LISTA_PARAMETROS = re.compile(r'\((?:%s, )*%s\)')
+
+
+# ====================================== Orçamento de consultas =======================================
+# Conta as consultas, o tempo total de SQL e as consultas repetidas (o padrão do N+1) de cada requisição.
+# O wrapper fica instalado em toda conexão (inclusive as abertas em outras threads pelas views
+# assíncronas) e só mede quando existe um registro ativo no contexto. No modo leve das métricas
+# (METRICAS_MODO_LEVE) ele não é instalado nas conexões novas.
+
+class OrcamentoExcedido(AssertionError):
+    pass
+
+
+class RegistroConsultas:
+    def __init__(self):
+        self.consultas = [] # (sql, duração em segundos)
+
+    def adicionar(self, sql, duracao):
+        self.consultas.append((sql, duracao))
+
+    @property
+    def total(self):
+        return len(self.consultas)
+
+    @property
+    def tempo_total_ms(self):
+        return sum(duracao for _, duracao in self.consultas) * 1000
+
+    def repetidas(self):
+        """
+        {sql: vezes} das consultas executadas mais de uma vez com o mesmo formato.
+        """
+        contagem = Counter(_LISTA_PARAMETROS.sub('(...)', sql) for sql, _ in self.consultas)
+        return {sql: vezes for sql, vezes in contagem.items() if vezes > 1}
+
+    def resumo(self):
+        return {
+            'consultas': self.total,
+            'tempo_ms': round(self.tempo_total_ms, 2),
+            'repetidas': self.repetidas(),
+        }
+
+
+def _medir(execute, sql, params, many, context):
+    registros = _registros_ativos.get()
+    if not registros:
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duracao = time.perf_counter() - inicio
+        for registro in registros:
+            registro.adicionar(sql, duracao)
+
+
+def _instalar(conexao):
+    if _medir not in conexao.execute_wrappers:
+        conexao.execute_wrappers.append(_medir)
+
+
+def monitorar_consultas():
+    """
+    Se o orçamento de consultas por requisição está ligado (CONSULTAS_MONITORAR, fora do METRICAS_MODO_LEVE).
+    """
+    return settings.CONSULTAS_MONITORAR and not settings.METRICAS_MODO_LEVE
+
+
+def _ao_conectar(sender, connection, **kwargs):
+    # desligado, as conexões novas ficam sem o wrapper; registrar_consultas ainda o instala
+    # sob demanda (ex.: limitar_consultas nos testes)
+    if monitorar_consultas():
+        _instalar(connection)
+
+
+connection_created.connect(_ao_conectar)
+
+
+@contextmanager
+def registrar_consultas():
+    """
+    Registra as consultas feitas dentro do bloco (em qualquer banco e thread que herde o contexto).
+    """
+    for conexao in connections.all():
+        _instalar(conexao)
+    registro = RegistroConsultas()
+    token = _registros_ativos.set((*_registros_ativos.get(), registro))
+    try:
+        yield registro
+    finally:
+        _registros_ativos.reset(token)
+
+
+def verificar_orcamento(registro, orcamento, descricao, estrito=False):
+    """
+    Loga (ou, se estrito, levanta OrcamentoExcedido) quando o registro passa do orçamento.
+    """
+    if registro.total <= orcamento:
+        return
+    mensagem = (
+        f'{descricao}: {registro.total} consultas (orçamento {orcamento}), '
+        f'{registro.tempo_total_ms:.1f} ms de SQL, repetidas: {registro.repetidas()}'
+    )
+    if estrito:
+        raise OrcamentoExcedido(mensagem)
+    logger.warning(mensagem)
+
+
+def orcamento_consultas(orcamento, escrita=None):
+    """
+    Declara o máximo de consultas de uma view (usado pelo OrcamentoConsultasMiddleware).
+    `escrita` é o orçamento próprio das escritas (POST...), quando custam mais que a leitura; sem ele vale o mesmo:
+
+        @orcamento_consultas(4)
+        def feed_view(request): ...
+
+        @orcamento_consultas(6, escrita=9)
+        def post_detail(request, username, post_id): ...
+    """
+    def decorador(view):
+        view.orcamento_consultas = orcamento
+        view.orcamento_consultas_escrita = escrita if escrita is not None else orcamento
+        return view
+    return decorador
+
+
+@contextmanager
+def limitar_consultas(orcamento):
+    """
+    Para testes: falha se o bloco fizer mais de `orcamento` consultas.
+    """
+    with registrar_consultas() as registro:
+        yield registro
+    verificar_orcamento(registro, orcamento, 'bloco', estrito=True)
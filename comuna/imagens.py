@@ -0,0 +1,136 @@
+from io import BytesIO
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+
+# ====================================== Variantes de imagem =======================================
+# Cada imagem enviada (post, comentário ou avatar) ganha versões redimensionadas em WebP e JPEG,
+# sem EXIF (localização, modelo do celular...) e com a orientação já aplicada. Os templates usam
+# a variante do tamanho certo em vez do arquivo original, que pode ter vários megabytes.
+
+FORMATOS = (
+    ('webp', 'WEBP'),
+    ('jpeg', 'JPEG'),
+)
+
+
+def _para_rgb(imagem):
+    # JPEG não tem transparência: aplica a imagem sobre um fundo branco
+    if imagem.mode in ('RGBA', 'LA') or (imagem.mode == 'P' and 'transparency' in imagem.info):
+        imagem = imagem.convert('RGBA')
+        fundo = Image.new('RGB', imagem.size, (255, 255, 255))
+        fundo.paste(imagem, mask=imagem.getchannel('A'))
+        return fundo
+    return imagem.convert('RGB')
+
+
+def _salvar(imagem, formato, nome):
+    buffer = BytesIO()
+    if formato == 'JPEG':
+        imagem = _para_rgb(imagem)
+        imagem.save(buffer, formato, quality=settings.IMAGENS_QUALIDADE, optimize=True, progressive=True)
+    else:
+        imagem.save(buffer, formato, quality=settings.IMAGENS_QUALIDADE)
+    # o save sem o parâmetro exif grava a imagem sem os metadados do original
+    return default_storage.save(nome, ContentFile(buffer.getvalue()))
+
+
+def gerar_variantes(arquivo):
+    """
+    Gera as variantes definidas em IMAGENS_VARIANTES para o arquivo de imagem informado.
+    Retorna o dicionário salvo no campo *_variants do modelo:
+    {'width': ..., 'height': ..., 'feed': {'webp': nome, 'jpeg': nome, 'width': ..., 'height': ...}, ...}
+    Levanta ValueError se o arquivo não for uma imagem válida.
+    """
+    original = PurePosixPath(arquivo.name)
+    pasta = original.parent / 'variantes'
+
+    try:
+        with arquivo.open('rb'), Image.open(arquivo) as imagem:
+            imagem = ImageOps.exif_transpose(imagem)
+            imagem.load()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+        raise ValueError(f'Imagem inválida: {arquivo.name}') from e
+
+    if imagem.mode not in ('RGB', 'RGBA'):
+        imagem = imagem.convert('RGBA' if 'transparency' in imagem.info or imagem.mode in ('LA', 'PA') else 'RGB')
+
+    variantes = {'width': imagem.width, 'height': imagem.height}
+    for nome_variante, lado in settings.IMAGENS_VARIANTES.items():
+        copia = imagem.copy()
+        copia.thumbnail((lado, lado), Image.Resampling.LANCZOS) # só reduz, nunca aumenta
+        variante = {'width': copia.width, 'height': copia.height}
+        for extensao, formato in FORMATOS:
+            nome = str(pasta / f'{original.stem}_{nome_variante}.{extensao}')
+            variante[extensao] = _salvar(copia, formato, nome)
+        variantes[nome_variante] = variante
+    return variantes
+
+
+# formatos do Pillow que podem levar EXIF/XMP (localização, modelo do celular...) no arquivo original
+FORMATOS_COM_METADADOS = ('JPEG', 'PNG', 'WEBP', 'MPO')
+
+
+def sem_metadados(arquivo):
+    """
+    Devolve o arquivo enviado sem EXIF/XMP, com a orientação já aplicada, para ser gravado no lugar do original
+    (que também é servido, inclusive enquanto as variantes não ficam prontas). Arquivos sem metadados,
+    GIFs e o que não for uma imagem válida voltam sem alteração.
+    """
+    try:
+        with Image.open(arquivo) as imagem:
+            formato = imagem.format
+            if formato not in FORMATOS_COM_METADADOS or not (imagem.getexif() or 'xmp' in imagem.info):
+                return arquivo
+            icc = imagem.info.get('icc_profile')
+            imagem = ImageOps.exif_transpose(imagem)
+            imagem.load()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError):
+        return arquivo
+    finally:
+        arquivo.seek(0)
+
+    buffer = BytesIO()
+    formato = 'JPEG' if formato == 'MPO' else formato
+    opcoes = {'icc_profile': icc} if icc else {}
+    if formato in ('JPEG', 'WEBP'):
+        opcoes['quality'] = settings.IMAGENS_QUALIDADE
+    if formato == 'JPEG':
+        imagem = _para_rgb(imagem)
+    # o save sem o parâmetro exif grava a imagem sem os metadados do original
+    imagem.save(buffer, formato, **opcoes)
+    return ContentFile(buffer.getvalue(), name=arquivo.name)
+
+
+def urls_variantes(variantes):
+    """
+    Converte os nomes salvos em URLs, no formato usado pelos templates:
+    {'feed': {'webp': url, 'jpeg': url, 'width': ..., 'height': ...}, ...}
+    """
+    urls = {}
+    for nome_variante in settings.IMAGENS_VARIANTES:
+        variante = (variantes or {}).get(nome_variante)
+        if not variante:
+            continue
+        urls[nome_variante] = {
+            'webp': default_storage.url(variante['webp']),
+            'jpeg': default_storage.url(variante['jpeg']),
+            'width': variante['width'],
+            'height': variante['height'],
+        }
+    return urls
+
+
+def apagar_variantes(variantes):
+    """
+    Remove do storage os arquivos das variantes (ex.: quando o avatar é trocado).
+    """
+    for nome_variante in settings.IMAGENS_VARIANTES:
+        variante = (variantes or {}).get(nome_variante) or {}
+        for extensao, _ in FORMATOS:
+            if variante.get(extensao):
+                default_storage.delete(variante[extensao])
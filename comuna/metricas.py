@@ -0,0 +1,86 @@
+import threading
+from bisect import bisect_left
+from collections import Counter
+from django.conf import settings
+
+# por rota (nome da URL): contagem por balde do histograma, soma e total das durações
+_latencias = {}
+_respostas = Counter() # (rota, status) -> quantidade
+_sql = {} # rota -> [segundos, consultas]
+_trava = threading.Lock()
+
+
+# ====================================== Métricas das requisições =======================================
+# Guardadas em memória, por processo: cada worker expõe as suas em /metrics (formato texto do Prometheus)
+# e o Prometheus soma os workers. O MetricasMiddleware registra latência e status de toda requisição
+# e, fora do modo leve (METRICAS_MODO_LEVE), o tempo e a quantidade de consultas SQL.
+
+def registrar_requisicao(rota, status, duracao, sql_segundos=None, sql_consultas=None):
+    baldes = settings.METRICAS_BALDES
+    with _trava:
+        latencia = _latencias.get(rota)
+        if latencia is None:
+            # um contador por balde, mais o balde +Inf
+            latencia = _latencias[rota] = {'baldes': [0] * (len(baldes) + 1), 'soma': 0.0, 'total': 0}
+        latencia['baldes'][bisect_left(baldes, duracao)] += 1
+        latencia['soma'] += duracao
+        latencia['total'] += 1
+        _respostas[(rota, status)] += 1
+        if sql_segundos is not None:
+            sql = _sql.setdefault(rota, [0.0, 0])
+            sql[0] += sql_segundos
+            sql[1] += sql_consultas
+
+
+def limpar_metricas():
+    with _trava:
+        _latencias.clear()
+        _respostas.clear()
+        _sql.clear()
+
+
+def _rotulos(**rotulos):
+    def escapar(valor):
+        return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{nome}="{escapar(valor)}"' for nome, valor in rotulos.items()) + '}'
+
+
+def _cabecalho(nome, tipo, descricao):
+    return [f'# HELP {nome} {descricao}', f'# TYPE {nome} {tipo}']
+
+
+def renderizar(extras=()):
+    """
+    Texto no formato de exposição do Prometheus. `extras` são tuplas (nome, tipo, descrição, valor)
+    para métricas simples sem rótulos (ex.: cache de usuários).
+    """
+    baldes = settings.METRICAS_BALDES
+    with _trava:
+        latencias = {rota: {**dados, 'baldes': list(dados['baldes'])} for rota, dados in _latencias.items()}
+        respostas = dict(_respostas)
+        sql = {rota: list(dados) for rota, dados in _sql.items()}
+
+    linhas = _cabecalho('comuna_requisicao_duracao_segundos', 'histogram', 'Duração das requisições por rota.')
+    for rota, dados in sorted(latencias.items()):
+        acumulado = 0
+        for limite, quantidade in zip([*baldes, '+Inf'], dados['baldes']):
+            acumulado += quantidade
+            linhas.append(f'comuna_requisicao_duracao_segundos_bucket{_rotulos(rota=rota, le=limite)} {acumulado}')
+        linhas.append(f'comuna_requisicao_duracao_segundos_sum{_rotulos(rota=rota)} {dados["soma"]}')
+        linhas.append(f'comuna_requisicao_duracao_segundos_count{_rotulos(rota=rota)} {dados["total"]}')
+
+    linhas += _cabecalho('comuna_respostas_total', 'counter', 'Respostas por rota e status HTTP.')
+    for (rota, status), quantidade in sorted(respostas.items()):
+        linhas.append(f'comuna_respostas_total{_rotulos(rota=rota, status=status)} {quantidade}')
+
+    linhas += _cabecalho('comuna_sql_duracao_segundos_total', 'counter', 'Tempo gasto em SQL por rota.')
+    for rota, (segundos, _) in sorted(sql.items()):
+        linhas.append(f'comuna_sql_duracao_segundos_total{_rotulos(rota=rota)} {segundos}')
+    linhas += _cabecalho('comuna_sql_consultas_total', 'counter', 'Consultas SQL por rota.')
+    for rota, (_, consultas) in sorted(sql.items()):
+        linhas.append(f'comuna_sql_consultas_total{_rotulos(rota=rota)} {consultas}')
+
+    for nome, tipo, descricao, valor in extras:
+        linhas += _cabecalho(nome, tipo, descricao)
+        linhas.append(f'{nome} {valor}')
+    return '\n'.join(linhas) + '\n'
@@ -0,0 +1,138 @@
+import time
+from contextlib import nullcontext
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from .consultas import monitorar_consultas, registrar_consultas, verificar_orcamento
+from .metricas import registrar_requisicao
+from .routers import ler_das_replicas
+
+COOKIE_PRIMARIO = 'ler_primario'
+METODOS_LEITURA = ('GET', 'HEAD', 'OPTIONS')
+
+
+# ====================================== Leitura das réplicas por requisição =======================================
+# GETs leem das réplicas. Um POST (postar, seguir, comentar...) lê do primário e grava um cookie que
+# mantém o usuário lendo do primário por DB_REPLICA_JANELA segundos: ele vê o que acabou de escrever
+# mesmo que a réplica ainda não tenha recebido.
+
+class ReplicaMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def _pode_ler_das_replicas(self, request):
+        return request.method in METODOS_LEITURA and COOKIE_PRIMARIO not in request.COOKIES
+
+    def _marcar_escrita(self, request, response):
+        if request.method not in METODOS_LEITURA and settings.DB_REPLICA_JANELA > 0:
+            response.set_cookie(COOKIE_PRIMARIO, '1', max_age=settings.DB_REPLICA_JANELA, httponly=True, samesite='Lax')
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with ler_das_replicas(self._pode_ler_das_replicas(request)):
+            response = self.get_response(request)
+        return self._marcar_escrita(request, response)
+
+    async def __acall__(self, request):
+        with ler_das_replicas(self._pode_ler_das_replicas(request)):
+            response = await self.get_response(request)
+        return self._marcar_escrita(request, response)
+
+
+# ====================================== Orçamento de consultas por requisição =======================================
+# Mede as consultas de cada requisição e loga as que passam do orçamento da view (@orcamento_consultas)
+# ou de CONSULTAS_ORCAMENTO; escritas (POST...) usam o orçamento de escrita da view. Com CONSULTAS_ORCAMENTO_ESTRITO (testes/CI) a requisição falha.
+# Desligado por CONSULTAS_MONITORAR=False ou pelo modo leve das métricas (METRICAS_MODO_LEVE).
+
+class OrcamentoConsultasMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # escritas (tudo que não é METODOS_LEITURA) usam o orçamento de escrita da view, se ela declarar um
+        atributo = 'orcamento_consultas' if request.method in METODOS_LEITURA else 'orcamento_consultas_escrita'
+        request.orcamento_consultas = getattr(view_func, atributo, settings.CONSULTAS_ORCAMENTO)
+
+    def _verificar(self, request, registro):
+        orcamento = getattr(request, 'orcamento_consultas', settings.CONSULTAS_ORCAMENTO)
+        verificar_orcamento(
+            registro, orcamento, f'{request.method} {request.path}', estrito=settings.CONSULTAS_ORCAMENTO_ESTRITO,
+        )
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not monitorar_consultas():
+            return self.get_response(request)
+        with registrar_consultas() as registro:
+            response = self.get_response(request)
+        self._verificar(request, registro)
+        return response
+
+    async def __acall__(self, request):
+        if not monitorar_consultas():
+            return await self.get_response(request)
+        with registrar_consultas() as registro:
+            response = await self.get_response(request)
+        self._verificar(request, registro)
+        return response
+
+
+# ====================================== Métricas por rota =======================================
+# Primeiro da lista: mede o tempo total da requisição (inclusive os outros middlewares).
+# A rota é o nome da URL resolvida; requisições que não resolvem (404) ficam em 'sem_rota'.
+
+class MetricasMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def _medir_sql(self):
+        # no modo leve não instala a contagem por consulta: só latência e status
+        return nullcontext() if settings.METRICAS_MODO_LEVE else registrar_consultas()
+
+    def _registrar(self, request, response, inicio, registro):
+        correspondencia = request.resolver_match
+        rota = (correspondencia.view_name if correspondencia else None) or 'sem_rota'
+        registrar_requisicao(
+            rota,
+            response.status_code,
+            time.perf_counter() - inicio,
+            registro.tempo_total_ms / 1000 if registro else None,
+            registro.total if registro else None,
+        )
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.METRICAS_ATIVAS:
+            return self.get_response(request)
+        inicio = time.perf_counter()
+        with self._medir_sql() as registro:
+            response = self.get_response(request)
+        self._registrar(request, response, inicio, registro)
+        return response
+
+    async def __acall__(self, request):
+        if not settings.METRICAS_ATIVAS:
+            return await self.get_response(request)
+        inicio = time.perf_counter()
+        with self._medir_sql() as registro:
+            response = await self.get_response(request)
+        self._registrar(request, response, inicio, registro)
+        return response
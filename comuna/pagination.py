@@ -0,0 +1,65 @@
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+
+# ====================================== Paginação por cursor (keyset) =======================================
+# Em vez de OFFSET, a próxima página é buscada a partir do último item visto
+# (data, id). Com um índice composto nesses campos, a página N custa o mesmo
+# que a página 1, independente do tamanho da tabela.
+
+def codificar_cursor(data, pk):
+    """
+    Gera um cursor opaco a partir da data e do id do último item da página.
+    """
+    bruto = f'{data.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(bruto).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor):
+    """
+    Converte o cursor de volta em (data, id).
+    Levanta ValueError se o cursor for inválido.
+    """
+    try:
+        preenchimento = '=' * (-len(cursor) % 4)
+        bruto = base64.urlsafe_b64decode(cursor + preenchimento).decode()
+        data, pk = bruto.split('|')
+        return datetime.fromisoformat(data), int(pk)
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError('Cursor inválido.') from e
+
+
+def aplicar_cursor(queryset, cursor, campo_data='created_at', campo_id='id'):
+    """
+    Ordena o queryset por (campo_data, campo_id) decrescente e, se houver cursor,
+    filtra apenas os itens que vêm depois dele.
+    """
+    queryset = queryset.order_by(f'-{campo_data}', f'-{campo_id}')
+    if not cursor:
+        return queryset
+
+    data, pk = decodificar_cursor(cursor)
+    return queryset.filter(
+        Q(**{f'{campo_data}__lt': data}) | Q(**{campo_data: data, f'{campo_id}__lt': pk})
+    )
+
+
+def paginar_por_cursor(queryset, cursor=None, tamanho_pagina=20, campo_data='created_at', campo_id='id'):
+    """
+    Retorna (itens, proximo_cursor) para uma página de tamanho fixo.
+    proximo_cursor é None quando não há mais itens.
+    """
+    queryset = aplicar_cursor(queryset, cursor, campo_data, campo_id)
+
+    # busca um item a mais só para saber se existe próxima página
+    itens = list(queryset[:tamanho_pagina + 1])
+    tem_mais = len(itens) > tamanho_pagina
+    itens = itens[:tamanho_pagina]
+
+    proximo_cursor = None
+    if tem_mais:
+        ultimo = itens[-1]
+        proximo_cursor = codificar_cursor(getattr(ultimo, campo_data), getattr(ultimo, campo_id))
+    return itens, proximo_cursor
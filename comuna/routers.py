@@ -0,0 +1,55 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+
+# False (padrão): tudo vai para o primário. O middleware liga as réplicas só para requisições de leitura.
+_ler_das_replicas = ContextVar('ler_das_replicas', default=False)
+
+
+# ====================================== Réplicas de leitura =======================================
+# Escritas e migrações vão sempre para o primário ('default'). Leituras vão para uma réplica de
+# DB_REPLICAS apenas quando liberado (ReplicaMiddleware ou ler_das_replicas()); tasks, comandos e
+# requisições que escrevem continuam lendo do primário e nunca veem dados atrasados.
+# O que vai para um cache compartilhado não pode vir de uma réplica: o cache de usuários lê do
+# primário, e o cache de fragmentos não guarda cards de objetos alterados há menos de DB_REPLICA_JANELA.
+
+@contextmanager
+def ler_das_replicas(ativo=True):
+    """
+    Dentro do bloco, as leituras vão (ativo=True) ou não (ativo=False) para as réplicas.
+    """
+    token = _ler_das_replicas.set(ativo)
+    try:
+        yield
+    finally:
+        _ler_das_replicas.reset(token)
+
+
+def usar_primario():
+    return ler_das_replicas(False)
+
+
+def lendo_das_replicas():
+    """
+    Se as leituras feitas agora podem vir de uma réplica (e, portanto, estar atrasadas).
+    """
+    return bool(settings.DB_REPLICAS) and _ler_das_replicas.get()
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = settings.DB_REPLICAS
+        if replicas and _ler_das_replicas.get():
+            return random.choice(replicas)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # réplicas têm os mesmos dados do primário
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
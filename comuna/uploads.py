@@ -0,0 +1,81 @@
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile, StopUpload
+from django.http import QueryDict
+from django.template.defaultfilters import filesizeformat
+from django.utils.datastructures import MultiValueDict
+
+
+# ====================================== Limites de upload =======================================
+# Os limites ficam em UPLOAD_LIMITES (por tipo de arquivo) e UPLOAD_CAMPOS (campo do formulário -> tipo).
+# O handler roda antes dos handlers do Django, então um arquivo recusado nunca chega a ser gravado.
+
+def validar_arquivo(tipo, content_type, tamanho=None):
+    """
+    Confere o content-type e, se informado, o tamanho de um arquivo do tipo dado ('imagem' ou 'video').
+    Levanta ValueError com a mensagem para o usuário.
+    """
+    limite = settings.UPLOAD_LIMITES.get(tipo)
+    if limite is None:
+        raise ValueError('Este campo não aceita arquivos.')
+    if content_type not in limite['tipos']:
+        raise ValueError(f'Tipo de arquivo não permitido: {content_type or "desconhecido"}.')
+    if tamanho is not None and tamanho > limite['tamanho_maximo']:
+        raise ValueError(f'O arquivo passa do limite de {filesizeformat(limite["tamanho_maximo"])}.')
+
+
+def tamanho_maximo_requisicao():
+    # um arquivo de cada tipo no limite, mais os campos de texto
+    arquivos = sum(limite['tamanho_maximo'] for limite in settings.UPLOAD_LIMITES.values())
+    return arquivos + (settings.DATA_UPLOAD_MAX_MEMORY_SIZE or 0)
+
+
+def erros_upload(request):
+    """
+    Mensagens dos arquivos recusados pelo LimiteUploadHandler nesta requisição.
+    """
+    request.FILES # força a leitura do corpo, que é quando o handler roda
+    return getattr(request, 'upload_erros', [])
+
+
+class LimiteUploadHandler(FileUploadHandler):
+    """
+    Recusa arquivos de tipo não permitido e interrompe a leitura do corpo assim que um arquivo
+    passa do limite, sem esperar o resto do upload. Os erros ficam em request.upload_erros.
+    """
+
+    def _recusar(self, mensagem):
+        self.request.upload_erros.append(mensagem)
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        self.request.upload_erros = []
+        if content_length > tamanho_maximo_requisicao():
+            # nem começa a ler: devolve POST e FILES vazios
+            self._recusar(f'O envio passa do limite de {filesizeformat(tamanho_maximo_requisicao())}.')
+            return QueryDict(encoding=encoding), MultiValueDict()
+        return None
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        self.tipo = settings.UPLOAD_CAMPOS.get(field_name)
+        try:
+            validar_arquivo(self.tipo, content_type)
+        except ValueError as e:
+            # tipo inválido: descarta só este arquivo e segue com o resto do formulário
+            self._recusar(f'{file_name}: {e}')
+            raise SkipFile()
+
+        self.tamanho_maximo = settings.UPLOAD_LIMITES[self.tipo]['tamanho_maximo']
+        if content_length is not None and content_length > self.tamanho_maximo:
+            # tamanho declarado acima do limite: não lê o resto do corpo
+            self._recusar(f'{file_name}: o arquivo passa do limite de {filesizeformat(self.tamanho_maximo)}.')
+            raise StopUpload(connection_reset=True)
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > self.tamanho_maximo:
+            self._recusar(f'{self.file_name}: o arquivo passa do limite de {filesizeformat(self.tamanho_maximo)}.')
+            raise StopUpload(connection_reset=True)
+        # repassa a parte para o próximo handler (memória ou arquivo temporário)
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
@@ -16,9 +16,12 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
+from . import views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('estatisticas/banco/', views.estatisticas_conexoes, name='estatisticas_banco'),
+    path('metrics', views.metricas, name='metricas'),
     path('', include('posts.urls')),
     path('', include('users.urls')),
 ]
@@ -0,0 +1,41 @@
+import hmac
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse
+from users.cache import estatisticas as estatisticas_cache_usuarios
+from .banco import estatisticas_banco
+from .metricas import renderizar
+
+
+# ----------------------------------------------- ESTATISTICAS DO BANCO ----------------------------------------
+# conexões em uso, livres e fila de espera do pool neste processo
+@staff_member_required
+def estatisticas_conexoes(request):
+    return JsonResponse(estatisticas_banco())
+
+# ----------------------------------------------- METRICAS (PROMETHEUS) ----------------------------------------
+def _pode_ler_metricas(request):
+    if settings.METRICAS_TOKEN:
+        token = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        if hmac.compare_digest(token.encode(), settings.METRICAS_TOKEN.encode()):
+            return True
+    return request.META.get('REMOTE_ADDR') in settings.METRICAS_IPS
+
+
+def metricas(request):
+    if not _pode_ler_metricas(request):
+        return HttpResponseForbidden()
+    cache_usuarios = estatisticas_cache_usuarios()
+    extras = [
+        ('comuna_cache_usuarios_hits_total', 'counter', 'Acertos do cache de usuários.', cache_usuarios['hits']),
+        ('comuna_cache_usuarios_misses_total', 'counter', 'Faltas do cache de usuários.', cache_usuarios['misses']),
+        ('comuna_cache_usuarios_taxa_acerto', 'gauge', 'Fração de acertos do cache de usuários.', cache_usuarios['taxa_acerto']),
+    ]
+    banco = estatisticas_banco()
+    if banco['pool']:
+        extras += [
+            ('comuna_db_pool_em_uso', 'gauge', 'Conexões do pool em uso.', banco['em_uso']),
+            ('comuna_db_pool_aguardando', 'gauge', 'Requisições esperando uma conexão do pool.', banco['aguardando']),
+            ('comuna_db_pool_espera_segundos_total', 'counter', 'Tempo total de espera por conexão.', banco['tempo_espera_ms'] / 1000),
+        ]
+    return HttpResponse(renderizar(extras), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,159 @@
+import time
+from collections import defaultdict
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db.models import F
+from . import fragment_cache
+
+# Campos de engajamento que podem ser incrementados em cada modelo
+CAMPOS_CONTADORES = {
+    'posts.post': ('likes_count', 'comments_count', 'shares_count'),
+    'posts.comments': ('likes_count', 'shares_count'),
+}
+
+CHAVE_REGISTRO = 'contadores:registro' # lista das chaves de buffer com incrementos pendentes
+CHAVE_TRAVA = 'contadores:trava'
+
+
+# ====================================== Contadores de engajamento =======================================
+# Todo incremento vira um UPDATE ... SET campo = campo + delta (F()), que é atômico no banco
+# e só escreve a coluna tocada. Objetos "quentes" (muitos incrementos na mesma janela) acumulam
+# os incrementos no cache, e a task periódica descarregar_contadores grava tudo em lote.
+# O buffer só é usado com um cache compartilhado entre processos (Redis, Memcached...): com LocMemCache
+# a descarga roda no worker do Celery, que nunca veria o cache dos processos web.
+# Os contadores do Memcached não têm sinal (decr para em 0, incr negativo falha), então cada campo tem
+# duas chaves de buffer que só crescem: uma para os incrementos (:mais) e outra para os decrementos (:menos).
+
+def _label(modelo):
+    return modelo._meta.label_lower
+
+
+def _validar(modelo, campo):
+    if campo not in CAMPOS_CONTADORES.get(_label(modelo), ()):
+        raise ValueError(f'{campo} não é um contador de {_label(modelo)}.')
+
+
+def _com_trava(funcao, tentativas=50):
+    # trava simples com cache.add (atômico em locmem, memcached e redis)
+    for _ in range(tentativas):
+        if cache.add(CHAVE_TRAVA, 1, timeout=5):
+            try:
+                return True, funcao()
+            finally:
+                cache.delete(CHAVE_TRAVA)
+        time.sleep(0.01)
+    return False, None
+
+
+def _cache_compartilhado():
+    # LocMemCache e DummyCache são locais ao processo
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+def _somar(chave, valor, timeout):
+    # incr atômico (valor >= 0); a chave só é criada com add quando não existe, então o caso comum
+    # custa uma ida ao cache. Levanta ValueError se a chave expirar entre o add e o segundo incr
+    try:
+        return cache.incr(chave, valor)
+    except ValueError:
+        if cache.add(chave, valor, timeout=timeout):
+            return valor
+        # outro processo criou a chave no meio
+        return cache.incr(chave, valor)
+
+
+def _esta_quente(modelo, pk):
+    # conta os incrementos do objeto dentro da janela; acima do limite, o objeto está quente
+    try:
+        calor = _somar(f'contadores:calor:{_label(modelo)}:{pk}', 1, settings.CONTADORES_JANELA_QUENTE)
+    except ValueError:
+        return False
+    return calor > settings.CONTADORES_LIMITE_QUENTE
+
+
+def _registrar(chave):
+    def adicionar():
+        registro = cache.get(CHAVE_REGISTRO) or []
+        registro.append(chave)
+        cache.set(CHAVE_REGISTRO, registro, timeout=None)
+    return _com_trava(adicionar)[0]
+
+
+def _chave_sinal(chave, delta):
+    return f'{chave}:mais' if delta > 0 else f'{chave}:menos'
+
+
+def _bufferizar(modelo, pk, campo, delta):
+    chave = f'contadores:buffer:{_label(modelo)}:{pk}:{campo}'
+    _somar(_chave_sinal(chave, delta), abs(delta), timeout=None)
+
+    # só o primeiro incremento depois de cada descarga registra a chave
+    marcador = f'{chave}:registrada'
+    if not cache.add(marcador, 1, timeout=None):
+        return True
+    if _registrar(chave):
+        return True
+
+    # não conseguiu registrar: devolve o incremento e deixa o chamador gravar direto no banco
+    cache.delete(marcador)
+    cache.decr(_chave_sinal(chave, delta), abs(delta))
+    return False
+
+
+def incrementar(obj, campo, delta=1):
+    """
+    Incrementa (ou decrementa, com delta negativo) um contador de Post ou Comments.
+    """
+    modelo = type(obj)
+    _validar(modelo, campo)
+
+    if _cache_compartilhado() and _esta_quente(modelo, obj.pk) and _bufferizar(modelo, obj.pk, campo, delta):
+        return
+
+    modelo.objects.filter(pk=obj.pk).update(**{campo: F(campo) + delta})
+    fragment_cache.invalidar(modelo._meta.model_name, obj.pk)
+
+
+def descarregar_contadores():
+    """
+    Grava no banco os incrementos acumulados no cache.
+    Objetos com os mesmos deltas são atualizados em um único UPDATE.
+    Retorna quantos objetos foram atualizados.
+    """
+    def trocar_registro():
+        registro = cache.get(CHAVE_REGISTRO) or []
+        cache.delete(CHAVE_REGISTRO)
+        return registro
+
+    ok, chaves = _com_trava(trocar_registro)
+    if not ok or not chaves:
+        return 0
+
+    pendentes = defaultdict(dict)
+    for chave in set(chaves):
+        # apaga o marcador antes de ler: incrementos a partir daqui registram a chave de novo
+        cache.delete(f'{chave}:registrada')
+        lidos = cache.get_many([f'{chave}:mais', f'{chave}:menos'])
+        # subtrai só o que foi lido (nunca abaixo de zero), preservando incrementos que chegarem no meio da descarga
+        for chave_sinal, lido in lidos.items():
+            if lido:
+                cache.decr(chave_sinal, lido)
+        valor = lidos.get(f'{chave}:mais', 0) - lidos.get(f'{chave}:menos', 0)
+        if not valor:
+            continue
+        _, _, label, pk, campo = chave.split(':')
+        pendentes[(label, int(pk))][campo] = valor
+
+    # agrupa os objetos que receberam exatamente os mesmos deltas
+    lotes = defaultdict(list)
+    for (label, pk), deltas in pendentes.items():
+        lotes[(label, tuple(sorted(deltas.items())))].append(pk)
+
+    for (label, deltas), pks in lotes.items():
+        modelo = apps.get_model(label)
+        modelo.objects.filter(pk__in=pks).update(**{campo: F(campo) + valor for campo, valor in deltas})
+        fragment_cache.invalidar_varios(modelo._meta.model_name, pks)
+    return len(pendentes)
@@ -0,0 +1,58 @@
+import time
+from django.conf import settings
+from django.core.cache import cache
+from comuna.routers import lendo_das_replicas
+
+# ====================================== Cache de fragmentos (cards) =======================================
+# Cada post/comentário tem uma versão no cache. O card renderizado é guardado pelo
+# {% cache %} do template com a chave (id, versão); para invalidar basta trocar a versão,
+# sem precisar saber quais fragmentos existem.
+# O card também mostra o autor: a chave leva a versão do autor (tipo 'autor'), trocada quando o
+# username muda, e todos os cards dele são renderizados de novo sem percorrer seus posts.
+# A versão é o instante da troca (time.time_ns): se a chave for removida do cache, a nova versão
+# nunca coincide com uma antiga e um card velho não volta a ser servido.
+# Lendo das réplicas, um objeto alterado há menos de DB_REPLICA_JANELA segundos pode ter vindo
+# atrasado: o card é renderizado, mas não é guardado (fragmento_timeout 0).
+
+def _chave_versao(tipo, pk):
+    return f'fragmento:versao:{tipo}:{pk}'
+
+
+def _nova_versao():
+    return time.time_ns()
+
+
+def invalidar(tipo, pk):
+    """
+    Troca a versão do card, fazendo o próximo render ignorar o fragmento antigo.
+    """
+    cache.set(_chave_versao(tipo, pk), _nova_versao(), timeout=None)
+
+
+def invalidar_varios(tipo, pks):
+    for pk in pks:
+        invalidar(tipo, pk)
+
+
+def anotar_versoes(tipo, objetos):
+    """
+    Preenche `versao_card`, `versao_autor` e `fragmento_timeout` em cada objeto com uma única leitura no cache (get_many).
+    """
+    objetos = list(objetos)
+    chaves = {_chave_versao(tipo, obj.pk): obj for obj in objetos}
+    chaves_autor = {_chave_versao('autor', obj.author_id) for obj in objetos}
+    versoes = cache.get_many([*chaves, *chaves_autor])
+    ausentes = [chave for chave in [*chaves, *chaves_autor] if chave not in versoes]
+    if ausentes:
+        # versão ausente (nunca criada ou removida do cache): cria uma nova; o add não sobrescreve
+        # a de outro processo que tenha criado no meio tempo, que é relida em seguida
+        for chave in ausentes:
+            cache.add(chave, _nova_versao(), timeout=None)
+        versoes.update(cache.get_many(ausentes))
+    recente = time.time_ns() - settings.DB_REPLICA_JANELA * 10 ** 9 if lendo_das_replicas() else None
+    for chave, obj in chaves.items():
+        obj.versao_card = versoes.get(chave)
+        obj.versao_autor = versoes.get(_chave_versao('autor', obj.author_id))
+        alterado_agora = recente is not None and max(obj.versao_card or 0, obj.versao_autor or 0) > recente
+        obj.fragmento_timeout = 0 if alterado_agora else settings.FRAGMENTOS_TIMEOUT
+    return objetos
@@ -0,0 +1,77 @@
+import json
+import subprocess
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+from comuna.benchmark import CENARIOS, popular, medir
+
+
+def _commit_atual():
+    try:
+        resultado = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, cwd=settings.BASE_DIR)
+    except OSError:
+        return None
+    return resultado.stdout.strip() or None
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede latência (p50/p95/p99) e consultas por requisição do feed, perfil, post, seguir/deixar de seguir '
+        'e comentar, com dados sintéticos em um banco de teste descartável (SQLite ou PostgreSQL local). '
+        'O resultado vai para um JSON, para comparar execuções entre commits.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuarios', type=int, default=200, help='Quantidade de usuários sintéticos.')
+        parser.add_argument('--seguindo', type=int, default=20, help='Quantas contas cada usuário segue.')
+        parser.add_argument('--posts', type=int, default=5, help='Posts por usuário.')
+        parser.add_argument('--comentarios', type=int, default=3, help='Comentários por post.')
+        parser.add_argument('--repeticoes', type=int, default=100, help='Requisições medidas por cenário.')
+        parser.add_argument('--aquecimento', type=int, default=10, help='Requisições descartadas antes de medir.')
+        parser.add_argument('--semente', type=int, default=42, help='Semente do sorteio (mesma semente, mesmos dados).')
+        parser.add_argument('--cenarios', nargs='+', choices=CENARIOS, default=list(CENARIOS))
+        parser.add_argument('--saida', default='benchmark.json', help='Arquivo JSON de saída.')
+        parser.add_argument('--manter-banco', action='store_true', help='Reaproveita o banco de teste entre execuções.')
+
+    def handle(self, *args, **options):
+        escala = {chave: options[chave] for chave in ('usuarios', 'seguindo', 'posts', 'comentarios')}
+        nome_original = connection.settings_dict['NAME']
+
+        # banco de teste (test_<NAME>), nunca o banco configurado; réplicas e cache compartilhado ficam de fora
+        setup_test_environment()
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['manter_banco'], serialize=False)
+        try:
+            with override_settings(
+                DB_REPLICAS=[],
+                CELERY_TASK_ALWAYS_EAGER=True, # as tasks disparadas pelas views rodam na hora, sem broker
+                CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark'}},
+            ):
+                criados = popular(semente=options['semente'], **escala)
+                self.stdout.write(f'Dados criados: {criados}')
+                resultados = medir(
+                    options['cenarios'], options['repeticoes'], options['aquecimento'], options['semente'],
+                )
+        finally:
+            connection.creation.destroy_test_db(nome_original, verbosity=0, keepdb=options['manter_banco'])
+            teardown_test_environment()
+
+        relatorio = {
+            'data': timezone.now().isoformat(),
+            'commit': _commit_atual(),
+            'banco': connection.vendor,
+            'escala': {**escala, 'semente': options['semente'], 'repeticoes': options['repeticoes']},
+            'criados': criados,
+            'cenarios': resultados,
+        }
+        with open(options['saida'], 'w', encoding='utf-8') as arquivo:
+            json.dump(relatorio, arquivo, indent=2, ensure_ascii=False)
+
+        for cenario, resumo in resultados.items():
+            self.stdout.write(
+                f'{cenario:>18}: p50 {resumo["p50_ms"]:.1f} ms  p95 {resumo["p95_ms"]:.1f} ms  '
+                f'p99 {resumo["p99_ms"]:.1f} ms  {resumo["consultas_media"]:.1f} consultas'
+            )
+        self.stdout.write(self.style.SUCCESS(f'Resultado gravado em {options["saida"]}.'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from posts.services import preencher_timelines
+
+
+class Command(BaseCommand):
+    help = 'Preenche a timeline materializada de todos os usuários a partir dos follows e posts existentes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000, help='Quantidade de usuários processados por lote.')
+
+    def handle(self, *args, **options):
+        total = preencher_timelines(tamanho_lote=options['lote'])
+        self.stdout.write(self.style.SUCCESS(f'{total} entradas de timeline enviadas ao banco.'))
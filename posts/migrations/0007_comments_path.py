@@ -0,0 +1,42 @@
+# Generated by Django 5.2.7 on 2026-10-17 19:50
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def preenche_caminhos(apps, schema_editor):
+    # calcula path/depth dos comentários existentes; o pai sempre tem id menor que a resposta
+    Comments = apps.get_model('posts', 'Comments')
+    caminhos = {}
+    for comentario in Comments.objects.order_by('id').only('id', 'parent_comment_id').iterator():
+        pai = caminhos.get(comentario.parent_comment_id)
+        path = (pai[0] if pai else '') + str(comentario.id).zfill(12)
+        depth = pai[1] + 1 if pai else 0
+        caminhos[comentario.id] = (path, depth)
+        Comments.objects.filter(id=comentario.id).update(path=path, depth=depth)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0006_reaction'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comments',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='comments',
+            name='path',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='comments',
+            index=models.Index(fields=['post', 'path'], name='comentario_arvore_idx'),
+        ),
+        migrations.RunPython(preenche_caminhos, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-17 19:52
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0007_comments_path'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comments',
+            index=models.Index(fields=['post', '-created_at', '-id'], name='comentario_post_cursor_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.7 on 2026-10-17 20:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_uploadparcial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comments',
+            name='video_poster',
+            field=models.ImageField(blank=True, null=True, upload_to='media/videos/posters/'),
+        ),
+        migrations.AddField(
+            model_name='comments',
+            name='video_status',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'Sem vídeo'), (1, 'Processando'), (2, 'Pronto'), (3, 'Erro')], default=0),
+        ),
+        migrations.AddField(
+            model_name='comments',
+            name='video_web',
+            field=models.FileField(blank=True, null=True, upload_to='media/videos/web/'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='video_poster',
+            field=models.ImageField(blank=True, null=True, upload_to='posts/videos/posters/'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='video_status',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'Sem vídeo'), (1, 'Processando'), (2, 'Pronto'), (3, 'Erro')], default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='video_web',
+            field=models.FileField(blank=True, null=True, upload_to='posts/videos/web/'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.7 on 2026-10-17 20:10
+
+import django.contrib.postgres.search
+from django.conf import settings
+from django.db import migrations
+
+TABELAS = ('posts_post', 'posts_comments')
+
+
+def cria_indice_busca(apps, schema_editor):
+    # PostgreSQL: índice GIN na coluna search_vector + preenchimento dos posts/comentários existentes.
+    # SQLite: tabela virtual FTS5 usada por posts/search.py. Os outros bancos usam icontains.
+    conexao = schema_editor.connection
+    if conexao.vendor == 'postgresql':
+        for tabela in TABELAS:
+            schema_editor.execute(f'CREATE INDEX {tabela}_busca_gin ON {tabela} USING gin (search_vector)')
+            schema_editor.execute(
+                f"UPDATE {tabela} SET search_vector = to_tsvector(%s::regconfig, coalesce(content, ''))",
+                [settings.BUSCA_CONFIGURACAO],
+            )
+    elif conexao.vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE posts_busca_fts USING fts5("
+            "tipo UNINDEXED, objeto_id UNINDEXED, content, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        for tipo, tabela in (('post', 'posts_post'), ('comments', 'posts_comments')):
+            schema_editor.execute(
+                f"INSERT INTO posts_busca_fts (tipo, objeto_id, content) SELECT '{tipo}', id, coalesce(content, '') FROM {tabela}"
+            )
+
+
+def remove_indice_busca(apps, schema_editor):
+    conexao = schema_editor.connection
+    if conexao.vendor == 'postgresql':
+        for tabela in TABELAS:
+            schema_editor.execute(f'DROP INDEX IF EXISTS {tabela}_busca_gin')
+    elif conexao.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS posts_busca_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0011_video_processamento'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comments',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(cria_indice_busca, remove_indice_busca),
+    ]
@@ -1,5 +1,21 @@
+import uuid
 from django.db import models
+from django.contrib.postgres.search import SearchVectorField
 from django.conf import settings
+from comuna.imagens import urls_variantes
+
+# Estado do processamento do vídeo (posts.tasks.processar_video), usado por Post e Comments.
+# Enquanto não estiver pronto o card mostra só o aviso, sem baixar o vídeo original.
+VIDEO_NENHUM = 0
+VIDEO_PENDENTE = 1
+VIDEO_PRONTO = 2
+VIDEO_ERRO = 3
+VIDEO_STATUS_CHOICES = [
+    (VIDEO_NENHUM, 'Sem vídeo'),
+    (VIDEO_PENDENTE, 'Processando'),
+    (VIDEO_PRONTO, 'Pronto'),
+    (VIDEO_ERRO, 'Erro'),
+]
 
 # Cria o modelo de post
 class Post(models.Model):
@@ -10,7 +26,13 @@ class Post(models.Model):
     # link, imagem e video externo
     external_link = models.URLField(blank=True, max_length=200)
     image = models.ImageField(upload_to='posts/images/', blank=True, null=True, verbose_name='Imagem do Post')
+    image_variants = models.JSONField(default=dict, blank=True) # Variantes redimensionadas (comuna.imagens), geradas pelo Celery
     video = models.FileField(upload_to='posts/videos/', blank=True, null=True, verbose_name='Vídeo do Post')
+    video_status = models.PositiveSmallIntegerField(choices=VIDEO_STATUS_CHOICES, default=VIDEO_NENHUM)
+    video_web = models.FileField(upload_to='posts/videos/web/', blank=True, null=True) # Versão transcodificada (posts.transcoding)
+    video_poster = models.ImageField(upload_to='posts/videos/posters/', blank=True, null=True) # Quadro usado como poster no card
+    search_vector = SearchVectorField(null=True, editable=False) # Índice da busca no PostgreSQL (posts/search.py)
+    mentions = models.ManyToManyField(settings.AUTH_USER_MODEL, blank=True, related_name='mencoes') # Usuários citados com @username
     
     # enjamento do post
     likes_count = models.IntegerField(default=0) # Contador de likes do post
@@ -18,11 +40,28 @@ class Post(models.Model):
     shares_count = models.IntegerField(default=0) # Contador de compartilhamentos do post
     
     def __str__(self):
-        return f'{self.user.username} - {self.created_at.strftime("%d/%m/%Y")}' 
+        return f'{self.author_id} - {self.created_at.strftime("%d/%m/%Y")}'
+    
+    @property
+    def imagens(self):
+        # URLs das variantes da imagem (vazio enquanto não forem geradas)
+        return urls_variantes(self.image_variants)
+
+    @property
+    def video_pronto(self):
+        return self.video_status == VIDEO_PRONTO
+
+    @property
+    def video_processando(self):
+        return self.video_status == VIDEO_PENDENTE
     
     class Meta: 
         verbose_name = 'Post'
         verbose_name_plural = 'Posts'
+        # Índice usado pela paginação por cursor do feed (created_at, id)
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='post_feed_cursor_idx'),
+        ]
 
 # Criar o modelo para comentarios dos post
 class Comments(models.Model):
@@ -34,6 +73,10 @@ class Comments(models.Model):
 
     # Comentários podem ser respondidos, então podemos ter um campo para o comentário pai
     parent_comment = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='replies')
+    # Caminho materializado: ids dos ancestrais + id próprio, cada um com TAMANHO_SEGMENTO dígitos.
+    # Permite buscar uma thread inteira por prefixo e ordenar a árvore sem recursão.
+    path = models.CharField(max_length=255, blank=True, default='')
+    depth = models.PositiveSmallIntegerField(default=0) # 0 para comentários do post, 1 para respostas, ...
     
     # Enjamento do comentário
     likes_count = models.IntegerField(default=0)
@@ -42,11 +85,104 @@ class Comments(models.Model):
     # Link externo opcional, imagem e vídeo
     external_link = models.URLField(blank=True, null=True, max_length=200) # Link externo opcional
     image = models.ImageField(upload_to='media/images/', blank=True, null=True, verbose_name='Imagem do Comentário')
+    image_variants = models.JSONField(default=dict, blank=True)
     video = models.FileField(upload_to='media/videos/', blank=True, null=True, verbose_name='Vídeo do Comentário')
+    video_status = models.PositiveSmallIntegerField(choices=VIDEO_STATUS_CHOICES, default=VIDEO_NENHUM)
+    video_web = models.FileField(upload_to='media/videos/web/', blank=True, null=True)
+    video_poster = models.ImageField(upload_to='media/videos/posters/', blank=True, null=True)
+    search_vector = SearchVectorField(null=True, editable=False)
+    
+    @property
+    def imagens(self):
+        return urls_variantes(self.image_variants)
+
+    @property
+    def video_pronto(self):
+        return self.video_status == VIDEO_PRONTO
+
+    @property
+    def video_processando(self):
+        return self.video_status == VIDEO_PENDENTE
+    
+    TAMANHO_SEGMENTO = 12
+    PROFUNDIDADE_LIMITE = 255 // TAMANHO_SEGMENTO - 1 # maior depth que ainda cabe em path
     
     def __str__(self):
         return f'{self.author.username} - {self.created_at.strftime("%d/%m/%Y")}'
     
     class Meta:
         verbose_name = 'Comentário'
-        verbose_name_plural = 'Comentários'
\ No newline at end of file
+        verbose_name_plural = 'Comentários'
+        indexes = [
+            models.Index(fields=['post', 'path'], name='comentario_arvore_idx'),
+            # paginação por cursor dos comentários de um post (created_at, id)
+            models.Index(fields=['post', '-created_at', '-id'], name='comentario_post_cursor_idx'),
+        ]
+
+# Timeline materializada (inbox) de cada usuário: uma linha por post que ele deve ver no feed.
+# É preenchida no momento da escrita (fan-out) para que a leitura do feed custe O(tamanho da página).
+class TimelineEntry(models.Model):
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='timeline') # Dono da timeline
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='timeline_entries')
+    created_at = models.DateTimeField() # Cópia de post.created_at, permite paginar a timeline sem join
+
+    def __str__(self):
+        return f'{self.owner_id} - {self.post_id}'
+
+    class Meta:
+        verbose_name = 'Entrada da Timeline'
+        verbose_name_plural = 'Entradas da Timeline'
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'post'], name='unique_timeline_post')
+        ]
+        indexes = [
+            models.Index(fields=['owner', '-created_at', '-post'], name='timeline_cursor_idx'),
+        ]
+
+# Curtidas e compartilhamentos ficam na mesma tabela, diferenciados por um tipo pequeno (smallint)
+class Reaction(models.Model):
+    LIKE = 1
+    SHARE = 2
+    KIND_CHOICES = [
+        (LIKE, 'Curtida'),
+        (SHARE, 'Compartilhamento'),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='reactions')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='reactions')
+    kind = models.PositiveSmallIntegerField(choices=KIND_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.user_id} - {self.get_kind_display()} - {self.post_id}'
+
+    class Meta:
+        verbose_name = 'Reação'
+        verbose_name_plural = 'Reações'
+        # Uma reação de cada tipo por usuário e post. A ordem (user, kind, post) também
+        # atende a consulta "quais destes posts eu curti?" em uma única busca no índice.
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'kind', 'post'], name='unique_reacao')
+        ]
+
+# Upload retomável de vídeo: o arquivo chega em partes (fora do MEDIA_ROOT) e, depois de completo,
+# é usado no post/comentário pelo upload_id. Ver posts/uploads.py.
+class UploadParcial(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='uploads_parciais')
+    nome = models.CharField(max_length=255) # Nome original do arquivo
+    content_type = models.CharField(max_length=100)
+    tamanho = models.PositiveBigIntegerField() # Tamanho total declarado no início
+    recebido = models.PositiveBigIntegerField(default=0) # Bytes já gravados (offset da próxima parte)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @property
+    def concluido(self):
+        return self.recebido == self.tamanho
+
+    def __str__(self):
+        return f'{self.owner_id} - {self.nome} ({self.recebido}/{self.tamanho})'
+
+    class Meta:
+        verbose_name = 'Upload Parcial'
+        verbose_name_plural = 'Uploads Parciais'
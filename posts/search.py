@@ -0,0 +1,118 @@
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import F
+from .models import Post, Comments
+
+# Modelos pesquisáveis: tipo usado na URL/índice -> modelo
+MODELOS = {
+    'post': Post,
+    'comments': Comments,
+}
+
+TABELA_FTS = 'posts_busca_fts'
+
+
+# ====================================== Busca textual =======================================
+# PostgreSQL: coluna search_vector (tsvector) com índice GIN, atualizada a cada save.
+# SQLite: tabela virtual FTS5 (TABELA_FTS) com o mesmo conteúdo, para desenvolvimento e testes.
+# Outros bancos caem em icontains, sem ranking.
+
+def _backend():
+    return connection.vendor
+
+
+def _tipo(obj):
+    return type(obj)._meta.model_name
+
+
+def indexar(obj, novo=False):
+    """
+    Atualiza o índice de busca de um Post ou Comments (chamado no post_save).
+    Com novo=True (objeto recém-criado) não há entrada antiga para apagar.
+    """
+    modelo = type(obj)
+    if _backend() == 'postgresql':
+        modelo.objects.filter(pk=obj.pk).update(
+            search_vector=SearchVector('content', config=settings.BUSCA_CONFIGURACAO)
+        )
+    elif _backend() == 'sqlite':
+        with connection.cursor() as cursor:
+            if not novo:
+                cursor.execute(f'DELETE FROM {TABELA_FTS} WHERE tipo = %s AND objeto_id = %s', [_tipo(obj), obj.pk])
+            cursor.execute(
+                f'INSERT INTO {TABELA_FTS} (tipo, objeto_id, content) VALUES (%s, %s, %s)',
+                [_tipo(obj), obj.pk, obj.content or ''],
+            )
+
+
+def remover(obj):
+    """
+    Remove o objeto do índice (no PostgreSQL a coluna some junto com a linha).
+    """
+    if _backend() == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {TABELA_FTS} WHERE tipo = %s AND objeto_id = %s', [_tipo(obj), obj.pk])
+
+
+def _consulta_fts(termo):
+    # cada palavra vira uma string entre aspas: o usuário não consegue usar a sintaxe do FTS5
+    palavras = ['"' + palavra.replace('"', '""') + '"' for palavra in termo.split()]
+    return ' '.join(palavras)
+
+
+def _buscar_fts(modelo, tipo, termo, inicio, quantidade):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT objeto_id, bm25({TABELA_FTS}) FROM {TABELA_FTS} '
+            f'WHERE {TABELA_FTS} MATCH %s AND tipo = %s ORDER BY bm25({TABELA_FTS}), objeto_id DESC LIMIT %s OFFSET %s',
+            [_consulta_fts(termo), tipo, quantidade, inicio],
+        )
+        ranking = cursor.fetchall()
+
+    objetos = modelo.objects.select_related(*_relacionados(modelo)).in_bulk([objeto_id for objeto_id, _ in ranking])
+    resultados = []
+    for objeto_id, bm25 in ranking:
+        if objeto_id in objetos:
+            objeto = objetos[objeto_id]
+            objeto.rank = -bm25 # no bm25 menor é melhor
+            resultados.append(objeto)
+    return resultados
+
+
+def _relacionados(modelo):
+    return ('author', 'post__author') if modelo is Comments else ('author',)
+
+
+def buscar(termo, tipo='post', pagina=1, tamanho_pagina=None):
+    """
+    Retorna uma página dos resultados (objetos, tem_mais), do mais relevante para o menos.
+    Cada objeto vem com `rank`.
+    """
+    termo = (termo or '').strip()
+    modelo = MODELOS[tipo]
+    if not termo:
+        return [], False
+
+    tamanho_pagina = tamanho_pagina or settings.BUSCA_POR_PAGINA
+    inicio = (pagina - 1) * tamanho_pagina
+
+    if _backend() == 'postgresql':
+        consulta = SearchQuery(termo, config=settings.BUSCA_CONFIGURACAO, search_type='websearch')
+        resultados = list(
+            modelo.objects.filter(search_vector=consulta)
+            .annotate(rank=SearchRank(F('search_vector'), consulta))
+            .select_related(*_relacionados(modelo))
+            .order_by('-rank', '-id')[inicio:inicio + tamanho_pagina + 1]
+        )
+    elif _backend() == 'sqlite':
+        resultados = _buscar_fts(modelo, tipo, termo, inicio, tamanho_pagina + 1)
+    else:
+        resultados = list(
+            modelo.objects.filter(content__icontains=termo)
+            .select_related(*_relacionados(modelo))
+            .order_by('-created_at', '-id')[inicio:inicio + tamanho_pagina + 1]
+        )
+
+    # uma linha a mais indica que existe próxima página
+    return resultados[:tamanho_pagina], len(resultados) > tamanho_pagina
@@ -1,4 +1,15 @@
-from .models import Post, Comments
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, F, Subquery, Window
+from django.db.models.functions import RowNumber, Substr
+from comuna.imagens import sem_metadados
+from comuna.pagination import aplicar_cursor, codificar_cursor
+from users.models import Follow
+from users.busca import resolver_mencoes
+from .models import Post, Comments, TimelineEntry, Reaction, VIDEO_NENHUM, VIDEO_PENDENTE
+from .counters import incrementar
+from .tasks import distribuir_post, processar_imagem, processar_video
 
 def criar_post(author, content=None, image=None, video=None, external_link=None):
     """
@@ -9,23 +20,330 @@ def criar_post(author, content=None, image=None, video=None, external_link=None)
     post = Post.objects.create(
         author=author,
         content=content if content else None,
-        image=image if image else None,
+        image=sem_metadados(image) if image else None,
         video=video if video else None,
-        external_link=external_link if external_link else None
+        video_status=VIDEO_PENDENTE if video else VIDEO_NENHUM,
+        external_link=external_link if external_link else '' # external_link do Post não aceita nulo
     )
+
+    # as variantes da imagem e a versão do vídeo para web são geradas em segundo plano
+    if post.image:
+        transaction.on_commit(lambda: processar_imagem.delay('posts.post', post.id))
+    if post.video:
+        transaction.on_commit(lambda: processar_video.delay('posts.post', post.id))
+
+    # @menções resolvidas em uma consulta e gravadas em um único INSERT
+    mencionados = resolver_mencoes(content)
+    if mencionados:
+        post.mentions.add(*mencionados)
+
+    # o próprio autor vê o post na hora, sem esperar o fan-out
+    TimelineEntry.objects.create(owner=author, post=post, created_at=post.created_at)
+
+    # contas muito seguidas não fazem fan-out (são lidas na hora em listar_timeline)
+    if not e_conta_popular(author):
+        transaction.on_commit(lambda: distribuir_post.delay(post.id))
     return post
 
 def criar_comentario(post, author, content=None, image=None, video=None, external_link=None, parent_comment=None):
     """
     Função para criar um novo comentário em um post.
     """
+    # respostas além do limite de profundidade entram como irmãs do comentário respondido
+    if parent_comment and parent_comment.depth >= Comments.PROFUNDIDADE_LIMITE:
+        parent_comment = parent_comment.parent_comment
+
     comentario = Comments.objects.create(
         post=post,
         author=author,
-        content=content if content else None,
-        image=image if image else None,
+        content=content if content else '', # content do comentário não aceita nulo
+        image=sem_metadados(image) if image else None,
         video=video if video else None,
+        video_status=VIDEO_PENDENTE if video else VIDEO_NENHUM,
         external_link=external_link if external_link else None,
         parent_comment=parent_comment if parent_comment else None
     )
-    return comentario
\ No newline at end of file
+
+    # o caminho materializado depende do id, então é gravado logo após a criação
+    comentario.path = (parent_comment.path if parent_comment else '') + _segmento(comentario.id)
+    comentario.depth = parent_comment.depth + 1 if parent_comment else 0
+    Comments.objects.filter(id=comentario.id).update(path=comentario.path, depth=comentario.depth)
+
+    if comentario.image:
+        transaction.on_commit(lambda: processar_imagem.delay('posts.comments', comentario.id))
+    if comentario.video:
+        transaction.on_commit(lambda: processar_video.delay('posts.comments', comentario.id))
+
+    # atualiza a contagem de comentarios do post de forma atômica
+    incrementar(post, 'comments_count')
+    return comentario
+
+
+# ====================================== Timeline (fan-out) =======================================
+def e_conta_popular(user):
+    """
+    Contas com mais seguidores que TIMELINE_FANOUT_LIMITE usam fan-out na leitura.
+    """
+    return user.followers_count > settings.TIMELINE_FANOUT_LIMITE
+
+
+def contas_populares_seguidas(user):
+    """
+    Retorna os ids das contas populares que o usuário segue.
+    """
+    return list(
+        Follow.objects.filter(seguidor=user, seguindo__followers_count__gt=settings.TIMELINE_FANOUT_LIMITE)
+        .values_list('seguindo_id', flat=True)
+    )
+
+
+def listar_entradas_timeline(user, cursor=None, tamanho_pagina=None):
+    """
+    Posts de uma página da timeline materializada do usuário (até tamanho_pagina + 1).
+    """
+    tamanho_pagina = tamanho_pagina or settings.FEED_PAGE_SIZE
+    entradas = aplicar_cursor(
+        TimelineEntry.objects.filter(owner=user).select_related('post__author'),
+        cursor,
+        campo_id='post_id',
+    )[:tamanho_pagina + 1]
+    return [entrada.post for entrada in entradas]
+
+
+def listar_posts_populares(user, cursor=None, tamanho_pagina=None):
+    """
+    Fan-out na leitura: posts das contas populares seguidas (até tamanho_pagina + 1), vindos do índice do feed.
+    """
+    tamanho_pagina = tamanho_pagina or settings.FEED_PAGE_SIZE
+    populares = contas_populares_seguidas(user)
+    if not populares:
+        return []
+    return list(aplicar_cursor(
+        Post.objects.filter(author_id__in=populares).select_related('author'),
+        cursor,
+    )[:tamanho_pagina + 1])
+
+
+def juntar_timeline(*listas, tamanho_pagina=None):
+    """
+    Junta as listas de posts (sem repetir) em uma página (posts, proximo_cursor).
+    """
+    tamanho_pagina = tamanho_pagina or settings.FEED_PAGE_SIZE
+    posts = {}
+    for lista in listas:
+        for post in lista:
+            posts.setdefault(post.id, post)
+
+    posts = sorted(posts.values(), key=lambda post: (post.created_at, post.id), reverse=True)
+    tem_mais = len(posts) > tamanho_pagina
+    posts = posts[:tamanho_pagina]
+
+    proximo_cursor = codificar_cursor(posts[-1].created_at, posts[-1].id) if tem_mais else None
+    return posts, proximo_cursor
+
+
+def listar_timeline(user, cursor=None, tamanho_pagina=None):
+    """
+    Retorna uma página da timeline do usuário (posts, proximo_cursor).
+    Junta a timeline materializada com os posts das contas populares seguidas.
+    """
+    return juntar_timeline(
+        listar_entradas_timeline(user, cursor, tamanho_pagina),
+        listar_posts_populares(user, cursor, tamanho_pagina),
+        tamanho_pagina=tamanho_pagina,
+    )
+
+
+def _posts_recentes_de(autor_ids, tamanho_lote):
+    # {autor: [(post_id, created_at)]} com até TIMELINE_BACKFILL posts por autor, limitados no próprio SQL
+    autor_ids = sorted(autor_ids)
+    recentes = {}
+    for inicio in range(0, len(autor_ids), tamanho_lote):
+        linhas = (
+            Post.objects.filter(author_id__in=autor_ids[inicio:inicio + tamanho_lote])
+            .annotate(posicao=Window(
+                RowNumber(), partition_by=[F('author_id')], order_by=[F('created_at').desc(), F('id').desc()],
+            ))
+            .filter(posicao__lte=settings.TIMELINE_BACKFILL)
+            .order_by()
+            .values_list('author_id', 'id', 'created_at')
+        )
+        for author_id, post_id, created_at in linhas:
+            recentes.setdefault(author_id, []).append((post_id, created_at))
+    return recentes
+
+
+def preencher_timelines(tamanho_lote=1000):
+    """
+    Preenche a timeline materializada a partir dos follows e posts que já existiam antes do fan-out.
+    Cada usuário recebe os TIMELINE_BACKFILL posts mais recentes dele e de cada conta não popular que segue
+    (as populares são lidas na hora). Percorre os usuários em lotes de ids e pode ser repetido sem duplicar.
+    Retorna quantas entradas foram enviadas ao banco.
+    """
+    total = 0
+    ultimo_id = 0
+    while True:
+        ids = list(
+            get_user_model().objects.filter(id__gt=ultimo_id)
+            .order_by('id')
+            .values_list('id', flat=True)[:tamanho_lote]
+        )
+        if not ids:
+            break
+
+        # o próprio usuário entra como autor da sua timeline, como em criar_post
+        autores = {user_id: [user_id] for user_id in ids}
+        seguidos = (
+            Follow.objects.filter(seguidor_id__in=ids, seguindo__followers_count__lte=settings.TIMELINE_FANOUT_LIMITE)
+            .order_by()
+            .values_list('seguidor_id', 'seguindo_id')
+        )
+        for seguidor_id, seguindo_id in seguidos:
+            autores[seguidor_id].append(seguindo_id)
+        recentes = _posts_recentes_de({autor for lista in autores.values() for autor in lista}, tamanho_lote)
+
+        lote = []
+        for owner_id, lista in autores.items():
+            for autor_id in lista:
+                for post_id, created_at in recentes.get(autor_id, ()):
+                    lote.append(TimelineEntry(owner_id=owner_id, post_id=post_id, created_at=created_at))
+                    if len(lote) >= settings.TIMELINE_FANOUT_LOTE:
+                        total += len(TimelineEntry.objects.bulk_create(lote, ignore_conflicts=True))
+                        lote = []
+        if lote:
+            total += len(TimelineEntry.objects.bulk_create(lote, ignore_conflicts=True))
+        ultimo_id = ids[-1]
+    return total
+
+
+# ====================================== Curtidas e compartilhamentos =======================================
+# Contador do Post mantido por cada tipo de reação
+CONTADOR_POR_REACAO = {
+    Reaction.LIKE: 'likes_count',
+    Reaction.SHARE: 'shares_count',
+}
+
+
+def reagir(user, post, kind):
+    """
+    Registra a reação do usuário no post (idempotente).
+    Retorna True se a reação foi criada agora.
+    """
+    with transaction.atomic():
+        _, created = Reaction.objects.get_or_create(user=user, post=post, kind=kind)
+        if created:
+            incrementar(post, CONTADOR_POR_REACAO[kind])
+    return created
+
+
+def remover_reacao(user, post, kind):
+    """
+    Remove a reação do usuário no post (idempotente).
+    Retorna True se havia reação para remover.
+    """
+    with transaction.atomic():
+        removidas, _ = Reaction.objects.filter(user=user, post=post, kind=kind).delete()
+        if removidas:
+            incrementar(post, CONTADOR_POR_REACAO[kind], -1)
+    return bool(removidas)
+
+
+def posts_reagidos(user, posts, kind=Reaction.LIKE):
+    """
+    Retorna o conjunto de ids, dentre os posts informados, em que o usuário reagiu.
+    Uma única consulta para a página inteira.
+    """
+    ids = [post.id for post in posts]
+    if not ids or not user.is_authenticated:
+        return set()
+    return set(
+        Reaction.objects.filter(user=user, kind=kind, post_id__in=ids).values_list('post_id', flat=True)
+    )
+
+
+# ====================================== Comentários em árvore =======================================
+def _segmento(pk):
+    return str(pk).zfill(Comments.TAMANHO_SEGMENTO)
+
+
+def _proximo_prefixo(path):
+    # menor caminho que não começa com path (ex.: 000000000012 -> 000000000013).
+    # Só dígitos, então a comparação é a mesma em qualquer collation.
+    return str(int(path) + 1).zfill(len(path))
+
+
+def montar_arvore(comentarios):
+    """
+    Monta a árvore em O(n) a partir de uma lista de comentários ordenada por path.
+    Cada comentário ganha a lista `respostas`; retorna os comentários raiz.
+    """
+    por_id = {}
+    raizes = []
+    for comentario in comentarios:
+        comentario.respostas = []
+        por_id[comentario.id] = comentario
+        pai = por_id.get(comentario.parent_comment_id)
+        if pai is None:
+            raizes.append(comentario)
+        else:
+            pai.respostas.append(comentario)
+    return raizes
+
+
+def carregar_arvore(post):
+    """
+    Carrega todos os comentários do post em uma consulta e retorna as raízes da árvore.
+    """
+    comentarios = Comments.objects.filter(post=post).select_related('author').order_by('path')
+    return montar_arvore(comentarios)
+
+
+def carregar_subarvore(comentario):
+    """
+    Carrega um comentário e todas as suas respostas, em qualquer profundidade, pelo prefixo de path.
+    """
+    comentarios = (
+        Comments.objects.filter(
+            post_id=comentario.post_id,
+            path__gte=comentario.path,
+            path__lt=_proximo_prefixo(comentario.path),
+        )
+        .annotate(num_respostas=Count('replies'))
+        .select_related('author')
+        .order_by('path')
+    )
+    return montar_arvore(comentarios)[0]
+
+
+def carregar_threads(post, cursor=None, tamanho_pagina=None, profundidade_maxima=None):
+    """
+    Retorna uma página de threads do post (raizes, proximo_cursor) em uma única consulta.
+    As raízes vêm das mais novas para as mais antigas; as respostas, até profundidade_maxima,
+    em ordem cronológica. Cada comentário vem com num_respostas (respostas diretas).
+    """
+    tamanho_pagina = tamanho_pagina or settings.COMENTARIOS_POR_PAGINA
+    if profundidade_maxima is None:
+        profundidade_maxima = settings.COMENTARIOS_PROFUNDIDADE_MAXIMA
+
+    # subquery com o path dos comentários raiz da página (um a mais para saber se há próxima)
+    raizes = aplicar_cursor(
+        Comments.objects.filter(post=post, parent_comment__isnull=True),
+        cursor,
+    ).values('path')[:tamanho_pagina + 1]
+
+    comentarios = (
+        Comments.objects.filter(post=post, depth__lte=profundidade_maxima)
+        .annotate(raiz=Substr('path', 1, Comments.TAMANHO_SEGMENTO))
+        .filter(raiz__in=Subquery(raizes))
+        # quantidade de respostas diretas de cada comentário, na mesma consulta
+        .annotate(num_respostas=Count('replies'))
+        .select_related('author')
+        .order_by('path')
+    )
+
+    threads = sorted(montar_arvore(comentarios), key=lambda c: (c.created_at, c.id), reverse=True)
+    tem_mais = len(threads) > tamanho_pagina
+    threads = threads[:tamanho_pagina]
+
+    proximo_cursor = codificar_cursor(threads[-1].created_at, threads[-1].id) if tem_mais else None
+    return threads, proximo_cursor
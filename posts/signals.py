@@ -0,0 +1,41 @@
+from django.db.models.signals import post_save, post_delete
+from django.conf import settings
+from django.dispatch import receiver
+from .models import Post, Comments
+from . import fragment_cache
+from . import search
+
+
+# invalida o card do post sempre que ele é salvo
+@receiver(post_save, sender=Post)
+def invalidar_card_post(sender, instance, **kwargs):
+    fragment_cache.invalidar('post', instance.pk)
+
+
+# invalida o card do comentário salvo e, em uma resposta nova, o do comentário pai (num_respostas mudou)
+@receiver(post_save, sender=Comments)
+def invalidar_card_comentario(sender, instance, created, **kwargs):
+    fragment_cache.invalidar('comments', instance.pk)
+    if created and instance.parent_comment_id:
+        fragment_cache.invalidar('comments', instance.parent_comment_id)
+
+
+# o card mostra o username do autor: uma troca invalida todos os cards dele (a versão do autor faz parte da chave)
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidar_cards_do_autor(sender, instance, created, update_fields=None, **kwargs):
+    if not created and (update_fields is None or 'username' in update_fields):
+        fragment_cache.invalidar('autor', instance.pk)
+
+
+# mantém o índice de busca atualizado a cada criação/edição (só quando o conteúdo pode ter mudado)
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=Comments)
+def indexar_busca(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is None or 'content' in update_fields:
+        search.indexar(instance, novo=created)
+
+
+@receiver(post_delete, sender=Post)
+@receiver(post_delete, sender=Comments)
+def remover_da_busca(sender, instance, **kwargs):
+    search.remover(instance)
@@ -0,0 +1,207 @@
+import logging
+import os
+import shutil
+import tempfile
+from pathlib import PurePosixPath
+from celery import shared_task
+from django.apps import apps
+from django.conf import settings
+from django.core.files import File
+from comuna.imagens import gerar_variantes
+from users.models import Follow
+from .models import Post, TimelineEntry, VIDEO_PRONTO, VIDEO_ERRO
+from .counters import descarregar_contadores
+from . import fragment_cache
+from . import uploads
+from .transcoding import TranscodificacaoErro, obter_transcodificador
+
+logger = logging.getLogger(__name__)
+
+
+def _inserir_em_lotes(entradas):
+    # insere as entradas em lotes, ignorando as que já existem (unique_timeline_post)
+    TimelineEntry.objects.bulk_create(
+        entradas,
+        batch_size=settings.TIMELINE_FANOUT_LOTE,
+        ignore_conflicts=True,
+    )
+
+
+# ====================================== Fan-out na escrita =======================================
+@shared_task
+def distribuir_post(post_id):
+    """
+    Copia o post para a timeline de cada seguidor do autor.
+    """
+    post = Post.objects.filter(id=post_id).values('id', 'author_id', 'created_at').first()
+    if post is None:
+        return 0
+
+    seguidores = Follow.objects.filter(seguindo_id=post['author_id']).values_list('seguidor_id', flat=True)
+
+    total = 0
+    lote = []
+    # percorre os seguidores sem carregar todos na memória
+    for seguidor_id in seguidores.iterator(chunk_size=settings.TIMELINE_FANOUT_LOTE):
+        lote.append(TimelineEntry(owner_id=seguidor_id, post_id=post['id'], created_at=post['created_at']))
+        if len(lote) >= settings.TIMELINE_FANOUT_LOTE:
+            _inserir_em_lotes(lote)
+            total += len(lote)
+            lote = []
+
+    if lote:
+        _inserir_em_lotes(lote)
+        total += len(lote)
+    return total
+
+
+@shared_task
+def preencher_timeline(seguidor_id, seguindo_id):
+    """
+    Ao seguir alguém, traz os posts mais recentes dessa conta para a timeline do seguidor.
+    """
+    posts = (
+        Post.objects.filter(author_id=seguindo_id)
+        .order_by('-created_at', '-id')
+        .values('id', 'created_at')[:settings.TIMELINE_BACKFILL]
+    )
+    _inserir_em_lotes([
+        TimelineEntry(owner_id=seguidor_id, post_id=post['id'], created_at=post['created_at'])
+        for post in posts
+    ])
+
+
+@shared_task
+def preencher_timeline_varios(seguidor_id, seguindo_ids):
+    """
+    Versão em lote do preencher_timeline (seguir vários usuários de uma vez).
+    """
+    for seguindo_id in seguindo_ids:
+        preencher_timeline(seguidor_id, seguindo_id)
+
+
+@shared_task
+def limpar_timeline(seguidor_id, seguindo_id):
+    """
+    Ao deixar de seguir alguém, remove os posts dessa conta da timeline do seguidor.
+    """
+    TimelineEntry.objects.filter(owner_id=seguidor_id, post__author_id=seguindo_id).delete()
+
+
+@shared_task
+def limpar_timeline_varios(seguidor_id, seguindo_ids):
+    """
+    Versão em lote do limpar_timeline, com um único DELETE.
+    """
+    TimelineEntry.objects.filter(owner_id=seguidor_id, post__author_id__in=seguindo_ids).delete()
+
+
+# ====================================== Contadores =======================================
+@shared_task
+def descarregar_contadores_pendentes():
+    """
+    Grava em lote os incrementos de contadores acumulados no cache (posts quentes).
+    """
+    return descarregar_contadores()
+
+
+# ====================================== Imagens =======================================
+@shared_task
+def processar_imagem(label, pk):
+    """
+    Gera as variantes (thumb/feed/full, WebP e JPEG, sem EXIF) da imagem de um Post ou Comments.
+    """
+    modelo = apps.get_model(label)
+    obj = modelo.objects.filter(pk=pk).only('id', 'image').first()
+    if obj is None or not obj.image:
+        return None
+
+    try:
+        variantes = gerar_variantes(obj.image)
+    except ValueError:
+        logger.warning('Não foi possível processar a imagem de %s %s.', label, pk)
+        return None
+
+    modelo.objects.filter(pk=pk).update(image_variants=variantes)
+    # o card passa a usar as variantes
+    fragment_cache.invalidar(modelo._meta.model_name, pk)
+    return variantes
+
+
+# ====================================== Vídeos =======================================
+def _salvar_no_campo(modelo, obj, campo, caminho, nome):
+    # grava o arquivo gerado no storage, no upload_to do campo, sem salvar o modelo
+    nome = modelo._meta.get_field(campo).generate_filename(obj, nome)
+    with open(caminho, 'rb') as arquivo:
+        return obj.video.storage.save(nome, File(arquivo))
+
+
+def _marcar_erro(modelo, pk):
+    # o card troca o aviso de processamento pela mensagem de erro
+    modelo.objects.filter(pk=pk).update(video_status=VIDEO_ERRO)
+    fragment_cache.invalidar(modelo._meta.model_name, pk)
+
+
+def _gerar_versoes(modelo, obj):
+    # baixa (se preciso) o original, transcodifica e grava a versão para web e o poster no storage
+    stem = PurePosixPath(obj.video.name).stem
+    transcodificador = obter_transcodificador()
+    with tempfile.TemporaryDirectory() as pasta:
+        try:
+            origem = obj.video.path
+        except NotImplementedError:
+            # storage remoto: baixa o original em partes para um arquivo local
+            origem = os.path.join(pasta, 'origem')
+            with obj.video.open('rb') as entrada, open(origem, 'wb') as saida:
+                shutil.copyfileobj(entrada, saida)
+
+        web = os.path.join(pasta, f'web.{transcodificador.extensao_video}')
+        poster = os.path.join(pasta, f'poster.{transcodificador.extensao_poster}')
+        transcodificador.transcodificar(origem, web)
+        transcodificador.extrair_poster(origem, poster)
+
+        return {
+            'video_web': _salvar_no_campo(modelo, obj, 'video_web', web, f'{stem}.{transcodificador.extensao_video}'),
+            'video_poster': _salvar_no_campo(modelo, obj, 'video_poster', poster, f'{stem}.{transcodificador.extensao_poster}'),
+        }
+
+
+@shared_task(bind=True)
+def processar_video(self, label, pk):
+    """
+    Gera a versão para web e o poster do vídeo de um Post ou Comments com o transcodificador configurado.
+    Vídeo inválido (TranscodificacaoErro) vira VIDEO_ERRO na hora; outras falhas (storage, disco...) são
+    tentadas de novo até VIDEOS_RETENTATIVAS vezes antes de virar VIDEO_ERRO. Nunca fica pendente para sempre.
+    """
+    modelo = apps.get_model(label)
+    obj = modelo.objects.filter(pk=pk).only('id', 'video').first()
+    if obj is None or not obj.video:
+        return None
+
+    try:
+        campos = _gerar_versoes(modelo, obj)
+    except TranscodificacaoErro as e:
+        logger.warning('Falha ao processar o vídeo de %s %s: %s', label, pk, e)
+        _marcar_erro(modelo, pk)
+        return None
+    except Exception as e:
+        if self.request.retries < settings.VIDEOS_RETENTATIVAS:
+            logger.warning('Erro ao processar o vídeo de %s %s, tentando de novo: %s', label, pk, e)
+            raise self.retry(exc=e, countdown=settings.VIDEOS_RETENTATIVA_ESPERA * 2 ** self.request.retries)
+        logger.exception('Desistindo do vídeo de %s %s depois de %d tentativas.', label, pk, self.request.retries + 1)
+        _marcar_erro(modelo, pk)
+        return None
+
+    modelo.objects.filter(pk=pk).update(video_status=VIDEO_PRONTO, **campos)
+    # o card troca o aviso de processamento pelo player
+    fragment_cache.invalidar(modelo._meta.model_name, pk)
+    return campos
+
+
+# ====================================== Uploads =======================================
+@shared_task
+def apagar_uploads_expirados():
+    """
+    Remove os uploads retomáveis abandonados (e as partes já gravadas).
+    """
+    return uploads.apagar_uploads_expirados()
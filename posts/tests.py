@@ -5,12 +5,67 @@
 # - Criação de posts (sucesso e falha)
 # - Carregamento da página de detalhes do post
 # - Criação de comentários (sucesso e falha)
+# - Paginação por cursor do feed
+# - Timeline materializada (fan-out na escrita e na leitura)
+# - Contadores de engajamento (atômicos e acumulados no cache)
+# - Curtidas e compartilhamentos
+# - Comentários em árvore (caminho materializado)
+# - Cache de fragmentos dos cards
+# - Variantes das imagens enviadas
+# - Limites de upload e upload retomável de vídeo
+# - Processamento de vídeo (versão para web e poster)
+# - Views assíncronas do feed e do post
+# - Busca textual em posts e comentários
+# - Menções (@username) nos posts
+# - Leituras nas réplicas com leitura do primário depois de escrever
+# - Orçamento de consultas por requisição
+# - Benchmark das views principais
 
-from django.test import TestCase, Client
+from django.test import TestCase, TransactionTestCase, Client
+from django.core.management import call_command
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from concurrent.futures import ThreadPoolExecutor
 from django.contrib.auth import get_user_model
-from .models import Post, Comments
+from users.services import seguir
+from users.models import Follow
+from users.cache import buscar_usuario_por_username
+from django.conf import settings
+import time
+from .models import Post, Comments, TimelineEntry, Reaction, UploadParcial
+from .services import (
+    criar_post, criar_comentario, listar_timeline, reagir, remover_reacao, posts_reagidos,
+    carregar_arvore, carregar_subarvore, carregar_threads,
+)
+from .tasks import distribuir_post, preencher_timeline, limpar_timeline, processar_imagem, processar_video
+from .transcoding import TranscodificadorStub, TranscodificacaoErro
+from .uploads import iniciar_upload, descartar_upload
+from .models import VIDEO_PENDENTE, VIDEO_PRONTO, VIDEO_ERRO
+from .counters import incrementar, descarregar_contadores
+from . import fragment_cache
 from datetime import date
+from io import BytesIO, StringIO
+import os
+import shutil
+import tempfile
+from PIL import Image
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings, RequestFactory
+from django.http import Http404
+from asgiref.sync import async_to_sync
+from unittest import mock
+from . import views
+from . import tasks
+from . import search
 from django.urls import reverse
+from django.http import HttpResponse
+from comuna.routers import ReplicaRouter, ler_das_replicas, usar_primario
+from comuna.middleware import ReplicaMiddleware, OrcamentoConsultasMiddleware, COOKIE_PRIMARIO
+from comuna.consultas import registrar_consultas, limitar_consultas, orcamento_consultas, OrcamentoExcedido
+from comuna.benchmark import popular, medir, percentil
 
 User = get_user_model()
 
@@ -74,4 +129,951 @@ class PostDetailViewTest(TestCase):
             'content': ''
         })
         self.assertEqual(response.status_code, 302)  # Redireciona mesmo em caso de erro
-        self.assertFalse(Comments.objects.filter(content='').exists())
\ No newline at end of file
+        self.assertFalse(Comments.objects.filter(content='').exists())
+
+
+class FeedPaginacaoTest(TestCase):
+    def setUp(self):
+        # Um autor com alguns posts, dois deles com a mesma data para testar o desempate por id, e um seguidor
+        self.autor = User.objects.create_user(username='autor', email='autor@example.com', password='123456', data_nascimento=date(2000, 1, 1))
+        self.user = User.objects.create_user(username='testuser', email='test@example.com', password='123456', data_nascimento=date(2000, 1, 1))
+        seguir(self.user, self.autor)
+        self.posts = [Post.objects.create(author=self.autor, content=f'Post {i}') for i in range(5)]
+        Post.objects.filter(id__in=[self.posts[1].id, self.posts[2].id]).update(created_at=self.posts[1].created_at)
+        for post in self.posts:
+            distribuir_post(post.id)
+        self.esperado = list(Post.objects.order_by('-created_at', '-id'))
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def _percorrer(self, pagina):
+        # percorre a timeline página a página (pagina(cursor) -> (posts, proximo_cursor))
+        vistos = []
+        cursor = None
+        while True:
+            posts, cursor = pagina(cursor)
+            self.assertLessEqual(len(posts), 2)
+            vistos.extend(posts)
+            if cursor is None:
+                return vistos
+
+    def test_paginas_cobrem_todos_os_posts_sem_repetir(self):
+        # ordem (created_at, id) decrescente, na timeline materializada...
+        self.assertEqual(self._percorrer(lambda cursor: listar_timeline(self.user, cursor=cursor, tamanho_pagina=2)), self.esperado)
+        # ...e com o autor como conta popular (fan-out na leitura junto com as entradas já distribuídas)
+        with self.settings(TIMELINE_FANOUT_LIMITE=0):
+            self.assertEqual(self._percorrer(lambda cursor: listar_timeline(self.user, cursor=cursor, tamanho_pagina=2)), self.esperado)
+
+    def test_feed_view_retorna_proximo_cursor(self):
+        # A view expõe o cursor opaco da próxima página, percorre o feed inteiro e aceita cursor inválido
+        def pagina(cursor):
+            response = self.client.get(reverse('home'), {'cursor': cursor} if cursor else {})
+            return list(response.context['posts']), response.context['proximo_cursor']
+
+        with self.settings(FEED_PAGE_SIZE=2):
+            self.assertEqual(self._percorrer(pagina), self.esperado)
+
+            response = self.client.get(reverse('home'), {'cursor': 'invalido'})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(list(response.context['posts']), self.esperado[:2])
+
+
+class TimelineTest(TestCase):
+    def setUp(self):
+        # Cria um autor, um seguidor dele e um usuário que não segue ninguém
+        self.autor = User.objects.create_user(username='autor', email='autor@example.com', password='123456', data_nascimento=date(2000, 1, 1))
+        self.seguidor = User.objects.create_user(username='seguidor', email='seguidor@example.com', password='123456', data_nascimento=date(2000, 1, 1))
+        self.outro = User.objects.create_user(username='outro', email='outro@example.com', password='123456', data_nascimento=date(2000, 1, 1))
+        seguir(self.seguidor, self.autor)
+        self.autor.refresh_from_db()
+
+    def test_fan_out_entrega_apenas_para_seguidores(self):
+        # O post vai para a timeline do autor e dos seguidores, e de mais ninguém
+        post = criar_post(author=self.autor, content='Olá seguidores')
+        self.assertEqual(distribuir_post(post.id), 1)
+
+        self.assertEqual(listar_timeline(self.autor)[0], [post])
+        self.assertEqual(listar_timeline(self.seguidor)[0], [post])
+        self.assertEqual(listar_timeline(self.outro)[0], [])
+
+    def test_conta_popular_usa_fan_out_na_leitura(self):
+        # Acima do limite não há fan-out, mas o seguidor continua vendo o post
+        with self.settings(TIMELINE_FANOUT_LIMITE=0):
+            post = criar_post(author=self.autor, content='Post de conta popular')
+            self.assertFalse(TimelineEntry.objects.filter(owner=self.seguidor).exists())
+            self.assertEqual(listar_timeline(self.seguidor)[0], [post])
+
+    def test_seguir_e_deixar_de_seguir_atualizam_timeline(self):
+        # Seguir traz os posts recentes, deixar de seguir remove
+        post = criar_post(author=self.autor, content='Post antigo')
+        preencher_timeline(self.outro.id, self.autor.id)
+        self.assertEqual(listar_timeline(self.outro)[0], [post])
+
+        limpar_timeline(self.outro.id, self.autor.id)
+        self.assertEqual(listar_timeline(self.outro)[0], [])
+
+    def test_comando_preenche_timelines_de_dados_antigos(self):
+        # Posts criados antes do fan-out (sem entradas) passam a aparecer, sem duplicar ao repetir o comando
+        antigo = Post.objects.create(author=self.autor, content='Post de antes da timeline')
+        call_command('preencher_timelines', lote=1, stdout=StringIO())
+        call_command('preencher_timelines', lote=1, stdout=StringIO())
+
+        self.assertEqual(listar_timeline(self.autor)[0], [antigo])
+        self.assertEqual(listar_timeline(self.seguidor)[0], [antigo])
+        self.assertEqual(listar_timeline(self.outro)[0], [])
+        self.assertEqual(TimelineEntry.objects.filter(post=antigo).count(), 2)
+
+
+
+class CacheSemSinal(LocMemCache):
+    """Cache de teste com os contadores do Memcached: decr para em 0 e incr negativo falha"""
+    def incr(self, key, delta=1, version=None):
+        if delta < 0:
+            raise ValueError('incr negativo')
+        return super().incr(key, delta, version)
+
+    def decr(self, key, delta=1, version=None):
+        valor = self.get(key, version=version)
+        if valor is None:
+            raise ValueError(f"Key '{key}' not found")
+        novo = max(valor - delta, 0)
+        self.set(key, novo, version=version)
+        return novo
+
+
+class ContadoresTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', email='test@example.com', password='123456', data_nascimento=date(2000, 1, 1))
+        self.post = Post.objects.create(author=self.user, content='Post de teste')
+
+    def test_incremento_direto_no_banco(self):
+        # Fora do modo quente o incremento vai direto para o banco, só na coluna tocada
+        with self.assertNumQueries(1):
+            incrementar(self.post, 'likes_count')
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 1)
+
+    def test_campo_invalido(self):
+        # Comments não tem comments_count
+        comentario = Comments.objects.create(post=self.post, author=self.user, content='Comentário')
+        with self.assertRaises(ValueError):
+            incrementar(comentario, 'comments_count')
+
+    @mock.patch('posts.counters._cache_compartilhado', return_value=True)
+    def test_post_quente_acumula_no_cache(self, _):
+        # Acima do limite os incrementos ficam no cache até a descarga
+        with self.settings(CONTADORES_LIMITE_QUENTE=0):
+            for _ in range(5):
+                incrementar(self.post, 'shares_count')
+            incrementar(self.post, 'shares_count', -1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.shares_count, 0)
+
+        self.assertEqual(descarregar_contadores(), 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.shares_count, 4)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'posts.tests.CacheSemSinal', 'LOCATION': 'sem-sinal'}})
+    @mock.patch('posts.counters._cache_compartilhado', return_value=True)
+    def test_descurtir_post_quente_com_contadores_sem_sinal(self, _):
+        # Decrementos em um post quente não se perdem com um cache de contadores sem sinal (Memcached)
+        Post.objects.filter(pk=self.post.pk).update(likes_count=10)
+        with self.settings(CONTADORES_LIMITE_QUENTE=0):
+            incrementar(self.post, 'likes_count')
+            for _ in range(3):
+                incrementar(self.post, 'likes_count', -1)
+        self.assertEqual(descarregar_contadores(), 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 8)
+
+        # o que já foi descarregado não volta na próxima descarga
+        self.assertEqual(descarregar_contadores(), 0)
+
+    @mock.patch('posts.counters._cache_compartilhado', return_value=True)
+    def test_objeto_frio_custa_uma_ida_ao_cache(self, _):
+        # Depois do primeiro incremento da janela, medir o calor é só um incr
+        incrementar(self.post, 'likes_count')
+        with mock.patch.object(caches['default'], 'add') as add, mock.patch.object(caches['default'], 'incr', wraps=caches['default'].incr) as incr:
+            incrementar(self.post, 'likes_count')
+        add.assert_not_called()
+        self.assertEqual(incr.call_count, 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 2)
+
+    def test_cache_local_grava_direto_no_banco(self):
+        # Com LocMemCache (um cache por processo) o worker que descarrega não veria o buffer dos processos web
+        with self.settings(CONTADORES_LIMITE_QUENTE=0):
+            for _ in range(3):
+                incrementar(self.post, 'likes_count')
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 3)
+        self.assertEqual(descarregar_contadores(), 0)
+
+    def test_criar_comentario_incrementa_post(self):
+        # O comentário é contado sem salvar o post inteiro
+        self.client.force_login(self.user)
+        self.client.post(reverse('post_detail', args=[self.user.username, self.post.id]), {'content': 'Comentário'})
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 1)
+
+
+class ContadoresConcorrenciaTest(TransactionTestCase):
+    THREADS = 8
+    INCREMENTOS = 25
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', email='test@example.com', password='123456', data_nascimento=date(2000, 1, 1))
+        self.post = Post.objects.create(author=self.user, content='Post viral')
+
+    def _incrementar_em_paralelo(self):
+        def trabalho(_):
+            try:
+                for _ in range(self.INCREMENTOS):
+                    incrementar(self.post, 'likes_count')
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.THREADS) as executor:
+            list(executor.map(trabalho, range(self.THREADS)))
+
+    def test_nenhum_incremento_perdido_no_banco(self):
+        # Requisições paralelas gravando direto no banco
+        with self.settings(CONTADORES_LIMITE_QUENTE=10 ** 6):
+            self._incrementar_em_paralelo()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, self.THREADS * self.INCREMENTOS)
+
+    @mock.patch('posts.counters._cache_compartilhado', return_value=True)
+    def test_nenhum_incremento_perdido_com_cache(self, _):
+        # Requisições paralelas em um post quente, com descargas acontecendo no meio
+        with self.settings(CONTADORES_LIMITE_QUENTE=10):
+            with ThreadPoolExecutor(max_workers=1) as descarga:
+                futuro = descarga.submit(self._incrementar_em_paralelo)
+                while not futuro.done():
+                    descarregar_contadores()
+                futuro.result()
+        descarregar_contadores()
+        connection.close()
+
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, self.THREADS * self.INCREMENTOS)
+
+
+
+class ReacoesTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', email='test@example.com', password='123456', data_nascimento=date(2000, 1, 1))
+        self.posts = [Post.objects.create(author=self.user, content=f'Post {i}') for i in range(3)]
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def test_reagir_e_idempotente(self):
+        # Curtir duas vezes conta uma curtida; descurtir duas vezes remove uma
+        post = self.posts[0]
+        self.assertTrue(reagir(self.user, post, Reaction.LIKE))
+        self.assertFalse(reagir(self.user, post, Reaction.LIKE))
+        post.refresh_from_db()
+        self.assertEqual(post.likes_count, 1)
+
+        self.assertTrue(remover_reacao(self.user, post, Reaction.LIKE))
+        self.assertFalse(remover_reacao(self.user, post, Reaction.LIKE))
+        post.refresh_from_db()
+        self.assertEqual(post.likes_count, 0)
+
+    def test_posts_reagidos_em_uma_consulta(self):
+        # "Quais destes posts eu curti?" custa uma consulta para a página inteira
+        reagir(self.user, self.posts[0], Reaction.LIKE)
+        reagir(self.user, self.posts[2], Reaction.SHARE)
+        with self.assertNumQueries(1):
+            curtidos = posts_reagidos(self.user, self.posts)
+        self.assertEqual(curtidos, {self.posts[0].id})
+
+    def test_endpoints_de_reacao(self):
+        # Os endpoints só aceitam POST e respondem JSON
+        post = self.posts[1]
+        url = reverse('compartilhar_post', args=[post.id])
+        self.assertEqual(self.client.get(url).status_code, 405)
+
+        response = self.client.post(url)
+        self.assertEqual(response.json(), {'post_id': post.id, 'ativo': True, 'alterado': True})
+        response = self.client.post(url)
+        self.assertFalse(response.json()['alterado'])
+
+        post.refresh_from_db()
+        self.assertEqual(post.shares_count, 1)
+
+
+
+class ComentariosArvoreTest(TestCase):
+    def setUp(self):
+        # Monta a árvore: a -> b -> c, e uma segunda thread d
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', email='test@example.com', password='123456', data_nascimento=date(2000, 1, 1))
+        self.post = Post.objects.create(author=self.user, content='Post de teste')
+        self.a = criar_comentario(self.post, self.user, content='a')
+        self.b = criar_comentario(self.post, self.user, content='b', parent_comment=self.a)
+        self.c = criar_comentario(self.post, self.user, content='c', parent_comment=self.b)
+        self.d = criar_comentario(self.post, self.user, content='d')
+
+    def test_caminho_materializado(self):
+        # O path de cada resposta começa com o path do pai
+        self.c.refresh_from_db()
+        self.assertEqual(self.c.depth, 2)
+        self.assertTrue(self.c.path.startswith(self.b.path))
+        self.assertTrue(self.b.path.startswith(self.a.path))
+
+    def test_arvore_completa_em_uma_consulta(self):
+        with self.assertNumQueries(1):
+            raizes = carregar_arvore(self.post)
+            self.assertEqual([c.content for c in raizes], ['a', 'd'])
+            self.assertEqual(raizes[0].respostas[0].respostas[0].content, 'c')
+
+    def test_threads_paginadas_com_profundidade_limitada(self):
+        # Threads mais novas primeiro, respostas limitadas pela profundidade
+        with self.assertNumQueries(1):
+            threads, cursor = carregar_threads(self.post, tamanho_pagina=1, profundidade_maxima=1)
+            self.assertEqual([c.content for c in threads], ['d'])
+
+        threads, cursor = carregar_threads(self.post, cursor=cursor, tamanho_pagina=1, profundidade_maxima=1)
+        self.assertIsNone(cursor)
+        self.assertEqual([c.content for c in threads], ['a'])
+        self.assertEqual([c.content for c in threads[0].respostas], ['b'])
+        self.assertEqual(threads[0].respostas[0].respostas, [])
+
+    def test_subarvore_por_prefixo(self):
+        b = carregar_subarvore(self.b)
+        self.assertEqual(b.content, 'b')
+        self.assertEqual([c.content for c in b.respostas], ['c'])
+
+
+    def test_contagem_de_respostas_precarregada(self):
+        # num_respostas vem anotado na mesma consulta das threads
+        with self.assertNumQueries(1):
+            threads, _ = carregar_threads(self.post)
+            self.assertEqual({c.content: c.num_respostas for c in threads}, {'a': 1, 'd': 0})
+
+    def test_endpoint_carregar_mais(self):
+        self.client.force_login(self.user)
+        url = reverse('carregar_comentarios', args=[self.post.id])
+
+        with self.settings(COMENTARIOS_POR_PAGINA=1):
+            pagina = self.client.get(url).json()
+            self.assertEqual([c['content'] for c in pagina['comentarios']], ['d'])
+
+            pagina = self.client.get(url, {'cursor': pagina['proximo_cursor']}).json()
+            self.assertEqual([c['content'] for c in pagina['comentarios']], ['a'])
+            self.assertIsNone(pagina['proximo_cursor'])
+
+        thread = self.client.get(url, {'comentario': self.b.id}).json()
+        self.assertEqual(thread['comentarios'][0]['respostas'][0]['content'], 'c')
+        self.assertEqual(self.client.get(url, {'cursor': 'x'}).status_code, 400)
+
+
+
+class CacheFragmentosTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', email='test@example.com', password='123456', data_nascimento=date(2000, 1, 1))
+        self.post = criar_post(author=self.user, content='Conteúdo original')
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def test_card_vem_do_cache_ate_a_versao_mudar(self):
+        # Renderiza uma vez, altera o banco sem passar pelo save: o card continua o do cache
+        self.assertContains(self.client.get(reverse('home')), 'Conteúdo original')
+        Post.objects.filter(id=self.post.id).update(content='Conteúdo alterado')
+        self.assertContains(self.client.get(reverse('home')), 'Conteúdo original')
+
+        # Nova versão, novo card
+        fragment_cache.invalidar('post', self.post.id)
+        self.assertContains(self.client.get(reverse('home')), 'Conteúdo alterado')
+
+    def test_contadores_e_save_invalidam_o_card(self):
+        versao = fragment_cache.anotar_versoes('post', [self.post])[0].versao_card
+        incrementar(self.post, 'likes_count')
+        depois_do_contador = fragment_cache.anotar_versoes('post', [self.post])[0].versao_card
+        self.assertNotEqual(depois_do_contador, versao)
+
+        self.post.save()
+        self.assertNotIn(fragment_cache.anotar_versoes('post', [self.post])[0].versao_card, (versao, depois_do_contador))
+
+    def test_versao_removida_do_cache_nao_volta_card_antigo(self):
+        # card guardado na primeira versão, depois invalidado e com a chave da versão despejada do cache
+        cache.clear()
+        self.assertContains(self.client.get(reverse('home')), 'Conteúdo original')
+        Post.objects.filter(id=self.post.id).update(content='Conteúdo alterado')
+        fragment_cache.invalidar('post', self.post.id)
+        cache.delete(fragment_cache._chave_versao('post', self.post.id))
+        self.assertContains(self.client.get(reverse('home')), 'Conteúdo alterado')
+
+    def test_troca_de_username_invalida_os_cards_do_autor(self):
+        comentario = criar_comentario(self.post, self.user, content='comentário do autor')
+        url = reverse('post_detail', args=['testuser', self.post.id])
+        self.assertContains(self.client.get(url), '>testuser</a>', count=2)
+
+        # salvar outros campos não troca a versão do autor
+        versao = fragment_cache.anotar_versoes('post', [self.post])[0].versao_autor
+        self.user.set_password('654321')
+        self.user.save(update_fields=['password'])
+        self.assertEqual(fragment_cache.anotar_versoes('post', [self.post])[0].versao_autor, versao)
+
+        # pela edição do perfil: o card do post e o do comentário saem com o novo username
+        self.client.force_login(self.user)
+        self.client.post(reverse('edit_profile', args=[self.user.id]), {'username': 'renomeado', 'email': 'test@example.com'})
+        response = self.client.get(reverse('post_detail', args=['renomeado', self.post.id]))
+        self.assertContains(response, '>renomeado</a>', count=2)
+        self.assertNotContains(response, 'testuser')
+        self.assertEqual(fragment_cache.anotar_versoes('comments', [comentario])[0].versao_autor,
+                         fragment_cache.anotar_versoes('post', [self.post])[0].versao_autor)
+
+    def test_resposta_invalida_card_do_pai(self):
+        comentario = criar_comentario(self.post, self.user, content='pai')
+        versao = fragment_cache.anotar_versoes('comments', [comentario])[0].versao_card
+        criar_comentario(self.post, self.user, content='filho', parent_comment=comentario)
+        self.assertGreater(fragment_cache.anotar_versoes('comments', [comentario])[0].versao_card, versao)
+
+    def test_post_detail_renderiza_arvore(self):
+        comentario = criar_comentario(self.post, self.user, content='pai')
+        criar_comentario(self.post, self.user, content='filho', parent_comment=comentario)
+        response = self.client.get(reverse('post_detail', args=[self.user.username, self.post.id]))
+        self.assertContains(response, 'filho')
+        self.assertContains(response, '1 respostas')
+
+
+class ImagensVariantesTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media, IMAGENS_VARIANTES={'thumb': 40, 'feed': 100})
+        override.enable()
+        self.addCleanup(override.disable)
+        self.user = User.objects.create_user(username='testuser', email='test@example.com', password='123456', data_nascimento=date(2000, 1, 1))
+
+    def _imagem_com_exif(self):
+        # 300x150 com a tag de orientação 6 (girar 90°) e o modelo da câmera no EXIF
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        exif[0x0110] = 'Camera de teste'
+        buffer = BytesIO()
+        Image.new('RGB', (300, 150), (200, 30, 30)).save(buffer, 'JPEG', exif=exif)
+        return SimpleUploadedFile('foto.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+    def test_gera_variantes_sem_exif_e_com_orientacao(self):
+        post = criar_post(author=self.user, content='com imagem', image=self._imagem_com_exif())
+        variantes = processar_imagem('posts.post', post.id)
+
+        # a orientação foi aplicada: a imagem fica em pé
+        self.assertEqual((variantes['width'], variantes['height']), (150, 300))
+        for nome, lado in (('thumb', 40), ('feed', 100)):
+            self.assertLessEqual(max(variantes[nome]['width'], variantes[nome]['height']), lado)
+            for extensao, formato in (('webp', 'WEBP'), ('jpeg', 'JPEG')):
+                with default_storage.open(variantes[nome][extensao]) as arquivo, Image.open(arquivo) as imagem:
+                    self.assertEqual(imagem.format, formato)
+                    self.assertEqual(len(imagem.getexif()), 0)
+
+        post.refresh_from_db()
+        self.assertEqual(post.image_variants, variantes)
+        self.assertIn('feed', post.imagens)
+
+    def test_original_gravado_sem_exif(self):
+        # O original também é servido (e é o fallback do card): vai para o storage sem EXIF e já em pé
+        post = criar_post(author=self.user, content='com imagem', image=self._imagem_com_exif())
+        with post.image.open('rb') as arquivo, Image.open(arquivo) as imagem:
+            self.assertEqual(len(imagem.getexif()), 0)
+            self.assertEqual(imagem.size, (150, 300))
+
+    def test_imagem_invalida_nao_gera_variantes(self):
+        arquivo = SimpleUploadedFile('falsa.jpg', b'nao sou uma imagem', content_type='image/jpeg')
+        post = criar_post(author=self.user, content='imagem quebrada', image=arquivo)
+        self.assertIsNone(processar_imagem('posts.post', post.id))
+        post.refresh_from_db()
+        self.assertFalse(post.image_variants)
+
+
+class UploadsTest(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        override = override_settings(
+            MEDIA_ROOT=self.media,
+            UPLOADS_PARCIAIS_DIR=f'{self.media}/parciais',
+            UPLOAD_TAMANHO_PARTE=1000,
+            UPLOAD_LIMITES={
+                'imagem': {'tamanho_maximo': 1000, 'tipos': ('image/jpeg',)},
+                'video': {'tamanho_maximo': 2000, 'tipos': ('video/mp4',)},
+            },
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        self.user = User.objects.create_user(username='testuser', email='test@example.com', password='123456', data_nascimento=date(2000, 1, 1))
+        self.post = criar_post(author=self.user, content='Post de teste')
+        self.client = Client()
+        self.client.force_login(self.user)
+        self.url = reverse('post_detail', args=[self.user.username, self.post.id])
+
+    def _comentar(self, **dados):
+        return self.client.post(self.url, {'content': 'comentário com vídeo', **dados})
+
+    def test_video_acima_do_limite_e_interrompido(self):
+        video = SimpleUploadedFile('grande.mp4', b'0' * 3000, content_type='video/mp4')
+        response = self._comentar(video=video)
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Comments.objects.exists())
+        self.assertIn('limite', str(list(response.wsgi_request._messages)[0]))
+
+    def test_tipo_nao_permitido_e_recusado(self):
+        video = SimpleUploadedFile('virus.exe', b'0' * 100, content_type='application/x-msdownload')
+        self._comentar(video=video)
+        self.assertFalse(Comments.objects.exists())
+
+    def test_video_dentro_do_limite_e_salvo(self):
+        video = SimpleUploadedFile('curto.mp4', b'0' * 1500, content_type='video/mp4')
+        self._comentar(video=video)
+        self.assertEqual(Comments.objects.get().video.size, 1500)
+
+    @override_settings(CONSULTAS_ORCAMENTO_ESTRITO=True)
+    def test_upload_retomavel(self):
+        response = self.client.post(reverse('iniciar_upload_video'), {'nome': 'longo.mp4', 'tipo': 'video/mp4', 'tamanho': 1500})
+        self.assertEqual(response.status_code, 201)
+        upload_id = response.json()['upload_id']
+        url = reverse('upload_video', args=[upload_id])
+
+        def enviar(dados, offset):
+            return self.client.post(url, dados, content_type='application/octet-stream', headers={'Upload-Offset': str(offset)})
+
+        self.assertEqual(enviar(b'a' * 1000, 0).json()['recebido'], 1000)
+        # offset errado (parte repetida): o servidor informa de onde continuar
+        response = enviar(b'a' * 1000, 0)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['recebido'], 1000)
+        self.assertTrue(enviar(b'b' * 500, 1000).json()['concluido'])
+
+        self._comentar(upload_id=upload_id)
+        comentario = Comments.objects.get()
+        with comentario.video.open('rb') as arquivo:
+            self.assertEqual(arquivo.read(), b'a' * 1000 + b'b' * 500)
+        self.assertFalse(UploadParcial.objects.exists())
+
+    def test_descartar_upload_com_um_delete(self):
+        upload = iniciar_upload(self.user, 'longo.mp4', 'video/mp4', 1500)
+        caminho = f'{settings.UPLOADS_PARCIAIS_DIR}/{upload.id}.parte'
+        self.assertTrue(os.path.exists(caminho))
+
+        # sem SELECT antes: o arquivo é achado pelo id e a linha sai com um único DELETE
+        with self.assertNumQueries(1):
+            descartar_upload(str(upload.id))
+        self.assertFalse(UploadParcial.objects.exists())
+        self.assertFalse(os.path.exists(caminho))
+
+        # upload já descartado (ou nunca criado): nada a fazer
+        with self.assertNumQueries(1):
+            descartar_upload(upload.id)
+
+    def test_upload_incompleto_nao_e_usado(self):
+        response = self.client.post(reverse('iniciar_upload_video'), {'nome': 'longo.mp4', 'tipo': 'video/mp4', 'tamanho': 1500})
+        self._comentar(upload_id=response.json()['upload_id'])
+        self.assertFalse(Comments.objects.exists())
+
+    def test_upload_id_malformado(self):
+        # id que não é UUID: mensagem de erro, não 500
+        response = self._comentar(upload_id='abc')
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Comments.objects.exists())
+        self.assertIn('Upload não encontrado', str(list(response.wsgi_request._messages)[0]))
+
+    def test_upload_retomavel_respeita_limites(self):
+        response = self.client.post(reverse('iniciar_upload_video'), {'nome': 'enorme.mp4', 'tipo': 'video/mp4', 'tamanho': 5000})
+        self.assertEqual(response.status_code, 400)
+
+
+class TranscodificadorQuebrado(TranscodificadorStub):
+    def transcodificar(self, origem, destino):
+        raise TranscodificacaoErro('codec desconhecido')
+
+
+class VideosTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media, VIDEOS_TRANSCODIFICADOR='posts.transcoding.TranscodificadorStub')
+        override.enable()
+        self.addCleanup(override.disable)
+        self.user = User.objects.create_user(username='testuser', email='test@example.com', password='123456', data_nascimento=date(2000, 1, 1))
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def _post_com_video(self):
+        video = SimpleUploadedFile('clipe.mov', b'video original', content_type='video/quicktime')
+        return criar_post(author=self.user, content='com vídeo', video=video)
+
+    def test_feed_mostra_aviso_enquanto_processa(self):
+        post = self._post_com_video()
+        self.assertEqual(post.video_status, VIDEO_PENDENTE)
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, 'Vídeo em processamento')
+        self.assertNotContains(response, post.video.url)
+
+    def test_gera_versao_web_e_poster(self):
+        post = self._post_com_video()
+        processar_video('posts.post', post.id)
+
+        post.refresh_from_db()
+        self.assertEqual(post.video_status, VIDEO_PRONTO)
+        self.assertTrue(post.video_web.name.startswith('posts/videos/web/'))
+        with post.video_web.open('rb') as arquivo:
+            self.assertEqual(arquivo.read(), b'video original')
+        with post.video_poster.open('rb') as arquivo, Image.open(arquivo) as poster:
+            self.assertEqual(poster.format, 'JPEG')
+
+        # o card foi invalidado e passa a usar a versão para web com o poster
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, post.video_web.url)
+        self.assertContains(response, post.video_poster.url)
+
+    @override_settings(VIDEOS_TRANSCODIFICADOR='posts.tests.TranscodificadorQuebrado')
+    def test_falha_marca_erro_e_mantem_original(self):
+        post = self._post_com_video()
+        self.assertIsNone(processar_video('posts.post', post.id))
+        post.refresh_from_db()
+        self.assertEqual(post.video_status, VIDEO_ERRO)
+        self.assertContains(self.client.get(reverse('home')), post.video.url)
+
+    @override_settings(VIDEOS_RETENTATIVAS=2)
+    def test_falha_no_storage_tenta_de_novo_e_marca_erro(self):
+        post = self._post_com_video()
+        self.assertContains(self.client.get(reverse('home')), 'Vídeo em processamento')
+
+        with mock.patch('posts.tasks._salvar_no_campo', side_effect=OSError('disco cheio')) as salvar:
+            processar_video.apply(args=['posts.post', post.id])
+
+        # a tentativa original mais as duas novas, depois desiste em vez de ficar pendente
+        self.assertEqual(salvar.call_count, 3)
+        post.refresh_from_db()
+        self.assertEqual(post.video_status, VIDEO_ERRO)
+        response = self.client.get(reverse('home'))
+        self.assertNotContains(response, 'Vídeo em processamento')
+        self.assertContains(response, post.video.url)
+
+    def test_falha_passageira_no_storage_e_recuperada(self):
+        post = self._post_com_video()
+        salvar_de_verdade = tasks._salvar_no_campo
+        falhas = iter([OSError('storage fora do ar')])
+
+        def salvar(*args):
+            for erro in falhas:
+                raise erro
+            return salvar_de_verdade(*args)
+
+        with mock.patch('posts.tasks._salvar_no_campo', side_effect=salvar):
+            processar_video.apply(args=['posts.post', post.id])
+
+        post.refresh_from_db()
+        self.assertEqual(post.video_status, VIDEO_PRONTO)
+        self.assertTrue(post.video_web)
+
+
+class ViewsAsyncTest(TransactionTestCase):
+    # TransactionTestCase: as consultas paralelas usam outras conexões, que precisam ver os dados já gravados
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', email='test@example.com', password='123456', data_nascimento=date(2000, 1, 1))
+        self.autor = User.objects.create_user(username='autor', email='autor@example.com', password='123456', data_nascimento=date(2000, 1, 1))
+        seguir(self.user, self.autor)
+        # sem transação no teste o on_commit roda na hora: o fan-out é feito direto, sem o broker
+        with mock.patch('posts.services.distribuir_post.delay'):
+            self.post = criar_post(author=self.autor, content='Post do autor')
+        distribuir_post(self.post.id)
+        criar_comentario(self.post, self.user, content='Comentário assíncrono')
+        reagir(self.user, self.post, Reaction.LIKE)
+
+    def _get(self, view, *args, cursor=None):
+        request = RequestFactory().get('/', {'cursor': cursor} if cursor else {})
+        request.user = self.user
+
+        async def auser():
+            return self.user
+        request.auser = auser
+        return async_to_sync(view)(request, *args)
+
+    def test_feed_async(self):
+        for paralelas in (True, False):
+            with self.settings(VIEWS_CONSULTAS_PARALELAS=paralelas):
+                response = self._get(views.feed_view_async, cursor='cursor-invalido')
+                self.assertContains(response, 'Post do autor')
+                # estado de curtida calculado depois da página
+                self.assertContains(response, reverse('descurtir_post', args=[self.post.id]))
+
+    def test_post_detail_async(self):
+        for paralelas in (True, False):
+            with self.settings(VIEWS_CONSULTAS_PARALELAS=paralelas):
+                response = self._get(views.post_detail_async, 'autor', self.post.id)
+                self.assertContains(response, 'Comentário assíncrono')
+        with self.assertRaises(Http404):
+            self._get(views.post_detail_async, 'autor', self.post.id + 100)
+
+    def test_consultas_paralelas_reaproveitam_conexoes(self):
+        # com conexões persistentes, as threads fixas do executor não fecham a conexão depois de cada consulta
+        with mock.patch.dict(connections.settings['default'], CONN_MAX_AGE=60), \
+                mock.patch.object(type(connections['default']), 'close', autospec=True) as fechar:
+            self._get(views.feed_view_async)
+            self._get(views.feed_view_async)
+        fechadas_nas_threads = [
+            chamada for chamada in fechar.call_args_list if chamada.args[0] is not connections['default']
+        ]
+        self.assertEqual(fechadas_nas_threads, [])
+
+    @override_settings(VIEWS_CONSULTAS_THREADS=8)
+    def test_executor_criado_no_primeiro_uso_e_limitado_pelo_pool(self):
+        with mock.patch.object(views, '_executor_consultas', None):
+            self.assertEqual(views._threads_consultas(), 8)
+            with mock.patch.dict(connections['default'].settings_dict, OPTIONS={'pool': {'max_size': 4}}):
+                self.assertEqual(views._threads_consultas(), 3)
+                executor = views._executor()
+            self.assertEqual(executor._max_workers, 3)
+            self.assertIs(views._executor(), executor)
+            executor.shutdown()
+
+
+class BuscaTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', email='test@example.com', password='123456', data_nascimento=date(2000, 1, 1))
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def test_resultados_por_relevancia(self):
+        pouco = criar_post(author=self.user, content='Hoje tomei café e fui trabalhar')
+        muito = criar_post(author=self.user, content='Café, café e mais café')
+        criar_post(author=self.user, content='Nada a ver')
+
+        # sem acento também encontra
+        resultados, tem_mais = search.buscar('cafe')
+        self.assertEqual([post.id for post in resultados], [muito.id, pouco.id])
+        self.assertFalse(tem_mais)
+
+        pagina, tem_mais = search.buscar('café', tamanho_pagina=1)
+        self.assertEqual([post.id for post in pagina], [muito.id])
+        self.assertTrue(tem_mais)
+        self.assertEqual([post.id for post in search.buscar('café', pagina=2, tamanho_pagina=1)[0]], [pouco.id])
+
+    def test_indice_atualizado_na_edicao_e_exclusao(self):
+        post = criar_post(author=self.user, content='texto antigo')
+        post.content = 'texto reescrito'
+        post.save()
+        self.assertEqual(search.buscar('antigo')[0], [])
+        self.assertEqual(search.buscar('reescrito')[0], [post])
+
+        post.delete()
+        self.assertEqual(search.buscar('reescrito')[0], [])
+
+    def test_objeto_novo_indexado_sem_apagar_entrada_antiga(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('tabela FTS só existe no SQLite')
+
+        def entradas(post):
+            with connection.cursor() as cursor:
+                cursor.execute(f'SELECT COUNT(*) FROM {search.TABELA_FTS} WHERE tipo = %s AND objeto_id = %s', ['post', post.pk])
+                return cursor.fetchone()[0]
+
+        # na criação (post_save com created=True) o índice recebe só o INSERT
+        with self.assertNumQueries(2):
+            post = Post.objects.create(author=self.user, content='primeira versão')
+        self.assertEqual(entradas(post), 1)
+
+        # na edição a entrada antiga é trocada, sem duplicar
+        post.content = 'segunda versão'
+        post.save()
+        self.assertEqual(entradas(post), 1)
+        self.assertEqual(search.buscar('primeira')[0], [])
+
+    def test_busca_em_comentarios(self):
+        post = criar_post(author=self.user, content='Post qualquer')
+        comentario = criar_comentario(post, self.user, content='Resposta sobre futebol')
+        self.assertEqual(search.buscar('futebol', tipo='comments')[0], [comentario])
+        self.assertEqual(search.buscar('futebol')[0], [])
+
+    def test_sintaxe_do_usuario_nao_quebra_a_busca(self):
+        criar_post(author=self.user, content='Post qualquer')
+        self.assertEqual(search.buscar('"qualquer OR * NEAR(')[0], [])
+
+    def test_view_de_busca(self):
+        criar_post(author=self.user, content='Receita de bolo de cenoura')
+        response = self.client.get(reverse('buscar'), {'q': 'cenoura'})
+        self.assertContains(response, 'Receita de bolo de cenoura')
+        response = self.client.get(reverse('buscar'), {'q': 'cenoura', 'tipo': 'comentarios'})
+        self.assertContains(response, 'Nenhum resultado')
+
+
+class MencoesTest(TestCase):
+    def test_criar_post_registra_mencoes(self):
+        autor = User.objects.create_user(username='autor', email='autor@example.com', password='123456', data_nascimento=date(2000, 1, 1))
+        citado = User.objects.create_user(username='citado', email='citado@example.com', password='123456', data_nascimento=date(2000, 1, 1))
+        post = criar_post(author=autor, content='Olá @citado e @inexistente')
+        self.assertEqual(list(post.mentions.all()), [citado])
+        self.assertEqual(list(citado.mencoes.all()), [post])
+
+
+@override_settings(DB_REPLICAS=['replica_1'], DB_REPLICA_JANELA=5)
+class ReplicasTest(TestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.factory = RequestFactory()
+
+    def _banco_da_requisicao(self, request):
+        # roda o middleware e devolve (banco usado para ler um Post, resposta)
+        usado = []
+
+        def view(request):
+            usado.append(self.router.db_for_read(Post))
+            return HttpResponse()
+
+        response = ReplicaMiddleware(view)(request)
+        return usado[0], response
+
+    def test_router(self):
+        self.assertEqual(self.router.db_for_read(Post), 'default')
+        with ler_das_replicas():
+            self.assertEqual(self.router.db_for_read(Post), 'replica_1')
+            self.assertEqual(self.router.db_for_write(Post), 'default')
+            with usar_primario():
+                self.assertEqual(self.router.db_for_read(Post), 'default')
+        self.assertFalse(self.router.allow_migrate('replica_1', 'posts'))
+
+    def test_get_le_da_replica(self):
+        banco, response = self._banco_da_requisicao(self.factory.get('/'))
+        self.assertEqual(banco, 'replica_1')
+        self.assertNotIn(COOKIE_PRIMARIO, response.cookies)
+
+    def test_le_do_primario_depois_de_escrever(self):
+        banco, response = self._banco_da_requisicao(self.factory.post('/'))
+        self.assertEqual(banco, 'default')
+        self.assertEqual(response.cookies[COOKIE_PRIMARIO]['max-age'], 5)
+
+        # o GET seguinte, ainda dentro da janela, continua no primário
+        request = self.factory.get('/')
+        request.COOKIES[COOKIE_PRIMARIO] = '1'
+        self.assertEqual(self._banco_da_requisicao(request)[0], 'default')
+
+    def test_caches_nao_guardam_leituras_da_replica(self):
+        user = User.objects.create_user(username='replicado', email='replicado@example.com', password='123456', data_nascimento=date(2000, 1, 1))
+        post = Post.objects.create(author=user, content='Post')
+        cache.clear()
+        with ler_das_replicas():
+            # 'replica_1' não existe: se a falta do cache fosse à réplica, a consulta falharia
+            self.assertEqual(buscar_usuario_por_username('replicado'), user)
+
+            # card (ou autor) alterado agora: renderiza sem guardar; alterado antes da janela: guarda
+            fragment_cache.invalidar('post', post.id)
+            self.assertEqual(fragment_cache.anotar_versoes('post', [post])[0].fragmento_timeout, 0)
+            cache.set(fragment_cache._chave_versao('post', post.id), time.time_ns() - 60 * 10 ** 9)
+            cache.set(fragment_cache._chave_versao('autor', user.id), time.time_ns() - 60 * 10 ** 9)
+            self.assertEqual(fragment_cache.anotar_versoes('post', [post])[0].fragmento_timeout, settings.FRAGMENTOS_TIMEOUT)
+
+    @override_settings(DB_REPLICAS=[])
+    def test_sem_replicas(self):
+        self.assertEqual(self._banco_da_requisicao(self.factory.get('/'))[0], 'default')
+
+
+class OrcamentoConsultasTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='leitor', email='leitor@example.com', password='123456', data_nascimento=date(2000, 1, 1))
+        self.autor = User.objects.create_user(username='autor', email='autor@example.com', password='123456', data_nascimento=date(2000, 1, 1))
+        seguir(self.user, self.autor)
+        with mock.patch('posts.services.distribuir_post.delay'):
+            self.posts = [Post.objects.create(author=self.autor, content=f'post {i}') for i in range(5)]
+        for post in self.posts:
+            distribuir_post(post.id)
+        self.client.force_login(self.user)
+
+    def test_detecta_consultas_repetidas(self):
+        with registrar_consultas() as registro:
+            # N+1: um SELECT do autor por post
+            for post in Post.objects.all():
+                post.author.username
+        self.assertEqual(registro.total, 6)
+        self.assertEqual(list(registro.repetidas().values()), [5])
+        with self.assertRaises(OrcamentoExcedido):
+            with limitar_consultas(2):
+                list(Post.objects.all())
+                list(Comments.objects.all())
+                list(Reaction.objects.all())
+
+    def test_str_do_post_nao_consulta_o_banco(self):
+        post = Post.objects.get(pk=self.posts[0].pk)
+        with self.assertNumQueries(0):
+            str(post)
+
+    @override_settings(CONSULTAS_ORCAMENTO_ESTRITO=True)
+    def test_views_dentro_do_orcamento(self):
+        for url in (
+            reverse('home'),
+            reverse('post_detail', args=['autor', self.posts[0].id]),
+            reverse('perfil', args=['autor']),
+            reverse('lista_seguidores', args=['autor']),
+        ):
+            self.assertEqual(self.client.get(url).status_code, 200, url)
+        # comentar tem orçamento próprio de escrita
+        response = self.client.post(reverse('post_detail', args=['autor', self.posts[0].id]), {'content': 'dentro do orçamento'})
+        self.assertEqual(response.status_code, 302)
+        # timeline vazia: o feed cai nos posts populares
+        self.client.force_login(self.autor)
+        self.assertEqual(self.client.get(reverse('home')).status_code, 200)
+
+    def test_escrita_usa_orcamento_proprio(self):
+        middleware = OrcamentoConsultasMiddleware(lambda request: HttpResponse())
+        factory = RequestFactory()
+        com_escrita = orcamento_consultas(6, escrita=9)(lambda request: None)
+        sem_escrita = orcamento_consultas(6)(lambda request: None)
+        for view, metodo, esperado in (
+            (com_escrita, 'get', 6),
+            (com_escrita, 'head', 6),
+            (com_escrita, 'post', 9),
+            (com_escrita, 'delete', 9),
+            # sem orçamento de escrita a view vale o mesmo para ler e escrever
+            (sem_escrita, 'post', 6),
+        ):
+            request = getattr(factory, metodo)('/')
+            middleware.process_view(request, view, (), {})
+            self.assertEqual(request.orcamento_consultas, esperado, (metodo, esperado))
+
+    @override_settings(CONSULTAS_ORCAMENTO=0)
+    def test_loga_requisicao_acima_do_orcamento(self):
+        with self.assertLogs('comuna.consultas', 'WARNING') as logs:
+            self.client.get(reverse('buscar'), {'q': 'post'})
+        self.assertIn('GET /buscar/', logs.output[0])
+
+    @override_settings(CONSULTAS_ORCAMENTO=0, METRICAS_MODO_LEVE=True)
+    def test_modo_leve_desliga_o_orcamento(self):
+        with self.assertNoLogs('comuna.consultas', 'WARNING'):
+            self.client.get(reverse('buscar'), {'q': 'post'})
+        # conexões abertas no modo leve não recebem o wrapper de medição
+        conexao = mock.Mock(execute_wrappers=[])
+        connection_created.send(sender=type(connection), connection=conexao)
+        self.assertEqual(conexao.execute_wrappers, [])
+
+
+@override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+class BenchmarkTest(TestCase):
+    def test_popular_e_medir(self):
+        criados = popular(usuarios=6, seguindo=2, posts=2, comentarios=1)
+        self.assertEqual(criados, {'usuarios': 6, 'follows': 12, 'posts': 12, 'timeline': 24, 'comentarios': 12})
+        self.assertEqual(User.objects.get(username='bench0').following_count, 2)
+
+        resultados = medir(repeticoes=3, aquecimento=1)
+        self.assertEqual(set(resultados), {'feed', 'perfil', 'post_detail', 'seguir', 'deixar_de_seguir', 'comentar'})
+        for resumo in resultados.values():
+            self.assertEqual(resumo['requisicoes'], 3)
+            self.assertEqual(resumo['erros'], 0)
+            self.assertLessEqual(resumo['p50_ms'], resumo['p99_ms'])
+        # seguir e deixar de seguir não mudam o grafo
+        self.assertEqual(Follow.objects.count(), 12)
+
+    def test_percentil(self):
+        valores = list(range(1, 101))
+        self.assertEqual((percentil(valores, 50), percentil(valores, 95), percentil(valores, 99)), (50, 95, 99))
+        self.assertEqual(percentil([7], 99), 7)
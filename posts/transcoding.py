@@ -0,0 +1,91 @@
+import shutil
+import subprocess
+from django.conf import settings
+from django.utils.module_loading import import_string
+from PIL import Image
+
+
+# ====================================== Transcodificação de vídeo =======================================
+# A task processar_video usa o transcodificador configurado em VIDEOS_TRANSCODIFICADOR.
+# Toda implementação recebe caminhos de arquivos locais e levanta TranscodificacaoErro em caso de falha.
+
+class TranscodificacaoErro(Exception):
+    pass
+
+
+class Transcodificador:
+    """
+    Interface: gera a versão para web (MP4 H.264/AAC) e o poster (JPEG) de um vídeo.
+    """
+    extensao_video = 'mp4'
+    extensao_poster = 'jpg'
+
+    def transcodificar(self, origem, destino):
+        raise NotImplementedError
+
+    def extrair_poster(self, origem, destino):
+        raise NotImplementedError
+
+
+class FFmpegTranscodificador(Transcodificador):
+    """
+    Usa o executável do ffmpeg (VIDEOS_FFMPEG), limitando a altura a VIDEOS_ALTURA_MAXIMA.
+    """
+
+    def _executar(self, argumentos):
+        executavel = shutil.which(settings.VIDEOS_FFMPEG)
+        if executavel is None:
+            raise TranscodificacaoErro(f'ffmpeg não encontrado: {settings.VIDEOS_FFMPEG}')
+        try:
+            subprocess.run(
+                [executavel, '-hide_banner', '-loglevel', 'error', '-y', *argumentos],
+                check=True,
+                capture_output=True,
+                timeout=settings.VIDEOS_TEMPO_LIMITE,
+            )
+        except subprocess.TimeoutExpired as e:
+            raise TranscodificacaoErro('ffmpeg passou do tempo limite.') from e
+        except subprocess.CalledProcessError as e:
+            raise TranscodificacaoErro(e.stderr.decode(errors='replace').strip()) from e
+
+    def _escala(self):
+        # nunca aumenta a resolução; -2 mantém a largura par (exigência do H.264)
+        return f"scale=-2:'min({settings.VIDEOS_ALTURA_MAXIMA},ih)'"
+
+    def transcodificar(self, origem, destino):
+        self._executar([
+            '-i', origem,
+            '-map_metadata', '-1',
+            '-vf', self._escala(),
+            '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '23', '-pix_fmt', 'yuv420p',
+            '-c:a', 'aac', '-b:a', '128k',
+            '-movflags', '+faststart', # metadados no início: o navegador começa a tocar antes de baixar tudo
+            destino,
+        ])
+
+    def extrair_poster(self, origem, destino):
+        for segundo in (settings.VIDEOS_SEGUNDO_POSTER, 0):
+            self._executar(['-ss', str(segundo), '-i', origem, '-frames:v', '1', '-vf', self._escala(), destino])
+            # vídeos mais curtos que VIDEOS_SEGUNDO_POSTER não geram quadro: tenta o primeiro
+            try:
+                with Image.open(destino):
+                    return
+            except OSError:
+                continue
+        raise TranscodificacaoErro('Não foi possível extrair o poster do vídeo.')
+
+
+class TranscodificadorStub(Transcodificador):
+    """
+    Implementação local, sem ffmpeg (testes e desenvolvimento): copia o vídeo e gera um poster cinza.
+    """
+
+    def transcodificar(self, origem, destino):
+        shutil.copyfile(origem, destino)
+
+    def extrair_poster(self, origem, destino):
+        Image.new('RGB', (320, 180), (128, 128, 128)).save(destino, 'JPEG')
+
+
+def obter_transcodificador():
+    return import_string(settings.VIDEOS_TRANSCODIFICADOR)()
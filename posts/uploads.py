@@ -0,0 +1,142 @@
+import os
+import shutil
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+from comuna.uploads import validar_arquivo
+from .models import UploadParcial
+
+TAMANHO_LEITURA = 64 * 1024
+
+
+# ====================================== Uploads retomáveis =======================================
+# O cliente cria o upload (nome, tipo, tamanho), envia o corpo cru de cada parte com o offset
+# (cabeçalho Upload-Offset) e, se a conexão cair, pergunta o offset atual e continua dali.
+# As partes são gravadas direto no arquivo em UPLOADS_PARCIAIS_DIR, sem passar pela memória.
+
+class ArquivoParcial(File):
+    # com temporary_file_path o FileSystemStorage move o arquivo em vez de copiá-lo
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def _caminho(upload):
+    return os.path.join(settings.UPLOADS_PARCIAIS_DIR, f'{upload.id}.parte')
+
+
+def _apagar_arquivo(upload):
+    try:
+        os.remove(_caminho(upload))
+    except FileNotFoundError:
+        pass
+
+
+def iniciar_upload(owner, nome, content_type, tamanho):
+    """
+    Cria um upload retomável de vídeo. Levanta ValueError se o tipo ou o tamanho não forem aceitos.
+    """
+    if tamanho <= 0:
+        raise ValueError('Tamanho inválido.')
+    validar_arquivo('video', content_type, tamanho)
+
+    upload = UploadParcial.objects.create(
+        owner=owner,
+        nome=os.path.basename(nome)[:255] or 'video',
+        content_type=content_type,
+        tamanho=tamanho,
+    )
+    os.makedirs(settings.UPLOADS_PARCIAIS_DIR, exist_ok=True)
+    open(_caminho(upload), 'wb').close()
+    return upload
+
+
+def receber_parte(upload, offset, stream, tamanho_parte):
+    """
+    Acrescenta uma parte ao upload, lendo o stream aos poucos.
+    O offset precisa ser igual ao que já foi recebido; senão levanta ValueError
+    e o cliente deve consultar o offset atual antes de continuar.
+    """
+    if tamanho_parte > settings.UPLOAD_TAMANHO_PARTE:
+        raise ValueError('Parte maior que o permitido.')
+    _conferir_offset(upload, offset, tamanho_parte)
+
+    # a leitura da rede vai para um arquivo temporário, sem transação nem trava abertas
+    temporario = f'{_caminho(upload)}.{uuid.uuid4().hex}'
+    try:
+        gravado = 0
+        with open(temporario, 'wb') as arquivo:
+            while gravado < tamanho_parte:
+                pedaco = stream.read(min(TAMANHO_LEITURA, tamanho_parte - gravado))
+                if not pedaco:
+                    break
+                arquivo.write(pedaco)
+                gravado += len(pedaco)
+
+        with transaction.atomic():
+            # trava a linha só para conferir o offset de novo e anexar a parte (cópia local):
+            # duas partes do mesmo upload não são gravadas ao mesmo tempo
+            upload = UploadParcial.objects.select_for_update().get(pk=upload.pk)
+            _conferir_offset(upload, offset, gravado)
+            with open(_caminho(upload), 'r+b') as arquivo, open(temporario, 'rb') as parte:
+                arquivo.seek(upload.recebido)
+                shutil.copyfileobj(parte, arquivo, TAMANHO_LEITURA)
+                # descarta o que sobrou de uma tentativa anterior interrompida
+                arquivo.truncate()
+
+            # uma parte incompleta (conexão caiu) conta só o que chegou
+            upload.recebido += gravado
+            UploadParcial.objects.filter(pk=upload.pk).update(recebido=upload.recebido)
+    finally:
+        try:
+            os.remove(temporario)
+        except FileNotFoundError:
+            pass
+    return upload
+
+
+def _conferir_offset(upload, offset, tamanho_parte):
+    if offset != upload.recebido:
+        raise ValueError(f'Offset esperado: {upload.recebido}.')
+    if upload.recebido + tamanho_parte > upload.tamanho:
+        raise ValueError('A parte passa do tamanho declarado.')
+
+
+def arquivo_do_upload(owner, upload_id):
+    """
+    Arquivo de um upload concluído do usuário, pronto para ser salvo em um FileField.
+    Levanta ValueError se o upload não existir ou ainda estiver incompleto.
+    """
+    try:
+        upload = UploadParcial.objects.get(pk=uuid.UUID(str(upload_id)), owner=owner)
+    except (UploadParcial.DoesNotExist, ValueError):
+        # id malformado (uuid.UUID levanta ValueError) ou de outro usuário
+        raise ValueError('Upload não encontrado.')
+    if not upload.concluido:
+        raise ValueError('O upload ainda não terminou.')
+    validar_arquivo('video', upload.content_type, upload.tamanho)
+    return ArquivoParcial(open(_caminho(upload), 'rb'), name=upload.nome)
+
+
+def descartar_upload(upload_id):
+    """
+    Remove o registro e o que restou do arquivo (depois de usado ou quando abandonado), com um único DELETE.
+    O id já deve ter passado por arquivo_do_upload: um id malformado levanta ValueError.
+    """
+    upload = UploadParcial(pk=uuid.UUID(str(upload_id))) # só o id é preciso para achar o arquivo
+    _apagar_arquivo(upload)
+    UploadParcial.objects.filter(pk=upload.pk).delete()
+
+
+def apagar_uploads_expirados():
+    """
+    Remove os uploads iniciados há mais de UPLOADS_PARCIAIS_VALIDADE horas. Retorna quantos foram removidos.
+    """
+    limite = timezone.now() - timedelta(hours=settings.UPLOADS_PARCIAIS_VALIDADE)
+    expirados = list(UploadParcial.objects.filter(created_at__lt=limite))
+    for upload in expirados:
+        _apagar_arquivo(upload)
+    UploadParcial.objects.filter(pk__in=[upload.pk for upload in expirados]).delete()
+    return len(expirados)
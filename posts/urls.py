@@ -1,9 +1,24 @@
+from django.conf import settings
 from django.urls import path
 from . import views
+from .models import Reaction
 
 urlpatterns = [
-    # Feed de posts
-    path('', views.feed_view, name='home'),
+    # Feed de posts (versão async com VIEWS_ASYNC, sob ASGI)
+    path('', views.feed_view_async if settings.VIEWS_ASYNC else views.feed_view, name='home'),
     # Detalhes do post
-    path('<str:username>/post/<int:post_id>/', views.post_detail, name='post_detail'),
+    path('<str:username>/post/<int:post_id>/', views.post_detail_async if settings.VIEWS_ASYNC else views.post_detail, name='post_detail'),
+    # Carregar mais comentários do post
+    path('post/<int:post_id>/comentarios/', views.carregar_comentarios, name='carregar_comentarios'),
+    # Curtir / descurtir
+    path('post/<int:post_id>/curtir/', views.reagir_post, {'kind': Reaction.LIKE, 'ativo': True}, name='curtir_post'),
+    path('post/<int:post_id>/descurtir/', views.reagir_post, {'kind': Reaction.LIKE, 'ativo': False}, name='descurtir_post'),
+    # Compartilhar / desfazer compartilhamento
+    path('post/<int:post_id>/compartilhar/', views.reagir_post, {'kind': Reaction.SHARE, 'ativo': True}, name='compartilhar_post'),
+    path('post/<int:post_id>/descompartilhar/', views.reagir_post, {'kind': Reaction.SHARE, 'ativo': False}, name='descompartilhar_post'),
+    # Busca em posts e comentários
+    path('buscar/', views.buscar, name='buscar'),
+    # Upload retomável de vídeo
+    path('uploads/video/', views.iniciar_upload_video, name='iniciar_upload_video'),
+    path('uploads/video/<uuid:upload_id>/', views.upload_video, name='upload_video'),
 ]
\ No newline at end of file
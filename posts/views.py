@@ -1,29 +1,70 @@
+from django.conf import settings
 from django.contrib import messages
-from django.shortcuts import render, redirect
+from django.shortcuts import render, redirect, get_object_or_404
+from django.db import close_old_connections, connections
+from django.http import JsonResponse, Http404
+from django.views.decorators.http import require_POST, require_http_methods
 from django.contrib.auth.decorators import login_required
-from django.contrib.auth.models import User
 from asgiref.sync import sync_to_async
-from .models import Post, Comments
-from .services import criar_post, criar_comentario
-from users.services import get_follow_counts
+from .models import Post, Comments, UploadParcial
+from .services import (
+    criar_post, criar_comentario, listar_timeline, reagir, remover_reacao, posts_reagidos,
+    carregar_threads, carregar_subarvore, listar_entradas_timeline, listar_posts_populares, juntar_timeline,
+)
+from comuna.pagination import decodificar_cursor
+from . import search
+from users.services import get_follow_counts, sugestoes_para
+from .fragment_cache import anotar_versoes
+from .uploads import iniciar_upload, receber_parte, arquivo_do_upload, descartar_upload
+from comuna.uploads import erros_upload
+from comuna.consultas import orcamento_consultas
 import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 
+def _video_enviado(request):
+    # vídeo do formulário ou de um upload retomável já concluído (campo upload_id)
+    video = request.FILES.get('video')
+    upload_id = request.POST.get('upload_id')
+    if video or not upload_id:
+        return video, None
+    return arquivo_do_upload(request.user, upload_id), upload_id
+
+def _concluir_video(video, upload_id):
+    # o arquivo do upload retomável já foi movido para o storage: remove o que sobrou
+    if upload_id:
+        video.close()
+        descartar_upload(upload_id)
+
 # pagina feed para ver todos os posts
 @login_required(login_url='login')
+@orcamento_consultas(7)
 def feed_view(request):
     
     #cria um post do usuario logado
     if request.method == 'POST':
+        # arquivos recusados antes de serem gravados (tipo ou tamanho fora dos limites)
+        erros = erros_upload(request)
+        if erros:
+            for erro in erros:
+                messages.error(request, erro, extra_tags='alert-danger-post')
+            return redirect('feed_view')
+        
         #pega o conteudo do post
         content = request.POST.get('content')
         image = request.FILES.get('image')
-        video = request.FILES.get('video')
         external_link = request.POST.get('link')
         
         if not content or content.strip() == '':
             messages.error(request, "O post não pode ser vazio!", extra_tags='alert-danger-post')
             return redirect('feed_view')
+        
+        try:
+            video, upload_id = _video_enviado(request)
+        except ValueError as e:
+            messages.error(request, str(e), extra_tags='alert-danger-post')
+            return redirect('feed_view')
     
         #cria um novo post
         try:
@@ -34,6 +75,7 @@ def feed_view(request):
                 video=video,
                 external_link=external_link
             )
+            _concluir_video(video, upload_id)
             messages.success(request, 'Post criado com sucesso!', extra_tags='alert-success-post')
             return redirect('feed_view')
         
@@ -41,34 +83,67 @@ def feed_view(request):
             messages.error(request, f'Erro ao criar o post', extra_tags='alert-danger-post')
             return redirect('feed_view')
     
-    # busca todos os posts do banco de dados
-    posts = Post.objects.select_related('author').order_by('-created_at').all()
-    # converte o queryset para uma lista de dicionários
-    posts = list(posts)
+    # busca apenas uma página da timeline do usuario a partir do cursor (se houver)
+    cursor = request.GET.get('cursor')
+    try:
+        posts, proximo_cursor = listar_timeline(request.user, cursor=cursor)
+    except ValueError:
+        # cursor inválido ou adulterado: volta para a primeira página
+        posts, proximo_cursor = listar_timeline(request.user)
     
-    follow_data = get_follow_counts(request.user)
+    # ids dos posts da página que o usuario curtiu (uma consulta só)
+    curtidos = posts_reagidos(request.user, posts)
+    return render(request, 'feed.html', _contexto_feed(request.user, posts, proximo_cursor, curtidos))
+
+def _contexto_feed(user, posts, proximo_cursor, curtidos):
+    follow_data = get_follow_counts(user)
     
-    context = {
+    # versão de cada card para o cache de fragmentos (uma leitura no cache)
+    anotar_versoes('post', posts)
+    
+    return {
         'posts': posts,
+        'proximo_cursor': proximo_cursor,
+        'curtidos': curtidos,
         'seguindo': follow_data['seguindo'],
         'seguidores': follow_data['seguidores'],
+        # quem seguir: lido da tabela pré-calculada (uma consulta)
+        'sugestoes': sugestoes_para(user),
     }
-    
-    return render(request, 'feed.html', context)
+
+def _percorrer_arvore(comentarios):
+    # todos os comentários da árvore já carregada, sem consultas
+    for comentario in comentarios:
+        yield comentario
+        yield from _percorrer_arvore(comentario.respostas)
 
 #pagina dos posts do usuario, que contem os comentarios e o post
+# comentar (POST) tem orçamento próprio: sessão, usuário, post, insert, índice de busca, caminho na árvore e contador,
+# mais a leitura e a remoção do upload retomável quando há vídeo
 @login_required(login_url='login')
+@orcamento_consultas(6, escrita=9)
 def post_detail(request, username, post_id):
     # busca o post pelo id
-    post = Post.objects.select_related('author').get(id=post_id)
+    post = get_object_or_404(Post.objects.select_related('author'), id=post_id)
     
 
     if request.method == 'POST':
+        # arquivos recusados antes de serem gravados (tipo ou tamanho fora dos limites)
+        erros = erros_upload(request)
+        if erros:
+            for erro in erros:
+                messages.error(request, erro, extra_tags='alert-danger-post')
+            return redirect('post_detail', username=username, post_id=post_id)
+        
         # pega o conteudo do comentario
         content = request.POST.get('content')
         comment_image = request.FILES.get('image')
-        comment_video = request.FILES.get('video')
         comment_link = request.POST.get('link')
+        try:
+            comment_video, upload_id = _video_enviado(request)
+        except ValueError as e:
+            messages.error(request, str(e), extra_tags='alert-danger-post')
+            return redirect('post_detail', username=username, post_id=post_id)
         
         
         # verifica se o comentario esta vazio
@@ -85,17 +160,241 @@ def post_detail(request, username, post_id):
             video=comment_video,
             external_link=comment_link
         )
-        
-        # atualiza a contagem de comentarios do post
-        post.comments_count += 1
-        post.save()
+        _concluir_video(comment_video, upload_id)
         return redirect('post_detail', username=username, post_id=post_id)
     
-    # busca os comentarios do post e converte os comentarios para uma lista de dicionários
-    comments_list = list(post.comments.select_related('author').order_by('-created_at'))
-    context = {
+    # busca uma página de threads do post, com as respostas já montadas em árvore (uma consulta)
+    try:
+        comments_list, proximo_cursor = carregar_threads(post, cursor=request.GET.get('cursor'))
+    except ValueError:
+        # cursor inválido: volta para a primeira página
+        comments_list, proximo_cursor = carregar_threads(post)
+    curtido = post.id in posts_reagidos(request.user, [post])
+    return render(request, 'post_detail.html', _contexto_post_detail(post, comments_list, proximo_cursor, curtido))
+
+def _contexto_post_detail(post, comments_list, proximo_cursor, curtido):
+    # versão de cada card (post e comentários da árvore) para o cache de fragmentos
+    anotar_versoes('post', [post])
+    anotar_versoes('comments', _percorrer_arvore(comments_list))
+    
+    return {
         'post': post,
-        'comments': comments_list
+        'comments': comments_list,
+        'proximo_cursor': proximo_cursor,
+        'curtido': curtido,
     }
-    
-    return render(request, 'post_detail.html', context)
\ No newline at end of file
+
+# curtir/compartilhar um post (ou desfazer). Idempotente: repetir a requisição não muda o resultado
+@login_required(login_url='login')
+@require_POST
+def reagir_post(request, post_id, kind, ativo):
+    post = get_object_or_404(Post.objects.only('id'), id=post_id)
+
+    if ativo:
+        alterado = reagir(request.user, post, kind)
+    else:
+        alterado = remover_reacao(request.user, post, kind)
+
+    return JsonResponse({'post_id': post.id, 'ativo': ativo, 'alterado': alterado})
+
+def _comentario_para_dict(comentario):
+    # serializa o comentário e as respostas já carregadas na árvore
+    return {
+        'id': comentario.id,
+        'author': comentario.author.username,
+        'content': comentario.content,
+        'created_at': comentario.created_at.isoformat(),
+        'likes_count': comentario.likes_count,
+        'num_respostas': comentario.num_respostas,
+        'respostas': [_comentario_para_dict(resposta) for resposta in comentario.respostas],
+    }
+
+# "carregar mais" comentários de um post: próxima página de threads, ou a thread inteira de um comentário
+@login_required(login_url='login')
+def carregar_comentarios(request, post_id):
+    post = get_object_or_404(Post.objects.only('id'), id=post_id)
+
+    comentario_id = request.GET.get('comentario')
+    if comentario_id:
+        comentario = get_object_or_404(Comments.objects.only('id', 'post_id', 'path'), id=comentario_id, post=post)
+        return JsonResponse({'comentarios': [_comentario_para_dict(carregar_subarvore(comentario))], 'proximo_cursor': None})
+
+    try:
+        threads, proximo_cursor = carregar_threads(post, cursor=request.GET.get('cursor'))
+    except ValueError:
+        return JsonResponse({'erro': 'Cursor inválido.'}, status=400)
+
+    return JsonResponse({
+        'comentarios': [_comentario_para_dict(thread) for thread in threads],
+        'proximo_cursor': proximo_cursor,
+    })
+
+# busca textual em posts ou comentários, paginada por número de página (resultados ordenados por relevância)
+@login_required(login_url='login')
+def buscar(request):
+    termo = request.GET.get('q', '').strip()
+    tipo = 'comments' if request.GET.get('tipo') == 'comentarios' else 'post'
+    try:
+        pagina = min(max(int(request.GET.get('pagina', 1)), 1), settings.BUSCA_PAGINA_MAXIMA)
+    except ValueError:
+        pagina = 1
+
+    resultados, tem_mais = search.buscar(termo, tipo=tipo, pagina=pagina)
+    anotar_versoes(tipo, resultados)
+    follow_data = get_follow_counts(request.user)
+
+    context = {
+        'termo': termo,
+        'tipo': tipo,
+        'resultados': resultados,
+        'pagina': pagina,
+        'proxima_pagina': pagina + 1 if tem_mais and pagina < settings.BUSCA_PAGINA_MAXIMA else None,
+        'seguindo': follow_data['seguindo'],
+        'seguidores': follow_data['seguidores'],
+    }
+    return render(request, 'busca.html', context)
+
+# upload retomável de vídeo: cria o upload e devolve o id usado nas partes
+@login_required(login_url='login')
+@require_POST
+def iniciar_upload_video(request):
+    try:
+        tamanho = int(request.POST.get('tamanho', ''))
+    except ValueError:
+        return JsonResponse({'erro': 'Tamanho inválido.'}, status=400)
+
+    try:
+        upload = iniciar_upload(request.user, request.POST.get('nome', ''), request.POST.get('tipo', ''), tamanho)
+    except ValueError as e:
+        return JsonResponse({'erro': str(e)}, status=400)
+
+    return JsonResponse({
+        'upload_id': str(upload.id),
+        'recebido': upload.recebido,
+        'tamanho_parte': settings.UPLOAD_TAMANHO_PARTE,
+    }, status=201)
+
+# GET: quanto já foi recebido (para retomar). POST: corpo cru da próxima parte, com o cabeçalho Upload-Offset
+@login_required(login_url='login')
+@require_http_methods(['GET', 'POST'])
+def upload_video(request, upload_id):
+    upload = get_object_or_404(UploadParcial, id=upload_id, owner=request.user)
+
+    if request.method == 'POST':
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+            tamanho_parte = int(request.META.get('CONTENT_LENGTH') or 0)
+            # a parte é lida direto do corpo da requisição, aos poucos
+            upload = receber_parte(upload, offset, request, tamanho_parte)
+        except ValueError as e:
+            upload.refresh_from_db()
+            return JsonResponse({'erro': str(e), 'recebido': upload.recebido}, status=400)
+
+    return JsonResponse({
+        'upload_id': str(upload.id),
+        'recebido': upload.recebido,
+        'tamanho': upload.tamanho,
+        'concluido': upload.concluido,
+    })
+
+# ====================================== Views assíncronas (ASGI) =======================================
+# Versões async do feed e do post, usadas nas rotas quando VIEWS_ASYNC está ligado (servidor ASGI, comuna.asgi).
+# As consultas independentes rodam ao mesmo tempo, cada uma em uma thread com a própria conexão,
+# e a página demora o tempo da consulta mais lenta em vez da soma. A criação de post/comentário
+# (POST) continua nas views síncronas.
+# Por que threads e não o ORM async (aget, async for): no Django o ORM async ainda roda cada consulta
+# via sync_to_async na mesma thread (thread_sensitive), com uma só conexão, então as consultas de uma
+# requisição continuariam uma depois da outra. Só threads próprias, cada uma com a sua conexão, paralelizam.
+
+# threads fixas: cada uma mantém a própria conexão entre requisições (CONN_MAX_AGE) ou a devolve ao pool.
+# Criado no primeiro uso (processos que não servem as views async não abrem threads)
+_executor_consultas = None
+_executor_trava = threading.Lock()
+
+def _threads_consultas():
+    # com DB_POOL cada thread segura uma conexão do pool: deixa ao menos uma para a thread da requisição
+    threads = settings.VIEWS_CONSULTAS_THREADS
+    pool = connections['default'].settings_dict.get('OPTIONS', {}).get('pool')
+    if isinstance(pool, dict) and pool.get('max_size'):
+        threads = min(threads, max(1, pool['max_size'] - 1))
+    return threads
+
+def _executor():
+    global _executor_consultas
+    if _executor_consultas is None:
+        with _executor_trava:
+            if _executor_consultas is None:
+                _executor_consultas = ThreadPoolExecutor(max_workers=_threads_consultas(), thread_name_prefix='consultas')
+    return _executor_consultas
+
+def _consulta_isolada(funcao, *args):
+    def executar():
+        # as threads do executor não recebem request_started/request_finished: fazem aqui o mesmo
+        # que o Django faz nas requisições, fechando só a conexão expirada ou quebrada (ou, com pool, devolvendo)
+        close_old_connections()
+        try:
+            return funcao(*args)
+        finally:
+            close_old_connections()
+    return executar
+
+async def _em_paralelo(*chamadas):
+    # chamadas: (funcao, *args). Com VIEWS_CONSULTAS_PARALELAS desligado, roda uma depois da outra
+    if settings.VIEWS_CONSULTAS_PARALELAS:
+        return await asyncio.gather(*(
+            sync_to_async(_consulta_isolada(*chamada), thread_sensitive=False, executor=_executor())()
+            for chamada in chamadas
+        ))
+    return [await sync_to_async(funcao)(*args) for funcao, *args in chamadas]
+
+def _cursor_valido(cursor):
+    # cursor inválido ou adulterado: volta para a primeira página
+    try:
+        if cursor:
+            decodificar_cursor(cursor)
+        return cursor
+    except ValueError:
+        return None
+
+@login_required(login_url='login')
+@orcamento_consultas(7)
+async def feed_view_async(request):
+    if request.method == 'POST':
+        return await sync_to_async(feed_view)(request)
+
+    user = await request.auser()
+    cursor = _cursor_valido(request.GET.get('cursor'))
+
+    # timeline materializada e contas populares ao mesmo tempo
+    entradas, populares = await _em_paralelo(
+        (listar_entradas_timeline, user, cursor),
+        (listar_posts_populares, user, cursor),
+    )
+    posts, proximo_cursor = juntar_timeline(entradas, populares)
+
+    # as curtidas dependem dos ids da página; os contadores de follow já estão no usuário (sem consulta)
+    curtidos = await sync_to_async(posts_reagidos)(user, posts)
+    contexto = await sync_to_async(_contexto_feed)(user, posts, proximo_cursor, curtidos)
+    return await sync_to_async(render)(request, 'feed.html', contexto)
+
+@login_required(login_url='login')
+@orcamento_consultas(6, escrita=9)
+async def post_detail_async(request, username, post_id):
+    if request.method == 'POST':
+        return await sync_to_async(post_detail)(request, username, post_id)
+
+    user = await request.auser()
+    cursor = _cursor_valido(request.GET.get('cursor'))
+
+    # o post, a página de comentários e a curtida só precisam do id: as três consultas rodam juntas
+    referencia = Post(id=post_id)
+    post, (comments_list, proximo_cursor), curtidos = await _em_paralelo(
+        (Post.objects.select_related('author').filter(id=post_id).first,),
+        (carregar_threads, referencia, cursor),
+        (posts_reagidos, user, [referencia]),
+    )
+    if post is None:
+        raise Http404('Post não encontrado.')
+
+    contexto = await sync_to_async(_contexto_post_detail)(post, comments_list, proximo_cursor, post.id in curtidos)
+    return await sync_to_async(render)(request, 'post_detail.html', contexto)
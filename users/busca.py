@@ -0,0 +1,100 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from .models import CustomUser, normalizar_busca
+
+# @username no texto: mesmos caracteres aceitos pelo validador de username do Django (sem o '.' final)
+PADRAO_MENCAO = re.compile(r'(?<![\w@])@([\w.+-]*[\w+-])')
+
+CAMPOS_SUGESTAO = ('id', 'username', 'first_name', 'last_name')
+
+
+# ====================================== Busca de usuários por prefixo =======================================
+# username_busca e nome_busca guardam o texto normalizado (minúsculas, sem acento) e têm índice
+# varchar_pattern_ops no PostgreSQL: o LIKE 'prefixo%' do startswith desce o índice sem varrer a tabela.
+# Um intervalo [prefixo, próximo prefixo) só funcionaria com collation C: em en_US/pt_BR os
+# caracteres _ . - + não ficam na ordem dos códigos e o intervalo traria usuários a mais ou a menos.
+# Os prefixos mais buscados ficam em um LRU com TTL dentro do processo.
+
+_sugestoes = OrderedDict() # (prefixo, limite) -> (expira_em, resultado)
+_trava = threading.Lock()
+
+
+def _por_prefixo(campo, prefixo, limite):
+    return list(
+        CustomUser.objects.filter(**{f'{campo}__startswith': prefixo}, is_active=True)
+        .order_by(campo, 'id')
+        .values(*CAMPOS_SUGESTAO)[:limite]
+    )
+
+
+def _do_cache(chave):
+    with _trava:
+        item = _sugestoes.get(chave)
+        if item is None:
+            return None
+        expira_em, resultado = item
+        if expira_em < time.monotonic():
+            del _sugestoes[chave]
+            return None
+        _sugestoes.move_to_end(chave)
+        return resultado
+
+
+def _guardar(chave, resultado):
+    with _trava:
+        _sugestoes[chave] = (time.monotonic() + settings.USUARIOS_SUGESTOES_TTL, resultado)
+        _sugestoes.move_to_end(chave)
+        while len(_sugestoes) > settings.USUARIOS_SUGESTOES_CACHE_TAMANHO:
+            _sugestoes.popitem(last=False)
+
+
+def limpar_cache_sugestoes():
+    with _trava:
+        _sugestoes.clear()
+
+
+def sugerir_usuarios(prefixo, limite=None):
+    """
+    Usuários cujo username ou nome começa com o prefixo (no máximo USUARIOS_SUGESTOES_LIMITE).
+    Quem bate pelo username vem primeiro. Retorna dicionários com CAMPOS_SUGESTAO.
+    """
+    prefixo = normalizar_busca(prefixo).lstrip('@')[:settings.USUARIOS_SUGESTOES_PREFIXO_MAXIMO]
+    limite = min(limite or settings.USUARIOS_SUGESTOES_LIMITE, settings.USUARIOS_SUGESTOES_LIMITE)
+    if not prefixo or limite <= 0:
+        return []
+
+    chave = (prefixo, limite)
+    resultado = _do_cache(chave)
+    if resultado is not None:
+        return resultado
+
+    resultado = _por_prefixo('username_busca', prefixo, limite)
+    if len(resultado) < limite:
+        vistos = {usuario['id'] for usuario in resultado}
+        for usuario in _por_prefixo('nome_busca', prefixo, limite):
+            if usuario['id'] not in vistos and len(resultado) < limite:
+                resultado.append(usuario)
+
+    _guardar(chave, resultado)
+    return resultado
+
+
+# ====================================== Menções =======================================
+def extrair_mencoes(texto):
+    """
+    Usernames mencionados no texto (@username), sem repetição e na ordem em que aparecem.
+    """
+    return list(dict.fromkeys(PADRAO_MENCAO.findall(texto or '')))[:settings.MENCOES_LIMITE]
+
+
+def resolver_mencoes(texto):
+    """
+    Usuários mencionados no texto, buscados todos em uma única consulta.
+    """
+    usernames = extrair_mencoes(texto)
+    if not usernames:
+        return []
+    return list(CustomUser.objects.filter(username__in=usernames, is_active=True).only('id', 'username'))
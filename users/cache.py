@@ -0,0 +1,114 @@
+import threading
+from django.conf import settings
+from django.core.cache import cache
+from comuna.routers import usar_primario
+from .models import CustomUser
+
+# ====================================== Cache de usuários (read-through) =======================================
+# O usuário fica no cache pelo id; o username aponta para o id. Assim, invalidar um usuário
+# é apagar duas chaves, e uma troca de username não deixa o objeto duplicado.
+# Na falta do cache a leitura vai ao primário: um valor vindo de uma réplica atrasada ficaria
+# no cache para todos até expirar.
+# Só os campos públicos vão para o cache (nada de hash da senha, e-mail ou data de nascimento):
+# o que sai dele é um CustomUser com os demais campos adiados.
+
+CAMPOS_CACHE = (
+    'id', 'username', 'first_name', 'last_name', 'avatar', 'avatar_variants',
+    'followers_count', 'following_count', 'data_criacao', 'is_active',
+)
+
+_estatisticas = {'hits': 0, 'misses': 0}
+_trava = threading.Lock()
+
+
+def _contar(resultado):
+    with _trava:
+        _estatisticas[resultado] += 1
+
+
+def _chave_id(pk):
+    return f'usuario:dados:{pk}'
+
+
+def _chave_username(username):
+    return f'usuario:username:{username}'
+
+
+def _carregar(**filtro):
+    # lê os campos públicos no primário e guarda no cache; None se o usuário não existir
+    with usar_primario():
+        dados = CustomUser.objects.filter(**filtro).values(*CAMPOS_CACHE).first()
+    if dados is not None:
+        cache.set_many({
+            _chave_id(dados['id']): dados,
+            _chave_username(dados['username']): dados['id'],
+        }, timeout=settings.USUARIOS_CACHE_TIMEOUT)
+    return dados
+
+
+def _usuario(dados):
+    # campos fora de CAMPOS_CACHE ficam adiados (vão ao banco só se alguém os ler);
+    # o from_db espera os valores na ordem dos campos do modelo
+    campos = [campo.attname for campo in CustomUser._meta.concrete_fields if campo.attname in dados]
+    return CustomUser.from_db(None, campos, [dados[campo] for campo in campos])
+
+
+def buscar_usuario_por_id(pk):
+    """
+    Retorna o usuário pelo id, consultando o banco só quando não está no cache.
+    Retorna None se o usuário não existir.
+    """
+    dados = cache.get(_chave_id(pk))
+    if dados is not None:
+        _contar('hits')
+        return _usuario(dados)
+
+    _contar('misses')
+    dados = _carregar(pk=pk)
+    return _usuario(dados) if dados is not None else None
+
+
+def buscar_usuario_por_username(username):
+    """
+    Retorna o usuário pelo username, consultando o banco só quando não está no cache.
+    Retorna None se o usuário não existir.
+    """
+    pk = cache.get(_chave_username(username))
+    if pk is not None:
+        return buscar_usuario_por_id(pk)
+
+    _contar('misses')
+    dados = _carregar(username=username)
+    return _usuario(dados) if dados is not None else None
+
+
+def invalidar_usuario(user, username_antigo=None):
+    """
+    Remove o usuário do cache. Passe username_antigo quando o username tiver mudado.
+    """
+    chaves = [_chave_id(user.pk), _chave_username(user.username)]
+    if username_antigo:
+        chaves.append(_chave_username(username_antigo))
+    cache.delete_many(chaves)
+
+
+def invalidar_usuarios_por_id(pks, usernames=()):
+    """
+    Remove usuários do cache pelo id. O mapeamento username -> id continua válido enquanto
+    o usuário existir; ao apagar usuários, passe também os usernames.
+    """
+    cache.delete_many([_chave_id(pk) for pk in pks] + [_chave_username(username) for username in usernames])
+
+
+def estatisticas():
+    """
+    Hits/misses do cache de usuários neste processo.
+    """
+    with _trava:
+        hits, misses = _estatisticas['hits'], _estatisticas['misses']
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'taxa_acerto': hits / total if total else 0.0,
+    }
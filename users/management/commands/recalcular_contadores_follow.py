@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from users.services import recalcular_contadores_follow
+
+
+class Command(BaseCommand):
+    help = 'Recalcula os contadores de seguidores/seguindo de todos os usuários a partir da tabela Follow.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000, help='Quantidade de usuários atualizados por UPDATE.')
+
+    def handle(self, *args, **options):
+        total = recalcular_contadores_follow(tamanho_lote=options['lote'])
+        self.stdout.write(self.style.SUCCESS(f'Contadores recalculados para {total} usuários.'))
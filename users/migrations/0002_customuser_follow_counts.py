@@ -0,0 +1,46 @@
+# Generated by Django 5.2.7 on 2026-10-17 19:46
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def preenche_contadores(apps, schema_editor):
+    # calcula os contadores para os usuários que já existem
+    CustomUser = apps.get_model('users', 'CustomUser')
+    Follow = apps.get_model('users', 'Follow')
+
+    def contagem(campo):
+        return Coalesce(Subquery(
+            Follow.objects.filter(**{campo: OuterRef('pk')})
+            .order_by()
+            .values(campo)
+            .annotate(total=Count('id'))
+            .values('total')
+        ), Value(0))
+
+    CustomUser.objects.update(
+        followers_count=contagem('seguindo'),
+        following_count=contagem('seguidor'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Seguidores'),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Seguindo'),
+        ),
+        migrations.RunPython(preenche_contadores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.7 on 2026-10-17 20:12
+
+import unicodedata
+
+from django.db import migrations, models
+
+
+def normalizar_busca(texto):
+    # cópia de users.models.normalizar_busca (a migração não depende do código atual)
+    decomposto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in decomposto if not unicodedata.combining(c)).lower().strip()
+
+
+def preenche_colunas_busca(apps, schema_editor):
+    # normaliza username/nome dos usuários que já existem, em lotes
+    CustomUser = apps.get_model('users', 'CustomUser')
+    lote = []
+    for user in CustomUser.objects.only('id', 'username', 'first_name', 'last_name').iterator(chunk_size=1000):
+        user.username_busca = normalizar_busca(user.username)
+        user.nome_busca = normalizar_busca(f'{user.first_name} {user.last_name}')
+        lote.append(user)
+        if len(lote) >= 1000:
+            CustomUser.objects.bulk_update(lote, ['username_busca', 'nome_busca'])
+            lote = []
+    if lote:
+        CustomUser.objects.bulk_update(lote, ['username_busca', 'nome_busca'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0003_avatar_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='nome_busca',
+            field=models.CharField(blank=True, default='', editable=False, max_length=300),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='username_busca',
+            field=models.CharField(blank=True, default='', editable=False, max_length=150),
+        ),
+        migrations.AddIndex(
+            model_name='customuser',
+            index=models.Index(fields=['username_busca'], name='usuario_username_busca_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customuser',
+            index=models.Index(fields=['nome_busca'], name='usuario_nome_busca_idx'),
+        ),
+        migrations.RunPython(preenche_colunas_busca, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-17 20:15
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_busca_prefixo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SugestaoSeguir',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pontuacao', models.PositiveIntegerField()),
+                ('calculado_em', models.DateTimeField(auto_now_add=True)),
+                ('sugerido', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sugestoes_seguir', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Sugestão de seguir',
+                'verbose_name_plural': 'Sugestões de seguir',
+                'indexes': [models.Index(fields=['usuario', '-pontuacao'], name='sugestao_usuario_pontuacao_idx')],
+                'constraints': [models.UniqueConstraint(fields=('usuario', 'sugerido'), name='unique_sugestao_seguir')],
+            },
+        ),
+    ]
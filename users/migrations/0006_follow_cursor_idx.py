@@ -0,0 +1,21 @@
+# Generated by Django 5.2.7 on 2026-10-17 20:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_sugestaoseguir'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['seguindo', '-created_at', '-id'], name='follow_seguidores_cursor_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['seguidor', '-created_at', '-id'], name='follow_seguindo_cursor_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.7 on 2026-10-17 20:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0006_follow_cursor_idx'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='customuser',
+            name='usuario_username_busca_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='customuser',
+            name='usuario_nome_busca_idx',
+        ),
+        migrations.AddIndex(
+            model_name='customuser',
+            index=models.Index(fields=['username_busca'], name='usuario_username_prefixo_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='customuser',
+            index=models.Index(fields=['nome_busca'], name='usuario_nome_prefixo_idx', opclasses=['varchar_pattern_ops']),
+        ),
+    ]
@@ -1,17 +1,31 @@
 from django.contrib.auth.models import AbstractUser
+import unicodedata
 import uuid
 from datetime import timedelta
 from django.utils import timezone
 from django.db import models
+from comuna.imagens import urls_variantes
+
+def normalizar_busca(texto):
+    # minúsculas e sem acentos: 'João' e 'joao' caem no mesmo prefixo
+    decomposto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in decomposto if not unicodedata.combining(c)).lower().strip()
 
 # Usuario personalizado para a rede social
 class CustomUser(AbstractUser):
     email = models.EmailField(unique=True, verbose_name='Email')
     bio = models.TextField(max_length=280, blank=True)
     avatar = models.ImageField(upload_to='avatars/', default='avatars/default.png', blank=True, verbose_name='Avatar')
+    avatar_variants = models.JSONField(default=dict, blank=True) # Variantes redimensionadas do avatar (comuna.imagens)
     data_nascimento = models.DateField(null=False, blank=False, verbose_name='Data de Nascimento')
     data_criacao = models.DateTimeField(auto_now_add=True, verbose_name='Data de Criação')
     e_verificado = models.BooleanField(default=False, verbose_name='Email Verificado')
+    # Contadores desnormalizados de Follow, mantidos por seguir()/parar_de_seguir() em services.py
+    followers_count = models.PositiveIntegerField(default=0, verbose_name='Seguidores')
+    following_count = models.PositiveIntegerField(default=0, verbose_name='Seguindo')
+    # Username e nome normalizados (normalizar_busca), indexados para a busca por prefixo (users/busca.py)
+    username_busca = models.CharField(max_length=150, blank=True, default='', editable=False)
+    nome_busca = models.CharField(max_length=300, blank=True, default='', editable=False)
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'data_nascimento']
     # No AbstractUser ja tem o campo (username, email, password,first_name,
@@ -19,11 +33,36 @@ class CustomUser(AbstractUser):
     
     def __str__(self):
         return f'{self.username} - {self.data_criacao.strftime("%d/%m/%Y")}'
+    
+    def save(self, *args, **kwargs):
+        # mantém as colunas de busca em dia com username/nome
+        self.username_busca = normalizar_busca(self.username)
+        self.nome_busca = normalizar_busca(f'{self.first_name} {self.last_name}')
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'username', 'first_name', 'last_name'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'username_busca', 'nome_busca'}
+        super().save(*args, **kwargs)
+    
+    @property
+    def tem_avatar(self):
+        # avatar enviado pelo usuário (o padrão não tem variantes)
+        return bool(self.avatar) and self.avatar.name != self._meta.get_field('avatar').default
+
+    @property
+    def avatares(self):
+        # URLs das variantes do avatar (vazio enquanto não forem geradas)
+        return urls_variantes(self.avatar_variants)
 
     class Meta:
         verbose_name = 'Usuário'
         verbose_name_plural = 'Usuários'
         ordering = ['-data_criacao']
+        indexes = [
+            # busca por prefixo (LIKE 'prefixo%'): no PostgreSQL o varchar_pattern_ops compara byte a byte,
+            # então o índice serve ao LIKE qualquer que seja a collation do banco (nos outros bancos é ignorado)
+            models.Index(fields=['username_busca'], name='usuario_username_prefixo_idx', opclasses=['varchar_pattern_ops']),
+            models.Index(fields=['nome_busca'], name='usuario_nome_prefixo_idx', opclasses=['varchar_pattern_ops']),
+        ]
 
 
 class EmailVerificationToken(models.Model):
@@ -60,10 +99,33 @@ class Follow(models.Model):
         ]
         # Ordena por data de criação
         ordering = ['-created_at']
+        # Listas de seguidores/seguindo paginadas por cursor (created_at, id)
+        indexes = [
+            models.Index(fields=['seguindo', '-created_at', '-id'], name='follow_seguidores_cursor_idx'),
+            models.Index(fields=['seguidor', '-created_at', '-id'], name='follow_seguindo_cursor_idx'),
+        ]
         
         verbose_name = 'Seguir'
         verbose_name_plural = 'Seguir'
 
+# Sugestões de "quem seguir" (amigos de amigos), pré-calculadas pela task calcular_sugestoes_seguir.
+# As páginas só leem as top-K de cada usuário, sem percorrer o grafo de Follow na requisição.
+class SugestaoSeguir(models.Model):
+    usuario = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='sugestoes_seguir')
+    sugerido = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='+')
+    pontuacao = models.PositiveIntegerField() # Quantas contas seguidas pelo usuário seguem o sugerido
+    calculado_em = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Sugestão de seguir'
+        verbose_name_plural = 'Sugestões de seguir'
+        constraints = [
+            models.UniqueConstraint(fields=['usuario', 'sugerido'], name='unique_sugestao_seguir')
+        ]
+        indexes = [
+            models.Index(fields=['usuario', '-pontuacao'], name='sugestao_usuario_pontuacao_idx'),
+        ]
+
 class PasswordResetToken(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     token = models.UUIDField(default=uuid.uuid4, unique=True)
@@ -81,4 +143,13 @@ class PasswordResetToken(models.Model):
         return timezone.now() > self.expires_at
     
     class Meta:
-        ordering = ['-created_at']
\ No newline at end of file
+        ordering = ['-created_at']
+# Fila de saída dos emails: a mensagem é gravada na mesma transação de quem a gerou (cadastro,
+# redefinição de senha...) e a task periódica descarregar_emails envia em lotes de EMAIL_TAMANHO_LOTE.
+class EmailPendente(models.Model):
+    mensagem = models.JSONField() # Dicionário de users.tasks.montar_email
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Email pendente'
+        verbose_name_plural = 'Emails pendentes'
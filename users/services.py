@@ -1,14 +1,25 @@
-from .models import CustomUser, EmailVerificationToken, Follow
+from .models import CustomUser, EmailVerificationToken, Follow, SugestaoSeguir
+from .cache import invalidar_usuarios_por_id
+from .tasks import enfileirar_emails, montar_email
 from django.contrib import messages
 from django.conf import settings
-from django.core.mail import send_mail
 from django.utils.html import strip_tags
 from django.template.loader import render_to_string
 from django.contrib.auth.password_validation import validate_password, get_password_validators
 from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Count, Exists, F, OuterRef, Subquery, Value, Window
+from django.db.models.functions import Coalesce, RowNumber
 from django.utils import timezone
 from datetime import timedelta
+import heapq
+import logging
 import re
+from comuna.pagination import paginar_por_cursor
+import time
+from collections import Counter, defaultdict
+
+logger = logging.getLogger(__name__)
 
 
 # ====================================== Validação de Senha (Refatorado) =======================================
@@ -140,23 +151,26 @@ class RegisterUser:
         # remove as tags HTML do conteúdo do email
         text_content = strip_tags(html_content)  
         
-        try:
-            # Envia o email de verificação
-            send_mail(
-                subject = f'Verifique seu email', # Assunto do email
-                message = text_content, # Mensagem de texto do email
-                from_email = settings.DEFAULT_FROM_EMAIL, # Email do remetente
-                recipient_list = [user.email], # Lista de destinatários
-                html_message = html_content # Mensagem HTML do email
-            )
-            return True
-        
-        except Exception as e:
-            print(f'Erro ao enviar email de verificação: {e}')
-            return False
+        # grava o email na fila de saída (mesma transação do cadastro), sem esperar o SMTP na requisição
+        mensagem = montar_email(
+            assunto = 'Verifique seu email', # Assunto do email
+            texto = text_content, # Mensagem de texto do email
+            destinatarios = [user.email], # Lista de destinatários
+            html = html_content # Mensagem HTML do email
+        )
+        enfileirar_emails([mensagem])
+        return True
 
 # função para deletar usuários não verificados depois de 7 dias
-def deleta_usuarios_nao_verificado():
+def deleta_usuarios_nao_verificado(tamanho_lote=None, pausa=None):
+    """
+    Apaga os usuários não verificados há mais de 7 dias em lotes de ids, cada lote em uma
+    transação curta, com uma pausa entre eles para não travar as tabelas.
+    Retorna um resumo com as linhas apagadas por lote e o tempo total.
+    """
+    tamanho_lote = tamanho_lote or settings.USUARIOS_LIMPEZA_LOTE
+    pausa = settings.USUARIOS_LIMPEZA_PAUSA if pausa is None else pausa
+    inicio = time.monotonic()
     
     # calcula uma data 7 dias atrás
     sete_dias_atras = timezone.now() - timedelta(days=7)
@@ -166,19 +180,354 @@ def deleta_usuarios_nao_verificado():
         e_verificado=False, 
         data_criacao__lte = sete_dias_atras) # __lte = "less than or equal" (menor ou igual)
     
-    count = usuarios_nao_verificados.count() # conta quantos usuários serão deletados
-    usuarios_nao_verificados.delete()
-    return f'Deletados {count} usuários não verificados.'
+    lotes = []
+    while True:
+        lote_usuarios = list(usuarios_nao_verificados.order_by('id').values_list('id', 'username')[:tamanho_lote])
+        if not lote_usuarios:
+            break
+        ids = [pk for pk, _ in lote_usuarios]
+        
+        # apaga o lote (e tudo que depende dele: tokens, follows, posts, comentários...)
+        with transaction.atomic():
+            linhas, _ = CustomUser.objects.filter(id__in=ids).delete()
+        # o username dos apagados pode ser usado por uma conta nova: sai do cache junto com o id
+        invalidar_usuarios_por_id(ids, usernames=[username for _, username in lote_usuarios])
+        lotes.append({'usuarios': len(ids), 'linhas': linhas})
+        logger.info('Limpeza de usuários: lote %d com %d usuários (%d linhas).', len(lotes), len(ids), linhas)
+        
+        if len(ids) < tamanho_lote:
+            break
+        time.sleep(pausa)
+    
+    resumo = {
+        'usuarios': sum(lote['usuarios'] for lote in lotes),
+        'linhas': sum(lote['linhas'] for lote in lotes),
+        'lotes': lotes,
+        'duracao': round(time.monotonic() - inicio, 3),
+    }
+    logger.info('Deletados %d usuários não verificados em %.3fs.', resumo['usuarios'], resumo['duracao'])
+    return resumo
 
 def get_follow_counts(user):
     if not user.is_authenticated:
         return {'seguindo': 0, 'seguidores': 0}
 
-    # 'seguindo' is the number of users `user` is following
-    seguindo = Follow.objects.filter(seguidor=user).count()
-    # 'seguidores' is the number of followers of `user`
-    seguidores = Follow.objects.filter(seguindo=user).count()
+    # os contadores ficam no próprio usuário, então não há consulta extra
     return {
-        'seguindo': seguindo,
-        'seguidores': seguidores
+        'seguindo': user.following_count,
+        'seguidores': user.followers_count
     }
+
+# ====================================== Seguir / deixar de seguir =======================================
+def _travar_usuarios(seguidor, ids):
+    # toda escrita em Follow (simples ou em lote) trava, antes de tudo, as linhas de todos os usuários cujos
+    # contadores vão mudar, em ordem crescente de id. Operações do mesmo seguidor rodam uma de cada vez
+    # (o que o lote leu antes de inserir/apagar continua válido) e duas transações nunca esperam uma
+    # pela outra em ordens opostas (A segue B enquanto B segue A não dá deadlock)
+    list(
+        CustomUser.objects.select_for_update()
+        .filter(id__in={seguidor.id, *ids})
+        .order_by('id')
+        .values_list('id', flat=True)
+    )
+
+def seguir(seguidor, seguindo):
+    """
+    Cria o relacionamento e atualiza os contadores dos dois usuários.
+    Retorna True se o relacionamento foi criado agora.
+    """
+    with transaction.atomic():
+        _travar_usuarios(seguidor, [seguindo.id])
+        _, created = Follow.objects.get_or_create(seguidor=seguidor, seguindo=seguindo)
+        if created:
+            # F() faz o incremento no banco, sem perder atualizações concorrentes
+            CustomUser.objects.filter(id=seguidor.id).update(following_count=F('following_count') + 1)
+            CustomUser.objects.filter(id=seguindo.id).update(followers_count=F('followers_count') + 1)
+    if created:
+        # os contadores mudaram: tira os dois usuários do cache
+        invalidar_usuarios_por_id([seguidor.id, seguindo.id])
+    return created
+
+def parar_de_seguir(seguidor, seguindo):
+    """
+    Remove o relacionamento e atualiza os contadores dos dois usuários.
+    Retorna True se havia relacionamento para remover.
+    """
+    with transaction.atomic():
+        _travar_usuarios(seguidor, [seguindo.id])
+        removidos, _ = Follow.objects.filter(seguidor=seguidor, seguindo=seguindo).delete()
+        if removidos:
+            CustomUser.objects.filter(id=seguidor.id).update(following_count=F('following_count') - 1)
+            CustomUser.objects.filter(id=seguindo.id).update(followers_count=F('followers_count') - 1)
+    if removidos:
+        invalidar_usuarios_por_id([seguidor.id, seguindo.id])
+    return bool(removidos)
+
+# ====================================== Seguir / deixar de seguir em lote =======================================
+# Resultados por id
+SEGUINDO = 'seguindo'
+JA_SEGUIA = 'ja_seguia'
+REMOVIDO = 'removido'
+NAO_SEGUIA = 'nao_seguia'
+NAO_ENCONTRADO = 'nao_encontrado'
+PROPRIO_USUARIO = 'proprio_usuario'
+
+
+def _ids_do_lote(ids):
+    ids = list(dict.fromkeys(int(pk) for pk in ids))
+    if len(ids) > settings.FOLLOW_LOTE_MAXIMO:
+        raise ValueError(f'No máximo {settings.FOLLOW_LOTE_MAXIMO} usuários por vez.')
+    return ids
+
+
+def seguir_varios(seguidor, ids):
+    """
+    Segue vários usuários em uma transação: um INSERT em lote (ignorando os que já existem
+    pela unique_relacionamento) e um UPDATE de contadores para cada lado.
+    Retorna {id: resultado} com SEGUINDO, JA_SEGUIA, NAO_ENCONTRADO ou PROPRIO_USUARIO.
+    Levanta ValueError se vierem mais de FOLLOW_LOTE_MAXIMO ids.
+    """
+    ids = _ids_do_lote(ids)
+    resultados = {}
+    with transaction.atomic():
+        _travar_usuarios(seguidor, ids)
+        existentes = set(CustomUser.objects.filter(id__in=ids, is_active=True).values_list('id', flat=True))
+        ja_seguia = set(
+            Follow.objects.filter(seguidor=seguidor, seguindo_id__in=existentes).values_list('seguindo_id', flat=True)
+        )
+
+        novos = []
+        for pk in ids:
+            if pk == seguidor.id:
+                resultados[pk] = PROPRIO_USUARIO
+            elif pk not in existentes:
+                resultados[pk] = NAO_ENCONTRADO
+            elif pk in ja_seguia:
+                resultados[pk] = JA_SEGUIA
+            else:
+                resultados[pk] = SEGUINDO
+                novos.append(pk)
+
+        if novos:
+            Follow.objects.bulk_create(
+                [Follow(seguidor=seguidor, seguindo_id=pk) for pk in novos],
+                ignore_conflicts=True,
+            )
+            CustomUser.objects.filter(id=seguidor.id).update(following_count=F('following_count') + len(novos))
+            CustomUser.objects.filter(id__in=novos).update(followers_count=F('followers_count') + 1)
+    if novos:
+        invalidar_usuarios_por_id([seguidor.id, *novos])
+    return resultados
+
+
+def parar_de_seguir_varios(seguidor, ids):
+    """
+    Deixa de seguir vários usuários em uma transação, com um único DELETE.
+    Retorna {id: resultado} com REMOVIDO ou NAO_SEGUIA.
+    Levanta ValueError se vierem mais de FOLLOW_LOTE_MAXIMO ids.
+    """
+    ids = _ids_do_lote(ids)
+    with transaction.atomic():
+        _travar_usuarios(seguidor, ids)
+        follows = dict(
+            Follow.objects.filter(seguidor=seguidor, seguindo_id__in=ids).values_list('seguindo_id', 'id')
+        )
+        removidos = list(follows)
+        if removidos:
+            Follow.objects.filter(id__in=follows.values()).delete()
+            CustomUser.objects.filter(id=seguidor.id).update(following_count=F('following_count') - len(removidos))
+            CustomUser.objects.filter(id__in=removidos).update(followers_count=F('followers_count') - 1)
+    if removidos:
+        invalidar_usuarios_por_id([seguidor.id, *removidos])
+    return {pk: REMOVIDO if pk in follows else NAO_SEGUIA for pk in ids}
+
+# ====================================== Listas de seguidores / seguindo =======================================
+CAMPOS_LISTA = ('username', 'first_name', 'last_name', 'avatar', 'avatar_variants')
+
+
+def _listar_follow(filtro, lado, cursor, tamanho_pagina):
+    # página de Follow pelo índice (filtro, -created_at, -id), trazendo só os campos exibidos do outro lado
+    follows, proximo_cursor = paginar_por_cursor(
+        Follow.objects.filter(**filtro)
+        .select_related(lado)
+        .only('id', 'created_at', f'{lado}_id', *(f'{lado}__{campo}' for campo in CAMPOS_LISTA)),
+        cursor,
+        tamanho_pagina or settings.FOLLOW_LISTA_POR_PAGINA,
+    )
+    return [getattr(follow, lado) for follow in follows], proximo_cursor
+
+
+def listar_seguidores(user, cursor=None, tamanho_pagina=None):
+    """
+    Página de quem segue o usuário (usuarios, proximo_cursor), dos mais recentes para os mais antigos.
+    Levanta ValueError se o cursor for inválido.
+    """
+    return _listar_follow({'seguindo': user}, 'seguidor', cursor, tamanho_pagina)
+
+
+def listar_seguindo(user, cursor=None, tamanho_pagina=None):
+    """
+    Página de quem o usuário segue (usuarios, proximo_cursor), dos mais recentes para os mais antigos.
+    Levanta ValueError se o cursor for inválido.
+    """
+    return _listar_follow({'seguidor': user}, 'seguindo', cursor, tamanho_pagina)
+
+
+def relacoes_com(viewer, usuarios):
+    """
+    Para os usuários da página, retorna (ids que o viewer segue, ids que seguem o viewer).
+    Uma consulta IN para cada conjunto, independente do tamanho da página.
+    """
+    ids = [usuario.id for usuario in usuarios]
+    if not ids or not viewer.is_authenticated:
+        return set(), set()
+    seguidos = set(Follow.objects.filter(seguidor=viewer, seguindo_id__in=ids).values_list('seguindo_id', flat=True))
+    seguem = set(Follow.objects.filter(seguindo=viewer, seguidor_id__in=ids).values_list('seguidor_id', flat=True))
+    return seguidos, seguem
+
+
+def _contagem_follow(campo):
+    # subquery que conta os Follow do usuário da linha atual pelo campo informado
+    return Coalesce(Subquery(
+        Follow.objects.filter(**{campo: OuterRef('pk')})
+        .order_by()
+        .values(campo)
+        .annotate(total=Count('id'))
+        .values('total')
+    ), Value(0))
+
+def recalcular_contadores_follow(tamanho_lote=1000):
+    """
+    Recalcula followers_count/following_count de todos os usuários em lotes de ids.
+    Retorna quantos usuários foram atualizados.
+    """
+    total = 0
+    ultimo_id = 0
+    while True:
+        ids = list(
+            CustomUser.objects.filter(id__gt=ultimo_id)
+            .order_by('id')
+            .values_list('id', flat=True)[:tamanho_lote]
+        )
+        if not ids:
+            break
+
+        # um UPDATE por lote, com as contagens calculadas no próprio banco
+        total += CustomUser.objects.filter(id__in=ids).update(
+            followers_count=_contagem_follow('seguindo'),
+            following_count=_contagem_follow('seguidor'),
+        )
+        ultimo_id = ids[-1]
+    return total
+
+
+# ====================================== Sugestões de quem seguir =======================================
+def _seguindo_de(ids):
+    # {usuario: [contas que ele segue]} para os ids informados, em uma consulta
+    seguindo = defaultdict(list)
+    for seguidor_id, seguindo_id in Follow.objects.filter(seguidor_id__in=ids).order_by().values_list('seguidor_id', 'seguindo_id'):
+        seguindo[seguidor_id].append(seguindo_id)
+    return seguindo
+
+
+def _seguindo_recentes_de(ids, limite, tamanho_lote):
+    """
+    {usuario: [até `limite` contas que ele segue, das mais recentes para as mais antigas]}.
+    Os ids vão ao banco em lotes, e o limite por usuário é aplicado no SQL (ROW_NUMBER por seguidor),
+    usando o índice (seguidor, -created_at, -id): nunca traz todos os follows dos intermediários.
+    """
+    ids = sorted(ids)
+    seguindo = defaultdict(list)
+    for inicio in range(0, len(ids), tamanho_lote):
+        linhas = (
+            Follow.objects.filter(seguidor_id__in=ids[inicio:inicio + tamanho_lote])
+            .annotate(posicao=Window(
+                RowNumber(), partition_by=[F('seguidor_id')], order_by=[F('created_at').desc(), F('id').desc()],
+            ))
+            .filter(posicao__lte=limite)
+            .order_by('seguidor_id', 'posicao')
+            .values_list('seguidor_id', 'seguindo_id')
+        )
+        for seguidor_id, seguindo_id in linhas:
+            seguindo[seguidor_id].append(seguindo_id)
+    return seguindo
+
+
+def _top_k(contagem, k):
+    # mais pontos primeiro; no empate, a conta mais antiga (menor id), para o resultado ser estável
+    return heapq.nlargest(k, contagem.items(), key=lambda item: (item[1], -item[0]))
+
+
+def calcular_sugestoes_seguir(tamanho_lote=None, top_k=None):
+    """
+    Recalcula as sugestões de amigos de amigos de todos os usuários, em lotes de ids.
+    Para cada usuário, conta quantas das contas que ele segue seguem cada candidato
+    e guarda as top_k. Retorna quantas sugestões foram gravadas.
+    """
+    tamanho_lote = tamanho_lote or settings.SUGESTOES_SEGUIR_LOTE
+    top_k = top_k or settings.SUGESTOES_SEGUIR_TOP_K
+    limite_seguindo = settings.SUGESTOES_SEGUIR_LIMITE_SEGUINDO
+
+    total = 0
+    ultimo_id = 0
+    while True:
+        ids = list(
+            CustomUser.objects.filter(id__gt=ultimo_id, is_active=True)
+            .order_by('id')
+            .values_list('id', flat=True)[:tamanho_lote]
+        )
+        if not ids:
+            break
+        ultimo_id = ids[-1]
+
+        # primeiro salto: quem cada usuário do lote segue; segundo salto: quem essas contas seguem
+        seguindo = _seguindo_de(ids)
+        intermediarios = {conta for contas in seguindo.values() for conta in contas}
+        segundo_salto = _seguindo_recentes_de(intermediarios, limite_seguindo, tamanho_lote)
+
+        candidatos = {}
+        for usuario_id, contas in seguindo.items():
+            ja_segue = set(contas)
+            contagem = Counter()
+            for conta in contas:
+                contagem.update(segundo_salto.get(conta, []))
+            # não sugere a própria conta nem quem ele já segue
+            contagem.pop(usuario_id, None)
+            for conta in ja_segue:
+                contagem.pop(conta, None)
+            candidatos[usuario_id] = contagem
+
+        ativos = set(
+            CustomUser.objects.filter(id__in={c for contagem in candidatos.values() for c in contagem}, is_active=True)
+            .values_list('id', flat=True)
+        )
+        sugestoes = [
+            SugestaoSeguir(usuario_id=usuario_id, sugerido_id=sugerido_id, pontuacao=pontos)
+            for usuario_id, contagem in candidatos.items()
+            for sugerido_id, pontos in _top_k({c: p for c, p in contagem.items() if c in ativos}, top_k)
+        ]
+
+        # troca as sugestões do lote de uma vez
+        with transaction.atomic():
+            SugestaoSeguir.objects.filter(usuario_id__in=ids).delete()
+            SugestaoSeguir.objects.bulk_create(sugestoes, batch_size=1000)
+        total += len(sugestoes)
+    return total
+
+
+def sugestoes_para(user, limite=None):
+    """
+    Sugestões pré-calculadas do usuário (contas), em uma consulta pelo índice (usuario, -pontuacao).
+    Quem ele passou a seguir depois do cálculo fica de fora.
+    """
+    if not user.is_authenticated:
+        return []
+    limite = limite or settings.SUGESTOES_SEGUIR_EXIBIDAS
+    ja_segue = Follow.objects.filter(seguidor_id=user.id, seguindo_id=OuterRef('sugerido_id'))
+    return [
+        sugestao.sugerido
+        for sugestao in SugestaoSeguir.objects.filter(usuario_id=user.id)
+        .filter(~Exists(ja_segue))
+        .select_related('sugerido')
+        .order_by('-pontuacao')[:limite]
+    ]
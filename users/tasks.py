@@ -0,0 +1,144 @@
+import logging
+import random
+import smtplib
+from celery import shared_task
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from comuna.imagens import gerar_variantes, apagar_variantes
+from .cache import invalidar_usuarios_por_id
+from .models import CustomUser, EmailPendente
+
+logger = logging.getLogger(__name__)
+
+
+def montar_email(assunto, texto, destinatarios, html=None):
+    """
+    Monta a mensagem como dicionário simples, para poder ser enviada à fila do Celery.
+    """
+    return {
+        'assunto': assunto,
+        'texto': texto,
+        'html': html,
+        'destinatarios': list(destinatarios),
+    }
+
+
+def _espera_retentativa(tentativa):
+    # backoff exponencial com jitter: base, 2x base, 4x base, ... até o teto
+    espera = min(settings.EMAIL_RETENTATIVA_BASE * 2 ** tentativa, settings.EMAIL_RETENTATIVA_MAXIMA)
+    return espera + random.uniform(0, settings.EMAIL_RETENTATIVA_BASE)
+
+
+# ====================================== Envio de emails =======================================
+@shared_task(bind=True, max_retries=5)
+def enviar_emails(self, mensagens):
+    """
+    Envia um lote de mensagens reutilizando uma única conexão SMTP.
+    Só as mensagens que falharem voltam para a fila, com backoff exponencial.
+    """
+    falhas = []
+    try:
+        # a conexão (e o handshake TLS) é aberta uma vez para o lote inteiro
+        with get_connection() as connection:
+            for mensagem in mensagens:
+                email = EmailMultiAlternatives(
+                    subject=mensagem['assunto'],
+                    body=mensagem['texto'],
+                    from_email=settings.DEFAULT_FROM_EMAIL,
+                    to=mensagem['destinatarios'],
+                    connection=connection,
+                )
+                if mensagem.get('html'):
+                    email.attach_alternative(mensagem['html'], 'text/html')
+                try:
+                    email.send()
+                except smtplib.SMTPException as e:
+                    logger.warning('Erro ao enviar email para %s: %s', mensagem['destinatarios'], e)
+                    falhas.append(mensagem)
+    except (smtplib.SMTPException, OSError) as e:
+        # não conseguiu abrir (ou manter) a conexão: tenta o lote todo de novo
+        logger.warning('Erro na conexão SMTP: %s', e)
+        falhas = mensagens
+
+    if falhas:
+        raise self.retry(args=[falhas], countdown=_espera_retentativa(self.request.retries))
+    return len(mensagens)
+
+
+def enfileirar_emails(mensagens):
+    """
+    Grava as mensagens na fila de saída (EmailPendente), dentro da transação de quem chamou.
+    Não fala com o broker: um broker fora do ar não derruba o cadastro nem a redefinição de senha.
+    """
+    EmailPendente.objects.bulk_create([EmailPendente(mensagem=mensagem) for mensagem in mensagens])
+
+
+@shared_task
+def descarregar_emails():
+    """
+    Task periódica (CELERY_BEAT_SCHEDULE): tira da fila de saída lotes de EMAIL_TAMANHO_LOTE mensagens
+    e manda cada lote para o enviar_emails (uma conexão SMTP por lote). Retorna quantas foram despachadas.
+    """
+    total = 0
+    while True:
+        with transaction.atomic():
+            lote = list(
+                EmailPendente.objects.select_for_update(skip_locked=True)
+                .order_by('id')[:settings.EMAIL_TAMANHO_LOTE]
+            )
+            if not lote:
+                break
+            # se o broker falhar, o rollback devolve o lote para a fila (tentado de novo no próximo ciclo)
+            enviar_emails.delay([pendente.mensagem for pendente in lote])
+            EmailPendente.objects.filter(id__in=[pendente.id for pendente in lote]).delete()
+        total += len(lote)
+        if len(lote) < settings.EMAIL_TAMANHO_LOTE:
+            break
+    return total
+
+
+# ====================================== Limpeza de usuários =======================================
+@shared_task
+def deleta_usuarios_nao_verificados():
+    """
+    Task diária (CELERY_BEAT_SCHEDULE) que apaga os usuários não verificados em lotes.
+    """
+    # import aqui dentro: services.py importa este módulo
+    from .services import deleta_usuarios_nao_verificado
+    return deleta_usuarios_nao_verificado()
+
+
+# ====================================== Avatar =======================================
+@shared_task
+def processar_avatar(user_id, variantes_antigas=None):
+    """
+    Gera as variantes do avatar do usuário e apaga as variantes do avatar anterior
+    (variantes_antigas: as que o perfil tinha antes da troca, já zeradas no banco pelo edit_profile).
+    """
+    apagar_variantes(variantes_antigas)
+    user = CustomUser.objects.filter(id=user_id).only('id', 'avatar', 'avatar_variants').first()
+    if user is None or not user.tem_avatar:
+        return None
+
+    try:
+        variantes = gerar_variantes(user.avatar)
+    except ValueError:
+        logger.warning('Não foi possível processar o avatar do usuário %s.', user_id)
+        return None
+
+    CustomUser.objects.filter(id=user_id).update(avatar_variants=variantes)
+    apagar_variantes(user.avatar_variants)
+    invalidar_usuarios_por_id([user_id])
+    return variantes
+
+
+# ====================================== Sugestões de quem seguir =======================================
+@shared_task
+def calcular_sugestoes_seguir():
+    """
+    Recalcula as sugestões de quem seguir de todos os usuários.
+    """
+    # import aqui dentro: services.py importa este módulo
+    from .services import calcular_sugestoes_seguir as calcular
+    return calcular()
@@ -1,9 +1,34 @@
-from django.test import TestCase, Client
+from django.test import TestCase, TransactionTestCase, Client, skipUnlessDBFeature
+from concurrent.futures import ThreadPoolExecutor
 from django.urls import reverse
-from .models import CustomUser, EmailVerificationToken
+from django.core.management import call_command
+from .models import CustomUser, EmailVerificationToken, PasswordResetToken, Follow, SugestaoSeguir, EmailPendente
+from .services import seguir, parar_de_seguir, get_follow_counts
+from .cache import buscar_usuario_por_id, buscar_usuario_por_username, estatisticas
+from django.core.cache import cache
+from django.core import mail
+from django.core.mail.backends import locmem
+from django.test import override_settings
+from django.test.client import RequestFactory
+from unittest import mock
+from .services import RegisterUser, deleta_usuarios_nao_verificado, calcular_sugestoes_seguir, sugestoes_para
+from .services import listar_seguidores, listar_seguindo, relacoes_com, seguir_varios, parar_de_seguir_varios
+from .tasks import enviar_emails, enfileirar_emails, descarregar_emails, montar_email, processar_avatar
+from .busca import sugerir_usuarios, resolver_mencoes, limpar_cache_sugestoes
+import smtplib
 from django.utils import timezone
 from datetime import timedelta
 import uuid
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from PIL import Image
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from comuna.banco import estatisticas_banco
+from comuna.metricas import limpar_metricas
 
 class RegisterUserTest(TestCase):
     def setUp(self):
@@ -137,3 +162,582 @@ class EmailVerificationTest(TestCase):
         
         response = self.client.get(invalid_url)
         self.assertEqual(response.status_code, 404)  # Página não encontrada
+
+class FollowContadoresTest(TestCase):
+    def setUp(self):
+        # Cria dois usuários para testar os contadores de seguidores
+        self.ana = CustomUser.objects.create_user(username='ana', email='ana@example.com', password='TestPassword123', data_nascimento='2000-01-01')
+        self.bia = CustomUser.objects.create_user(username='bia', email='bia@example.com', password='TestPassword123', data_nascimento='2000-01-01')
+
+    def test_seguir_atualiza_contadores_uma_vez(self):
+        """Seguir duas vezes só conta uma"""
+        self.assertTrue(seguir(self.ana, self.bia))
+        self.assertFalse(seguir(self.ana, self.bia))
+
+        self.ana.refresh_from_db()
+        self.bia.refresh_from_db()
+        self.assertEqual(self.ana.following_count, 1)
+        self.assertEqual(self.bia.followers_count, 1)
+
+    def test_parar_de_seguir_atualiza_contadores(self):
+        """Deixar de seguir decrementa e é idempotente"""
+        seguir(self.ana, self.bia)
+        self.assertTrue(parar_de_seguir(self.ana, self.bia))
+        self.assertFalse(parar_de_seguir(self.ana, self.bia))
+
+        self.ana.refresh_from_db()
+        self.bia.refresh_from_db()
+        self.assertEqual(self.ana.following_count, 0)
+        self.assertEqual(self.bia.followers_count, 0)
+
+    def test_get_follow_counts_sem_consultas(self):
+        """Os contadores vêm do próprio usuário, sem COUNT(*)"""
+        seguir(self.ana, self.bia)
+        self.bia.refresh_from_db()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_follow_counts(self.bia), {'seguindo': 0, 'seguidores': 1})
+
+    def test_salvar_usuario_nao_sobrescreve_contadores(self):
+        """Editar perfil, verificar email e redefinir senha gravam só os próprios campos"""
+        token_email = EmailVerificationToken.objects.create(user=self.ana)
+        token_senha = PasswordResetToken.objects.create(user=self.ana)
+        self.client.force_login(self.ana)
+        with CaptureQueriesContext(connection) as consultas:
+            self.client.post(reverse('edit_profile', args=[self.ana.id]), {'first_name': 'Ana'})
+            self.client.get(reverse('verify_email', args=[token_email.token]))
+            self.client.post(reverse('password_reset_confirm', args=[token_senha.token]), {
+                'nova_senha': 'OutraSenha#2024', 'confirmar_senha': 'OutraSenha#2024',
+            })
+        updates = [consulta['sql'] for consulta in consultas.captured_queries if consulta['sql'].startswith('UPDATE "users_customuser"')]
+        self.assertEqual(len(updates), 3)
+        for sql in updates:
+            self.assertNotIn('followers_count', sql)
+            self.assertNotIn('following_count', sql)
+
+    def test_comando_recalcula_contadores(self):
+        """O comando de reconciliação corrige contadores fora de sincronia"""
+        Follow.objects.create(seguidor=self.ana, seguindo=self.bia) # cria sem passar pelo serviço
+        call_command('recalcular_contadores_follow', lote=1, stdout=StringIO())
+
+        self.ana.refresh_from_db()
+        self.bia.refresh_from_db()
+        self.assertEqual(self.ana.following_count, 1)
+        self.assertEqual(self.bia.followers_count, 1)
+
+class CacheUsuariosTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(username='ana', email='ana@example.com', password='TestPassword123', data_nascimento='2000-01-01')
+
+    def test_segunda_busca_nao_consulta_o_banco(self):
+        """Username e id são servidos do cache depois da primeira busca"""
+        with self.assertNumQueries(1):
+            buscar_usuario_por_username('ana')
+        antes = estatisticas()
+        with self.assertNumQueries(0):
+            self.assertEqual(buscar_usuario_por_username('ana'), self.user)
+            self.assertEqual(buscar_usuario_por_id(self.user.id), self.user)
+        self.assertEqual(estatisticas()['hits'], antes['hits'] + 2)
+
+    def test_invalidacao_ao_editar_perfil(self):
+        """Trocar o username no perfil tira o usuário antigo do cache"""
+        buscar_usuario_por_username('ana')
+        self.client.force_login(self.user)
+        self.client.post(reverse('edit_profile', args=[self.user.id]), {'username': 'ana2'})
+
+        self.assertIsNone(buscar_usuario_por_username('ana'))
+        self.assertEqual(buscar_usuario_por_username('ana2').id, self.user.id)
+
+    def test_seguir_invalida_contadores_em_cache(self):
+        """Os contadores vistos no perfil não ficam velhos depois de seguir"""
+        outro = CustomUser.objects.create_user(username='bia', email='bia@example.com', password='TestPassword123', data_nascimento='2000-01-01')
+        self.assertEqual(buscar_usuario_por_id(outro.id).followers_count, 0)
+        seguir(self.user, outro)
+        self.assertEqual(buscar_usuario_por_id(outro.id).followers_count, 1)
+
+    def test_cache_guarda_so_campos_publicos(self):
+        """Hash da senha e e-mail não vão para o cache"""
+        buscar_usuario_por_id(self.user.id)
+        with self.assertNumQueries(0):
+            user = buscar_usuario_por_id(self.user.id)
+            self.assertEqual(user.username, 'ana')
+        self.assertTrue({'password', 'email', 'data_nascimento'} <= user.get_deferred_fields())
+
+    def test_invalidacao_ao_verificar_email_e_redefinir_senha(self):
+        """Verificar o e-mail e redefinir a senha tiram o usuário do cache"""
+        CustomUser.objects.filter(id=self.user.id).update(is_active=False)
+        self.assertFalse(buscar_usuario_por_id(self.user.id).is_active)
+        token = EmailVerificationToken.objects.create(user=self.user)
+        self.client.get(reverse('verify_email', args=[token.token]))
+        self.assertTrue(buscar_usuario_por_id(self.user.id).is_active)
+
+        token = PasswordResetToken.objects.create(user=self.user)
+        with mock.patch('users.views.invalidar_usuario') as invalidar:
+            self.client.post(reverse('password_reset_confirm', args=[token.token]), {
+                'nova_senha': 'OutraSenha#2024', 'confirmar_senha': 'OutraSenha#2024',
+            })
+        invalidar.assert_called_once_with(self.user)
+
+    def test_limpeza_tira_usuarios_apagados_do_cache(self):
+        """O username de uma conta apagada pode ser usado por outra sem o cache apontar para a antiga"""
+        CustomUser.objects.filter(id=self.user.id).update(e_verificado=False, data_criacao=timezone.now() - timedelta(days=8))
+        buscar_usuario_por_username('ana')
+        deleta_usuarios_nao_verificado(pausa=0)
+
+        self.assertIsNone(buscar_usuario_por_id(self.user.id))
+        nova = CustomUser.objects.create_user(username='ana', email='ana@example.com', password='TestPassword123', data_nascimento='2000-01-01')
+        self.assertEqual(buscar_usuario_por_username('ana').id, nova.id)
+
+class AvatarTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media, IMAGENS_VARIANTES={'thumb': 40, 'feed': 100})
+        override.enable()
+        self.addCleanup(override.disable)
+        self.user = CustomUser.objects.create_user(username='ana', email='ana@example.com', password='TestPassword123', data_nascimento='2000-01-01')
+        self.client.force_login(self.user)
+
+    def _trocar_avatar(self, cor):
+        buffer = BytesIO()
+        Image.new('RGB', (200, 200), cor).save(buffer, 'JPEG')
+        arquivo = SimpleUploadedFile('avatar.jpg', buffer.getvalue(), content_type='image/jpeg')
+        with mock.patch('users.views.processar_avatar.delay') as delay, self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('edit_profile', args=[self.user.id]), {'avatar': arquivo})
+        return delay
+
+    def test_avatar_original_gravado_sem_exif(self):
+        exif = Image.Exif()
+        exif[0x0110] = 'Camera de teste'
+        buffer = BytesIO()
+        Image.new('RGB', (200, 200), 'green').save(buffer, 'JPEG', exif=exif)
+        arquivo = SimpleUploadedFile('avatar.jpg', buffer.getvalue(), content_type='image/jpeg')
+        with mock.patch('users.views.processar_avatar.delay'):
+            self.client.post(reverse('edit_profile', args=[self.user.id]), {'avatar': arquivo})
+        self.user.refresh_from_db()
+        with self.user.avatar.open('rb') as original, Image.open(original) as imagem:
+            self.assertEqual(len(imagem.getexif()), 0)
+
+    def test_troca_de_avatar_zera_e_apaga_as_variantes_antigas(self):
+        self._trocar_avatar('red')
+        antigas = processar_avatar(self.user.id)
+        self.assertContains(self.client.get(reverse('perfil', args=['ana'])), default_storage.url(antigas['feed']['jpeg']))
+
+        delay = self._trocar_avatar('blue')
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.avatar_variants, {})
+        delay.assert_called_once_with(self.user.id, antigas)
+        # enquanto as novas variantes não ficam prontas, o perfil mostra o avatar original
+        self.assertContains(self.client.get(reverse('perfil', args=['ana'])), self.user.avatar.url)
+
+        novas = processar_avatar(*delay.call_args.args)
+        self.assertFalse(default_storage.exists(antigas['thumb']['jpeg']))
+        self.assertContains(self.client.get(reverse('lista_seguidores', args=['ana'])), default_storage.url(novas['thumb']['webp']))
+
+
+class BackendContador(locmem.EmailBackend):
+    """Backend de teste que conta quantas conexões foram abertas"""
+    conexoes = 0
+
+    def open(self):
+        BackendContador.conexoes += 1
+        return True
+
+
+class BackendInstavel(locmem.EmailBackend):
+    """Backend de teste que falha no primeiro envio"""
+    falhas_restantes = 0
+
+    def send_messages(self, messages):
+        if BackendInstavel.falhas_restantes:
+            BackendInstavel.falhas_restantes -= 1
+            raise smtplib.SMTPServerDisconnected('Conexão perdida')
+        return super().send_messages(messages)
+
+
+class EmailAssincronoTest(TestCase):
+    def setUp(self):
+        self.mensagens = [montar_email('Assunto', f'Texto {i}', [f'user{i}@example.com'], html='<p>oi</p>') for i in range(3)]
+
+    @override_settings(EMAIL_BACKEND='users.tests.BackendContador')
+    def test_lote_usa_uma_conexao(self):
+        """O lote inteiro sai pela mesma conexão SMTP"""
+        BackendContador.conexoes = 0
+        self.assertEqual(enviar_emails.apply(args=[self.mensagens]).get(), 3)
+        self.assertEqual(BackendContador.conexoes, 1)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(mail.outbox[0].alternatives[0][1], 'text/html')
+
+    @override_settings(EMAIL_BACKEND='users.tests.BackendInstavel', EMAIL_RETENTATIVA_BASE=0)
+    def test_retenta_apenas_as_falhas(self):
+        """Só a mensagem que falhou é reenviada"""
+        BackendInstavel.falhas_restantes = 1
+        enviar_emails.apply(args=[self.mensagens])
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), ['user0@example.com', 'user1@example.com', 'user2@example.com'])
+
+    def test_verificacao_vai_para_a_fila_de_saida(self):
+        """O cadastro não chama o SMTP nem o broker: o email fica na fila de saída"""
+        user = CustomUser.objects.create_user(username='ana', email='ana@example.com', password='TestPassword123', data_nascimento='2000-01-01')
+        registro = RegisterUser(RequestFactory().get('/'), 'ana', 'ana@example.com', '', '', '2000-01-01')
+        with mock.patch('users.tasks.enviar_emails.delay') as delay:
+            self.assertTrue(registro.send_email_verification(user))
+        delay.assert_not_called()
+        self.assertEqual(EmailPendente.objects.get().mensagem['destinatarios'], ['ana@example.com'])
+        self.assertEqual(len(mail.outbox), 0)
+
+    @override_settings(EMAIL_TAMANHO_LOTE=2)
+    def test_descarga_envia_a_fila_em_lotes(self):
+        """A fila é despachada em lotes de EMAIL_TAMANHO_LOTE, um enviar_emails por lote"""
+        enfileirar_emails(self.mensagens + [montar_email('Assunto', 'Texto', ['user3@example.com'])])
+        with mock.patch('users.tasks.enviar_emails.delay') as delay:
+            self.assertEqual(descarregar_emails(), 4)
+        self.assertEqual([len(chamada.args[0]) for chamada in delay.call_args_list], [2, 2])
+        self.assertFalse(EmailPendente.objects.exists())
+
+    def test_broker_fora_do_ar_mantem_a_fila(self):
+        """Se o lote não chega ao broker, as mensagens continuam na fila para o próximo ciclo"""
+        enfileirar_emails(self.mensagens)
+        with mock.patch('users.tasks.enviar_emails.delay', side_effect=OSError('broker fora do ar')):
+            with self.assertRaises(OSError):
+                descarregar_emails()
+        self.assertEqual(EmailPendente.objects.count(), 3)
+
+class LimpezaUsuariosTest(TestCase):
+    def setUp(self):
+        # Cria 5 usuários não verificados antigos, um recente e um verificado antigo
+        antigo = timezone.now() - timedelta(days=8)
+        for i in range(5):
+            CustomUser.objects.create_user(username=f'velho{i}', email=f'velho{i}@example.com', password='TestPassword123', data_nascimento='2000-01-01')
+        CustomUser.objects.create_user(username='verificado', email='verificado@example.com', password='TestPassword123', data_nascimento='2000-01-01', e_verificado=True)
+        CustomUser.objects.update(data_criacao=antigo)
+        CustomUser.objects.create_user(username='novo', email='novo@example.com', password='TestPassword123', data_nascimento='2000-01-01')
+
+    def test_apaga_em_lotes(self):
+        """Os usuários são apagados em lotes limitados e o resumo informa cada lote"""
+        resumo = deleta_usuarios_nao_verificado(tamanho_lote=2, pausa=0)
+        self.assertEqual(resumo['usuarios'], 5)
+        self.assertEqual([lote['usuarios'] for lote in resumo['lotes']], [2, 2, 1])
+        self.assertIn('duracao', resumo)
+        self.assertEqual(sorted(CustomUser.objects.values_list('username', flat=True)), ['novo', 'verificado'])
+
+    def test_task_registrada_no_celery(self):
+        """A task agendada no beat existe na aplicação Celery"""
+        from comuna.celery import app
+        from django.conf import settings
+        app.loader.import_default_modules()
+        self.assertIn(settings.CELERY_BEAT_SCHEDULE['deleta_usuarios_nao_verificados']['task'], app.tasks)
+
+
+class BuscaUsuariosTest(TestCase):
+    def setUp(self):
+        limpar_cache_sugestoes()
+        self.addCleanup(limpar_cache_sugestoes)
+        self.joao = CustomUser.objects.create_user(username='JoaoSilva', email='joao@example.com', password='123456', data_nascimento='2000-01-01', first_name='João', last_name='Silva')
+        self.joana = CustomUser.objects.create_user(username='joana', email='joana@example.com', password='123456', data_nascimento='2000-01-01')
+        self.maria = CustomUser.objects.create_user(username='maria', email='maria@example.com', password='123456', data_nascimento='2000-01-01', first_name='Joaquina')
+        CustomUser.objects.create_user(username='joaninha', email='inativa@example.com', password='123456', data_nascimento='2000-01-01', is_active=False)
+
+    def _usernames(self, prefixo, limite=None):
+        return [usuario['username'] for usuario in sugerir_usuarios(prefixo, limite)]
+
+    def test_prefixo_do_username_e_do_nome(self):
+        # sem diferenciar maiúsculas/acentos; username antes do nome; inativos fora
+        self.assertEqual(self._usernames('@JOA'), ['joana', 'JoaoSilva', 'maria'])
+        self.assertEqual(self._usernames('joão'), ['JoaoSilva'])
+        self.assertEqual(self._usernames('joa', limite=1), ['joana'])
+        self.assertEqual(self._usernames(''), [])
+
+    def test_prefixo_com_pontuacao(self):
+        # _ e % são literais no prefixo, e . - + não dependem da collation do banco
+        for username in ('ana_b', 'ana.c', 'anab', 'ana-d', 'ana+e'):
+            CustomUser.objects.create_user(username=username, email=f'{username}@example.com', password='123456', data_nascimento='2000-01-01')
+        self.assertEqual(self._usernames('ana_'), ['ana_b'])
+        self.assertEqual(self._usernames('ana.'), ['ana.c'])
+        self.assertEqual(self._usernames('ana-'), ['ana-d'])
+        self.assertEqual(len(self._usernames('ana')), 5)
+
+    def test_limite_maximo(self):
+        with self.settings(USUARIOS_SUGESTOES_LIMITE=2):
+            self.assertEqual(len(sugerir_usuarios('joa', limite=50)), 2)
+
+    def test_prefixos_repetidos_vem_do_cache(self):
+        sugerir_usuarios('jo')
+        with self.assertNumQueries(0):
+            self.assertEqual(len(sugerir_usuarios('jo')), 3)
+
+    def test_troca_de_username_atualiza_a_coluna_de_busca(self):
+        self.joana.username = 'Zélia'
+        self.joana.save(update_fields=['username'])
+        self.joana.refresh_from_db()
+        self.assertEqual(self.joana.username_busca, 'zelia')
+        self.assertEqual(self._usernames('zel'), ['Zélia'])
+
+    def test_mencoes_em_uma_consulta(self):
+        texto = 'Oi @joana, @maria e @joana de novo. Fala @ninguem! email@maria.com'
+        with self.assertNumQueries(1):
+            mencionados = resolver_mencoes(texto)
+        self.assertEqual({user.username for user in mencionados}, {'joana', 'maria'})
+
+    def test_endpoint_de_sugestoes(self):
+        self.client.force_login(self.joao)
+        response = self.client.get(reverse('sugestoes_usuarios'), {'q': 'mar'})
+        self.assertEqual(response.json()['usuarios'][0]['username'], 'maria')
+
+
+class SugestoesSeguirTest(TestCase):
+    def setUp(self):
+        self.usuarios = {
+            nome: CustomUser.objects.create_user(username=nome, email=f'{nome}@example.com', password='123456', data_nascimento='2000-01-01')
+            for nome in ('ana', 'bia', 'caio', 'davi', 'eva')
+        }
+        for seguidor, seguindo in (('ana', 'bia'), ('ana', 'caio'), ('bia', 'davi'), ('bia', 'eva'), ('caio', 'davi'), ('bia', 'ana')):
+            seguir(self.usuarios[seguidor], self.usuarios[seguindo])
+
+    def _sugeridos(self, nome):
+        return [user.username for user in sugestoes_para(self.usuarios[nome])]
+
+    def test_amigos_de_amigos_por_pontuacao(self):
+        # lotes de um usuário para passar pela paginação por id
+        calcular_sugestoes_seguir(tamanho_lote=1)
+        self.assertEqual(self._sugeridos('ana'), ['davi', 'eva'])
+        # caio não segue ninguém que siga outra conta que ele ainda não segue
+        self.assertEqual(self._sugeridos('caio'), [])
+        self.assertEqual(SugestaoSeguir.objects.get(usuario=self.usuarios['ana'], sugerido=self.usuarios['davi']).pontuacao, 2)
+
+    def test_leitura_em_uma_consulta_sem_quem_ja_segue(self):
+        calcular_sugestoes_seguir()
+        seguir(self.usuarios['ana'], self.usuarios['davi'])
+        with self.assertNumQueries(1):
+            self.assertEqual(self._sugeridos('ana'), ['eva'])
+
+    def test_recalculo_substitui_as_sugestoes(self):
+        calcular_sugestoes_seguir()
+        parar_de_seguir(self.usuarios['ana'], self.usuarios['bia'])
+        calcular_sugestoes_seguir()
+        self.assertEqual(self._sugeridos('ana'), ['davi'])
+
+    @override_settings(SUGESTOES_SEGUIR_LIMITE_SEGUINDO=1)
+    def test_limite_por_intermediario_usa_os_follows_mais_recentes(self):
+        # o follow mais recente de bia é ana; davi e eva ficam de fora do segundo salto por ela
+        calcular_sugestoes_seguir(tamanho_lote=1)
+        self.assertEqual(self._sugeridos('ana'), ['davi'])
+        self.assertEqual(SugestaoSeguir.objects.get(usuario=self.usuarios['ana'], sugerido=self.usuarios['davi']).pontuacao, 1)
+
+
+# precisa de travas de linha de verdade (PostgreSQL): no SQLite as transações concorrentes
+# esbarram na trava da tabela inteira
+@skipUnlessDBFeature('has_select_for_update')
+class SeguirConcorrenciaTest(TransactionTestCase):
+    RODADAS = 20
+
+    def setUp(self):
+        self.usuarios = [
+            CustomUser.objects.create_user(username=nome, email=f'{nome}@example.com', password='123456', data_nascimento='2000-01-01')
+            for nome in ('ana', 'bia', 'caio')
+        ]
+
+    def _em_paralelo(self, *trabalhos):
+        def rodar(trabalho):
+            try:
+                for _ in range(self.RODADAS):
+                    trabalho()
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=len(trabalhos)) as executor:
+            for futuro in [executor.submit(rodar, trabalho) for trabalho in trabalhos]:
+                futuro.result() # propaga erros (no PostgreSQL, um deadlock apareceria aqui)
+
+    def test_follows_mutuos_em_paralelo(self):
+        """A segue B enquanto B segue A (simples e em lote), sem deadlock nem contador errado"""
+        ana, bia, caio = self.usuarios
+
+        def ana_segue():
+            seguir(ana, bia)
+            parar_de_seguir(ana, bia)
+
+        def bia_segue():
+            seguir_varios(bia, [ana.id, caio.id])
+            parar_de_seguir_varios(bia, [ana.id, caio.id])
+
+        def caio_segue():
+            seguir_varios(caio, [bia.id, ana.id])
+            parar_de_seguir(caio, ana)
+            parar_de_seguir(caio, bia)
+
+        self._em_paralelo(ana_segue, bia_segue, caio_segue)
+        self.assertFalse(Follow.objects.exists())
+        for user in CustomUser.objects.all():
+            self.assertEqual((user.followers_count, user.following_count), (0, 0), user.username)
+
+
+class ListasFollowTest(TestCase):
+    def setUp(self):
+        self.alvo = CustomUser.objects.create_user(username='alvo', email='alvo@example.com', password='123456', data_nascimento='2000-01-01')
+        self.fas = [
+            CustomUser.objects.create_user(username=f'fa{i}', email=f'fa{i}@example.com', password='123456', data_nascimento='2000-01-01')
+            for i in range(5)
+        ]
+        for fa in self.fas:
+            seguir(fa, self.alvo)
+
+    def test_paginacao_por_cursor(self):
+        vistos = []
+        cursor = None
+        while True:
+            usuarios, cursor = listar_seguidores(self.alvo, cursor=cursor, tamanho_pagina=2)
+            vistos += [usuario.username for usuario in usuarios]
+            if cursor is None:
+                break
+        # todos, sem repetir, dos mais recentes para os mais antigos
+        self.assertEqual(vistos, [fa.username for fa in reversed(self.fas)])
+        self.assertEqual(listar_seguindo(self.fas[0])[0], [self.alvo])
+
+    def test_relacoes_da_pagina_em_duas_consultas(self):
+        seguir(self.alvo, self.fas[1])
+        usuarios, _ = listar_seguidores(self.alvo)
+        with self.assertNumQueries(2):
+            seguidos, seguem = relacoes_com(self.fas[1], usuarios)
+        self.assertEqual(seguem, set())
+        with self.assertNumQueries(2):
+            seguidos, seguem = relacoes_com(self.alvo, usuarios)
+        self.assertEqual(seguidos, {self.fas[1].id})
+        self.assertEqual(seguem, {fa.id for fa in self.fas})
+
+    def test_paginas_de_seguidores_e_seguindo(self):
+        self.client.force_login(self.alvo)
+        response = self.client.get(reverse('lista_seguidores', args=['alvo']), {'cursor': 'invalido'})
+        self.assertContains(response, 'Segue você', count=5)
+        response = self.client.get(reverse('lista_seguindo', args=['fa0']))
+        self.assertContains(response, 'alvo')
+        self.assertEqual(self.client.get(reverse('lista_seguidores', args=['ninguem'])).status_code, 404)
+
+
+class SeguirEmLoteTest(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='importador', email='importador@example.com', password='123456', data_nascimento='2000-01-01')
+        self.outros = [
+            CustomUser.objects.create_user(username=f'outro{i}', email=f'outro{i}@example.com', password='123456', data_nascimento='2000-01-01')
+            for i in range(3)
+        ]
+        seguir(self.user, self.outros[0])
+
+    def test_resultado_por_id_e_contadores(self):
+        ids = [outro.id for outro in self.outros] + [self.user.id, 999999]
+        resultados = seguir_varios(self.user, ids)
+        self.assertEqual(resultados, {
+            self.outros[0].id: 'ja_seguia',
+            self.outros[1].id: 'seguindo',
+            self.outros[2].id: 'seguindo',
+            self.user.id: 'proprio_usuario',
+            999999: 'nao_encontrado',
+        })
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.following_count, 3)
+        self.assertEqual(Follow.objects.filter(seguidor=self.user).count(), 3)
+
+        resultados = parar_de_seguir_varios(self.user, [self.outros[1].id, 999999])
+        self.assertEqual(resultados, {self.outros[1].id: 'removido', 999999: 'nao_seguia'})
+        self.user.refresh_from_db()
+        self.outros[1].refresh_from_db()
+        self.assertEqual(self.user.following_count, 2)
+        self.assertEqual(self.outros[1].followers_count, 0)
+
+    def test_seguir_simples_usa_a_mesma_trava_do_lote(self):
+        # sem a trava, um seguir() no meio de um lote faria o lote contar uma linha que ele não inseriu;
+        # a trava cobre o seguidor e todos os usuários cujos contadores mudam
+        with mock.patch('users.services._travar_usuarios') as travar:
+            seguir(self.user, self.outros[1])
+            parar_de_seguir(self.user, self.outros[1])
+            seguir_varios(self.user, [self.outros[2].id])
+        self.assertEqual([chamada.args for chamada in travar.call_args_list], [
+            (self.user, [self.outros[1].id]), (self.user, [self.outros[1].id]), (self.user, [self.outros[2].id]),
+        ])
+
+    @override_settings(FOLLOW_LOTE_MAXIMO=2)
+    def test_limite_do_lote(self):
+        with self.assertRaises(ValueError):
+            seguir_varios(self.user, [outro.id for outro in self.outros])
+        self.assertEqual(Follow.objects.filter(seguidor=self.user).count(), 1)
+
+    @mock.patch('users.views.limpar_timeline_varios.delay')
+    @mock.patch('users.views.preencher_timeline_varios.delay')
+    def test_endpoint_json(self, preencher, limpar):
+        self.client.force_login(self.user)
+        url = reverse('seguir_em_lote')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                url, {'acao': 'seguir', 'ids': [outro.id for outro in self.outros]}, content_type='application/json'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['resultados'][str(self.outros[1].id)], 'seguindo')
+        # uma task para o lote, só com quem passou a ser seguido
+        preencher.assert_called_once_with(self.user.id, [self.outros[1].id, self.outros[2].id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url, {'acao': 'deixar_de_seguir', 'ids': [self.outros[0].id]}, content_type='application/json')
+        limpar.assert_called_once_with(self.user.id, [self.outros[0].id])
+
+        response = self.client.post(url, {'acao': 'bloquear', 'ids': []}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(url, 'nao e json', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class EstatisticasBancoTest(TestCase):
+    def test_sem_pool(self):
+        self.assertEqual(estatisticas_banco()['pool'], False)
+
+    def test_com_pool(self):
+        pool = mock.Mock()
+        pool.get_stats.return_value = {
+            'pool_min': 2, 'pool_max': 10, 'pool_size': 4, 'pool_available': 1,
+            'requests_waiting': 3, 'requests_num': 8, 'requests_wait_ms': 40,
+        }
+        with mock.patch.object(connection, 'pool', pool, create=True):
+            dados = estatisticas_banco()
+        self.assertEqual(dados['em_uso'], 3)
+        self.assertEqual(dados['aguardando'], 3)
+        self.assertEqual(dados['tempo_espera_medio_ms'], 5)
+        self.assertEqual(dados['erros'], 0)
+
+    def test_endpoint_so_para_staff(self):
+        user = CustomUser.objects.create_user(username='dba', email='dba@example.com', password='123456', data_nascimento='2000-01-01')
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(reverse('estatisticas_banco')).status_code, 302)
+        user.is_staff = True
+        user.save()
+        self.assertEqual(self.client.get(reverse('estatisticas_banco')).json()['vendor'], 'sqlite')
+
+
+class MetricasTest(TestCase):
+    def setUp(self):
+        limpar_metricas()
+        self.user = CustomUser.objects.create_user(username='medido', email='medido@example.com', password='123456', data_nascimento='2000-01-01')
+
+    def test_latencia_status_e_sql_por_rota(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('perfil', args=['medido']))
+        self.client.get(reverse('perfil', args=['medido']))
+        self.client.get('/rota/que/nao/existe/')
+        texto = self.client.get(reverse('metricas')).content.decode()
+
+        self.assertIn('comuna_requisicao_duracao_segundos_count{rota="perfil"} 2', texto)
+        self.assertIn('comuna_requisicao_duracao_segundos_bucket{rota="perfil",le="+Inf"} 2', texto)
+        self.assertIn('comuna_respostas_total{rota="perfil",status="200"} 2', texto)
+        self.assertIn('comuna_sql_consultas_total{rota="perfil"}', texto)
+        self.assertIn('comuna_cache_usuarios_taxa_acerto', texto)
+
+    @override_settings(METRICAS_MODO_LEVE=True)
+    def test_modo_leve_nao_mede_sql(self):
+        self.client.get(reverse('login'))
+        texto = self.client.get(reverse('metricas')).content.decode()
+        self.assertIn('comuna_respostas_total{rota="login",status="200"} 1', texto)
+        self.assertNotIn('comuna_sql_consultas_total{', texto)
+
+    @override_settings(METRICAS_IPS=[], METRICAS_TOKEN='segredo')
+    def test_acesso_ao_endpoint(self):
+        self.assertEqual(self.client.get(reverse('metricas')).status_code, 403)
+        response = self.client.get(reverse('metricas'), HTTP_AUTHORIZATION='Bearer segredo')
+        self.assertEqual(response.status_code, 200)
@@ -12,12 +12,21 @@ urlpatterns = [
     path('verify-email/<uuid:token>/', views.verify_email, name='verify_email'),
     # tela de perfil
     path('perfil/<str:username>', views.profile, name='perfil'),
+    # seguir / deixar de seguir vários usuários de uma vez
+    path('seguir/lote/', views.seguir_em_lote, name='seguir_em_lote'),
+    # seguidores / seguindo do usuario
+    path('perfil/<str:username>/seguidores/', views.lista_seguidores, name='lista_seguidores'),
+    path('perfil/<str:username>/seguindo/', views.lista_seguindo, name='lista_seguindo'),
     # tela de editar perfil
     path('perfil/<int:id>/editar/', views.edit_profile, name='edit_profile'),
     # seguir usuario
     path('seguir_usuario/<int:user_id>/', views.seguir_usuario, name='seguir_usuario'),
     # deixa de seguir
     path('deixar_de_seguir_usuario/<int:user_id>/', views.deixar_de_seguir, name='deixar_de_seguir_usuario'),
+    # sugestões de usuários (typeahead / @menções)
+    path('usuarios/sugestoes/', views.sugestoes_usuarios, name='sugestoes_usuarios'),
+    # estatísticas do cache de usuários (staff)
+    path('cache/usuarios/', views.estatisticas_cache_usuarios, name='estatisticas_cache_usuarios'),
     # recuperação de senha
     path('password-reset/', views.password_reset, name='password_reset'),
     # confirmação de recuperação de senha
@@ -1,15 +1,29 @@
 from django.conf import settings
-from django.core.mail import send_mail
 from django.shortcuts import get_object_or_404, redirect, render
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404, JsonResponse
 from django.utils.html import strip_tags
 from .models import CustomUser, EmailVerificationToken, PasswordResetToken, Follow
 from django.contrib.auth import authenticate, login as auth_login, logout
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
 from django.template.loader import render_to_string
 from django.contrib import messages
-from .services import RegisterUser, get_follow_counts
+from .services import (
+    RegisterUser, get_follow_counts, seguir, parar_de_seguir, sugestoes_para,
+    listar_seguidores, listar_seguindo, relacoes_com, seguir_varios, parar_de_seguir_varios,
+    SEGUINDO, REMOVIDO,
+)
 from .forms import SolicitacaoRedefinicaoSenhaForm, RedefinicaoSenhaForm
+from .cache import buscar_usuario_por_id, buscar_usuario_por_username, invalidar_usuario, estatisticas
+from .tasks import enfileirar_emails, montar_email, processar_avatar
+from comuna.imagens import sem_metadados
+from comuna.uploads import erros_upload
+from comuna.consultas import orcamento_consultas
+from .busca import sugerir_usuarios
+from posts.tasks import preencher_timeline, limpar_timeline, preencher_timeline_varios, limpar_timeline_varios
+from django.views.decorators.http import require_POST
+import json
 from django.utils import timezone
 from datetime import timedelta
 
@@ -87,42 +101,85 @@ def cadastro(request):
 # ------------------------------------------- SISTEMA DE SEGUIDOR ----------------------------------------
 @login_required(login_url='login')
 def seguir_usuario(request, user_id):
-    usuario_para_seguir = get_object_or_404(CustomUser, id=user_id)
+    usuario_para_seguir = buscar_usuario_por_id(user_id)
+    if usuario_para_seguir is None:
+        raise Http404('Usuário não encontrado.')
     
     usuario_logado = request.user
     
     if usuario_logado == usuario_para_seguir:
         return redirect('perfil', username=usuario_para_seguir.username)
     
-    rel, created = Follow.objects.get_or_create(
-        seguidor=usuario_logado,
-        seguindo=usuario_para_seguir
-    )
+    # cria o relacionamento e atualiza os contadores
+    created = seguir(usuario_logado, usuario_para_seguir)
+    
+    # traz os posts recentes da conta seguida para a timeline
+    if created:
+        transaction.on_commit(lambda: preencher_timeline.delay(usuario_logado.id, usuario_para_seguir.id))
     
     return redirect('perfil', username=usuario_para_seguir.username)
 
 @login_required(login_url='login')
 def deixar_de_seguir(request, user_id):
-    usuario_para_deixar_de_seguir = get_object_or_404(CustomUser, id=user_id)
+    usuario_para_deixar_de_seguir = buscar_usuario_por_id(user_id)
+    if usuario_para_deixar_de_seguir is None:
+        raise Http404('Usuário não encontrado.')
     
     usuario_logado = request.user
     
     if usuario_logado == usuario_para_deixar_de_seguir:
         return redirect('perfil', username=usuario_para_deixar_de_seguir.username)
     
-    relacionamento = Follow.objects.filter(
-        seguidor=usuario_logado,
-        seguindo=usuario_para_deixar_de_seguir
-    )
-    
-    if relacionamento.exists():
-        relacionamento.delete()
+    # remove o relacionamento (se existir) e atualiza os contadores
+    if parar_de_seguir(usuario_logado, usuario_para_deixar_de_seguir):
+        # remove os posts da conta da timeline
+        transaction.on_commit(lambda: limpar_timeline.delay(usuario_logado.id, usuario_para_deixar_de_seguir.id))
     
     return redirect('perfil', username=usuario_para_deixar_de_seguir.username)
+# ------------------------------------------- SEGUIR / DEIXAR DE SEGUIR EM LOTE ----------------------------------------
+# corpo JSON: {"acao": "seguir" | "deixar_de_seguir", "ids": [1, 2, ...]}; resposta com o resultado de cada id
+@login_required(login_url='login')
+@require_POST
+def seguir_em_lote(request):
+    try:
+        dados = json.loads(request.body)
+        acao = dados.get('acao', 'seguir')
+        ids = [int(pk) for pk in dados['ids']] if isinstance(dados['ids'], list) else None
+    except (ValueError, TypeError, KeyError, AttributeError):
+        ids = None
+    if ids is None or acao not in ('seguir', 'deixar_de_seguir'):
+        return JsonResponse({'erro': 'Requisição inválida.'}, status=400)
+
+    # tudo em uma transação: um INSERT (ou DELETE) em lote e os contadores
+    try:
+        if acao == 'seguir':
+            resultados = seguir_varios(request.user, ids)
+        else:
+            resultados = parar_de_seguir_varios(request.user, ids)
+    except ValueError as e:
+        return JsonResponse({'erro': str(e)}, status=400)
+
+    # timeline: uma task para o lote inteiro
+    usuario_id = request.user.id
+    if acao == 'seguir':
+        alterados = [pk for pk, resultado in resultados.items() if resultado == SEGUINDO]
+        if alterados:
+            transaction.on_commit(lambda: preencher_timeline_varios.delay(usuario_id, alterados))
+    else:
+        alterados = [pk for pk, resultado in resultados.items() if resultado == REMOVIDO]
+        if alterados:
+            transaction.on_commit(lambda: limpar_timeline_varios.delay(usuario_id, alterados))
+
+    return JsonResponse({'resultados': {str(pk): resultado for pk, resultado in resultados.items()}})
+
 # --------------------------------------------- PAGINA DE PERFIL ----------------------------------------
 @login_required(login_url='login')
+@orcamento_consultas(5)
 def profile(request, username):
-    profile_user = get_object_or_404(CustomUser, username=username)
+    # busca o usuario no cache antes de ir ao banco
+    profile_user = buscar_usuario_por_username(username)
+    if profile_user is None:
+        raise Http404('Usuário não encontrado.')
     user_logado = request.user
 
     # Get counts for the profile user
@@ -147,9 +204,49 @@ def profile(request, username):
         'seguindo': logged_in_user_follow_data['seguindo'],
         'seguidores': logged_in_user_follow_data['seguidores'],
         'is_following': is_following,
+        # quem seguir (do usuario logado), lido da tabela pré-calculada
+        'sugestoes': sugestoes_para(user_logado),
     }
     return render(request, 'profile.html', context)
 
+# ----------------------------------------------- SEGUIDORES / SEGUINDO ----------------------------------------
+def _lista_follow(request, username, listar, titulo):
+    dono = buscar_usuario_por_username(username)
+    if dono is None:
+        raise Http404('Usuário não encontrado.')
+
+    # uma página a partir do cursor; cursor inválido volta para a primeira
+    try:
+        usuarios, proximo_cursor = listar(dono, cursor=request.GET.get('cursor'))
+    except ValueError:
+        usuarios, proximo_cursor = listar(dono)
+
+    # "seguindo" e "segue você" da página inteira em duas consultas IN (nada por linha)
+    seguidos, seguem_voce = relacoes_com(request.user, usuarios)
+    follow_data = get_follow_counts(request.user)
+
+    context = {
+        'dono': dono,
+        'titulo': titulo,
+        'usuarios': usuarios,
+        'proximo_cursor': proximo_cursor,
+        'seguidos': seguidos,
+        'seguem_voce': seguem_voce,
+        'seguindo': follow_data['seguindo'],
+        'seguidores': follow_data['seguidores'],
+    }
+    return render(request, 'lista_follow.html', context)
+
+@login_required(login_url='login')
+@orcamento_consultas(6)
+def lista_seguidores(request, username):
+    return _lista_follow(request, username, listar_seguidores, 'Seguidores')
+
+@login_required(login_url='login')
+@orcamento_consultas(6)
+def lista_seguindo(request, username):
+    return _lista_follow(request, username, listar_seguindo, 'Seguindo')
+
 # ----------------------------------------------- PAGINA DE EDITAR PERFIL ----------------------------------------
 @login_required(login_url='login')
 def edit_profile(request, id):
@@ -158,13 +255,33 @@ def edit_profile(request, id):
     # Verifica se o usuário tem permissão para editar o perfil
     if user.id == id:
         if request.method == 'POST':
+            # avatar recusado antes de ser gravado (tipo ou tamanho fora dos limites)
+            erros = erros_upload(request)
+            if erros:
+                for erro in erros:
+                    messages.error(request, erro)
+                return redirect('edit_profile', id=user.id)
+            username_antigo = user.username
             user.username = request.POST.get('username', user.username)
             user.email = request.POST.get('email', user.email)
-            user.avatar = request.FILES.get('avatar', user.avatar)
+            # o avatar original também é servido: grava sem EXIF (localização, modelo do celular...)
+            user.avatar = sem_metadados(request.FILES['avatar']) if 'avatar' in request.FILES else user.avatar
+            # as variantes do avatar anterior deixam de valer: o template usa o original até as novas ficarem prontas
+            variantes_antigas = None
+            # só os campos do formulário: um save completo sobrescreveria os contadores de follow (atualizados com F())
+            campos = ['username', 'email', 'first_name', 'last_name', 'data_nascimento']
+            if 'avatar' in request.FILES:
+                variantes_antigas, user.avatar_variants = user.avatar_variants, {}
+                campos += ['avatar', 'avatar_variants']
             user.first_name = request.POST.get('first_name', user.first_name)
             user.last_name = request.POST.get('last_name', user.last_name)
             user.data_nascimento = request.POST.get('data_nascimento', user.data_nascimento)
-            user.save()
+            user.save(update_fields=campos)
+            # remove o usuario do cache (inclusive pelo username antigo)
+            invalidar_usuario(user, username_antigo)
+            # gera as variantes do novo avatar em segundo plano
+            if 'avatar' in request.FILES:
+                transaction.on_commit(lambda: processar_avatar.delay(user.id, variantes_antigas))
             messages.success(request, 'Perfil atualizado com sucesso!')
             return redirect('perfil', username=user.username)
         
@@ -176,6 +293,23 @@ def edit_profile(request, id):
         messages.error(request, 'Você não tem permissão para editar este perfil.')
         return redirect('perfil', username=user.username)
 
+# ----------------------------------------------- SUGESTÕES DE USUÁRIOS ----------------------------------------
+# typeahead da busca e do @ no campo de post: usuários pelo prefixo do username ou do nome
+@login_required(login_url='login')
+def sugestoes_usuarios(request):
+    try:
+        limite = int(request.GET.get('limite', 0)) or None
+    except ValueError:
+        limite = None
+    usuarios = sugerir_usuarios(request.GET.get('q', ''), limite)
+    return JsonResponse({'usuarios': usuarios})
+
+# ----------------------------------------------- ESTATISTICAS DO CACHE ----------------------------------------
+# hits/misses do cache de usuarios neste processo, para dimensionar o cache
+@staff_member_required
+def estatisticas_cache_usuarios(request):
+    return JsonResponse(estatisticas())
+
 # ----------------------------------------------- verificaçao de email  ----------------------------------------
 def verify_email(request, token):
         # Tenta obter o token de verificação do banco de dados
@@ -192,7 +326,8 @@ def verify_email(request, token):
         user = token_obj.user
         user.is_active = True # Ativa a conta do usuário
         user.e_verificado = True # Marca o email como verificado
-        user.save() # Salva as alterações no usuário
+        user.save(update_fields=['is_active', 'e_verificado']) # Salva só os campos alterados (não toca nos contadores)
+        invalidar_usuario(user)
         
         # Marca o token como usado
         token_obj.is_used = True
@@ -223,13 +358,14 @@ def password_reset(request):
                 
                 text_content = strip_tags(html_content)
                 
-                send_mail(
-                    subject="Redefinição de senha",
-                    message = text_content,
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    recipient_list=[user.email],
-                    html_message=html_content,
+                # grava na fila de saída de emails, sem esperar o SMTP na requisição
+                mensagem = montar_email(
+                    assunto="Redefinição de senha",
+                    texto=text_content,
+                    destinatarios=[user.email],
+                    html=html_content,
                 )
+                enfileirar_emails([mensagem])
                 
                 return render(request, 'password_reset.html', {'success': True})
                 
@@ -266,7 +402,8 @@ def password_reset_confirm(request, token):
             
             # Atualiza a senha do usuário
             user.set_password(nova_senha)
-            user.save()
+            user.save(update_fields=['password'])
+            invalidar_usuario(user)
             
             # Remove o token após a redefinição bem-sucedida
             token_obj.delete()